@@ -0,0 +1,40 @@
+# Time to draw and save bar graphs of 7, 24 and 60 bars, averaged over 10 renders after a warm-up. Run from the
+# repository root so the style file is found: python -m benchmarks.bar_graphs
+# Revisions before the graph cache drew in plot_bar_with_ci, which is timed there instead.
+import sys
+import tempfile
+import time
+import matplotlib
+import numpy as np
+
+matplotlib.use('agg')
+try:
+    from rtpa.graphing.utils import draw_bar_with_ci
+except ImportError:
+    from rtpa.graphing.utils import plot_bar_with_ci
+
+    def draw_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, path):
+        plot_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, path[:-len('.png')])
+
+REPEATS = 10
+
+
+def main():
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for n in [7, 24, 60]:
+            x = [f"tag {i}" for i in range(n)]
+            means = rng.normal(size=n)
+            cis = np.stack([means - 1, means + 1])
+            significant = rng.random(n) < 0.4
+            # The graph cache would skip drawing repeated inputs, so the drawing itself is timed
+            draw_bar_with_ci(x, means, cis, significant, 'Warm-up', 'X', 'Y', f"{directory}/warm_up_{n}.png")
+            start = time.perf_counter()
+            for r in range(REPEATS):
+                draw_bar_with_ci(x, means, cis, significant, f'Title {n}', 'X', 'Y', f"{directory}/bar_{n}_{r}.png")
+            print(f"{n} bars: {(time.perf_counter() - start) / REPEATS * 1000:.0f} ms/graph")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
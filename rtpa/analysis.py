@@ -10,6 +10,7 @@ from rtpa.graphing.generation import (
 )
 from rtpa.loader import load_df
 from rtpa.stats import perform_analysis_with_groups
+from rtpa.tags import tag_index, combine_filters
 
 
 def debug_print(message, debug_mode):
@@ -21,7 +22,7 @@ def average_scores(group):
     return group.mean()
 
 
-def perform_analysis(df, group_by, metric, value, confidence_level, debug_mode, duration_hours=1):
+def perform_analysis(df, group_by, metric, value, confidence_level, debug_mode, duration_hours=1, engine='welch'):
     df_grouped = df.copy()
 
     if group_by == 'Timestamp':
@@ -43,14 +44,19 @@ def perform_analysis(df, group_by, metric, value, confidence_level, debug_mode,
         size = len(df)
         df_grouped = df.groupby('Title').agg({group_by: 'first', metric: average_scores}).reset_index()
         print(f"Filtered out {size - len(df_grouped)} duplicate posts. ({size} -> {len(df_grouped)})")
-        group_with_value = df_grouped[df_grouped[group_by].str.contains(value, na=False)]
-        group_without_value = df_grouped[~df_grouped[group_by].str.contains(value, na=False)]
+        if group_by == 'Tags':
+            has_value = tag_index(df_grouped).query(combine_filters([value]))
+        else:
+            has_value = df_grouped[group_by].str.contains(value, na=False).to_numpy()
+        group_with_value = df_grouped[has_value]
+        group_without_value = df_grouped[~has_value]
         debug_print(f"Group with '{value}':\n{group_with_value.head()}", debug_mode)
 
     mean_diff, ci_low, ci_high, p_value, t_stat = perform_analysis_with_groups(
-        group_with_value, group_without_value, metric, confidence_level
+        group_with_value, group_without_value, metric, confidence_level, engine
     )
 
+    test = "bootstrap CI, permutation p-value" if engine == 'resampling' else "Welch's t-test"
     output = f"Analysis based on {metric.lower()} by {group_by.lower()}:\n\n"
     if group_by == "Tags":
         output += (
@@ -66,7 +72,8 @@ def perform_analysis(df, group_by, metric, value, confidence_level, debug_mode,
     output += (
         f"There is a {'significant' if p_value < 1.0 - confidence_level else 'not significant'} difference in {metric.lower()}.\n"
         f"Mean difference: {mean_diff:.2f} (CI: {ci_low:.2f} to {ci_high:.2f}).\n"
-        f"T-statistic: {t_stat:.2f}, P-value: {p_value:.4f}\n")
+        f"T-statistic: {t_stat:.2f}, P-value: {p_value:.4f}\n"
+        f"Test: {test}\n")
     return output
 
 
@@ -85,7 +92,7 @@ def analyze():
     if filename[0].lower() == 'u':
         subreddit_input = input("Enter the subreddit to filter (or leave blank for all): ").lower().strip()
 
-    filter_tag = input("Enter a tag to filter by (or leave blank): ").lower().strip()
+    filter_tag = input("Enter a tag filter, e.g. 'f4m and not rough' (or leave blank): ").lower().strip()
     filter_tags = filter_tag.split(',') if filter_tag else []
 
     if ',' in filename:
@@ -131,5 +138,7 @@ def analyze():
             value = input("Enter the hour (0-23): ").strip()
         else:
             value = input(f"Enter the {analysis_type} to analyze: ").strip()
-        print(perform_analysis(df, analysis_type.capitalize(), 'Upvotes', value, 0.95, debug_mode))
+        resampling = input("Use bootstrap/permutation tests instead of Welch's t-test? (yes/no): ").strip().lower() == 'yes'
+        print(perform_analysis(df, analysis_type.capitalize(), 'Upvotes', value, 0.95, debug_mode,
+                               engine='resampling' if resampling else 'welch'))
     return
@@ -0,0 +1,180 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from rtpa.memo import frame_memo
+from rtpa.stats import one_vs_rest
+from rtpa.tags import tag_index
+
+# Tags and hours need this many of an author's posts before they can be an author's best or worst
+MIN_CELL_POSTS = 3
+# Share of the similarity given to the posting schedule (hour of the week) rather than the tags
+SCHEDULE_WEIGHT = 0.5
+
+
+def group_means(keys, values):
+    # Distinct keys with the post count and mean value of each, skipping missing values
+    valid = ~np.isnan(values)
+    unique, inverse = np.unique(keys[valid], return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, counts, np.bincount(inverse, weights=values[valid], minlength=len(unique)) / np.maximum(counts, 1)
+
+
+def extremes_per_author(authors, scores, n_authors):
+    # Positions of the highest and lowest score of each author, -1 for authors without any
+    order = np.lexsort((scores, authors))
+    authors = authors[order]
+    starts = np.searchsorted(authors, np.arange(n_authors), side='left')
+    ends = np.searchsorted(authors, np.arange(n_authors), side='right')
+    has = ends > starts
+    best, worst = np.full(n_authors, -1), np.full(n_authors, -1)
+    best[has], worst[has] = order[ends[has] - 1], order[starts[has]]
+    return best, worst
+
+
+def relative_cells(author_codes, cell_codes, n_cells, values, n_authors):
+    # Each author's mean in each cell minus everyone's mean in that cell, for cells with MIN_CELL_POSTS of the
+    # author's posts; returns the best and worst cell of every author (-1 for none) with their relative means
+    seen, _, population = group_means(cell_codes, values)
+    keys, counts, means = group_means(author_codes * n_cells + cell_codes, values)
+    enough = counts >= MIN_CELL_POSTS
+    authors, cells = np.divmod(keys[enough], n_cells)
+    relative = np.append(means[enough] - population[np.searchsorted(seen, cells)], np.nan)
+    cells = np.append(cells, -1)
+    # Authors without any cell point at the appended -1 cell
+    best, worst = extremes_per_author(authors, relative[:-1], n_authors)
+    return cells[best], relative[best], cells[worst], relative[worst]
+
+
+def author_leaderboard(df, metric='Upvotes', confidence_level=0.95, min_posts=None):
+    # Every author with at least min_posts posts against everyone else, with their median, best and worst tags and
+    # best hour (UTC) relative to the population, all from grouped aggregates of one pass over the posts
+    if min_posts is None:
+        min_posts = (len(df)//1000)+5
+    values = df[metric].to_numpy(dtype=float)
+    author_codes, authors = pd.factorize(df['Author'])
+    author_codes = np.asarray(author_codes)
+    counts = np.bincount(author_codes[author_codes >= 0], minlength=len(authors))
+    mean_diff, ci_low, ci_high, p_value, _, _, _ = one_vs_rest(values, author_codes, len(authors), confidence_level)
+
+    # Medians from one sort by (author, value); missing values sort last and are left out
+    valid = (author_codes >= 0) & ~np.isnan(values)
+    order = np.lexsort((values[valid], author_codes[valid]))
+    sorted_values = values[valid][order]
+    n_valid = np.bincount(author_codes[valid], minlength=len(authors))
+    starts = np.concatenate([[0], np.cumsum(n_valid)[:-1]])
+    low = starts + np.maximum(n_valid - 1, 0) // 2
+    high = starts + n_valid // 2
+    with np.errstate(invalid='ignore'):
+        medians = np.where(n_valid > 0, (sorted_values[np.minimum(low, len(sorted_values) - 1)] +
+                                         sorted_values[np.minimum(high, len(sorted_values) - 1)]) / 2, np.nan)
+    sums = np.bincount(author_codes[valid], weights=values[valid], minlength=len(authors))
+
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    tagged = author_codes[positions] >= 0
+    best_tag, best_tag_diff, worst_tag, worst_tag_diff = relative_cells(
+        author_codes[positions][tagged], tag_codes[tagged], len(index.names), values[positions][tagged], len(authors))
+    hours = df['Hour_UTC'].to_numpy(dtype=int)
+    has_author = author_codes >= 0
+    best_hour, best_hour_diff, _, _ = relative_cells(author_codes[has_author], hours[has_author], 24,
+                                                     values[has_author], len(authors))
+
+    tag_name = lambda codes: np.where(codes >= 0, np.asarray(index.names, dtype=object)[np.maximum(codes, 0)], None)
+    board = pd.DataFrame({
+        'Author': np.asarray(authors, dtype=object), 'Posts': counts,
+        f'Mean {metric}': sums / np.maximum(n_valid, 1), f'Median {metric}': medians,
+        'Mean Difference': mean_diff, 'CI Low': ci_low, 'CI High': ci_high, 'P-value': p_value,
+        'Significant': p_value < 1.0 - confidence_level,
+        'Best Tag': tag_name(best_tag), 'Best Tag Difference': best_tag_diff,
+        'Worst Tag': tag_name(worst_tag), 'Worst Tag Difference': worst_tag_diff,
+        'Best Hour UTC': pd.array(np.where(best_hour >= 0, best_hour, pd.NA), dtype='Int64'),
+        'Best Hour Difference': best_hour_diff,
+    })
+    board = board[(counts >= min_posts) & (n_valid > 0)]
+    return board.sort_values('Mean Difference', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def export_author_leaderboard(board, filename):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    board.to_csv(filename, index=False)
+    return filename
+
+
+def normalized_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return sparse.diags(np.where(norms > 0, 1 / np.maximum(norms, 1e-300), 0)) @ matrix
+
+
+class CreatorIndex:
+    # One L2-normalized row per author: TF-IDF weighted tag counts next to a local hour-of-week histogram, so the
+    # dot product of two rows is their cosine similarity
+    def __init__(self, df):
+        author_codes, authors = pd.factorize(df['Author'])
+        author_codes = np.asarray(author_codes)
+        self.authors = pd.Index(np.asarray(authors, dtype=object))
+        self.lookup = pd.Index(self.authors.str.lower())
+        self.posts = np.bincount(author_codes[author_codes >= 0], minlength=len(authors))
+
+        index = tag_index(df)
+        positions, tag_codes = index.postings()
+        tagged = author_codes[positions] >= 0
+        tags = sparse.csr_matrix((np.ones(tagged.sum()), (author_codes[positions][tagged], tag_codes[tagged])),
+                                 shape=(len(authors), len(index.names)))
+        tags.sum_duplicates()
+        tags.data = 1 + np.log(tags.data)
+        authors_using = np.bincount(tags.indices, minlength=len(index.names))
+        tags = tags @ sparse.diags(np.log((1 + len(authors)) / (1 + authors_using)) + 1)
+
+        has_author = author_codes >= 0
+        hours = df['Day_Local'].to_numpy(dtype=int) * 24 + df['Hour_Local'].to_numpy(dtype=int)
+        schedule = sparse.csr_matrix((np.ones(has_author.sum()), (author_codes[has_author], hours[has_author])),
+                                     shape=(len(authors), 168))
+        self.vectors = normalized_rows(sparse.hstack([
+            normalized_rows(tags) * np.sqrt(1 - SCHEDULE_WEIGHT),
+            normalized_rows(schedule) * np.sqrt(SCHEDULE_WEIGHT)], format='csr')).tocsr()
+        self.vectors_t = self.vectors.T.tocsr()
+
+    def similar(self, author, k=10):
+        # The k authors with the highest cosine similarity to author, most similar first
+        i = self.lookup.get_indexer([author.strip().lower()])[0]
+        if i < 0:
+            return None
+        scores = (self.vectors[i] @ self.vectors_t).toarray().ravel()
+        scores[i] = -np.inf
+        k = min(k, len(scores) - 1)
+        top = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.empty(0, dtype=int)
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return pd.DataFrame({'Author': self.authors[top], 'Similarity': scores[top], 'Posts': self.posts[top]})
+
+
+def creator_index(df):
+    memo = frame_memo(df)
+    if 'creators' not in memo:
+        memo['creators'] = CreatorIndex(df)
+    return memo['creators']
+
+
+def similar_authors(df, author, k=10):
+    return creator_index(df).similar(author, k)
+
+
+def peer_frame(df, author, k=10):
+    # The posts of author and of their k most similar creators, with whether each of them is the author's
+    peers = similar_authors(df, author, k)
+    if peers is None:
+        return None, None
+    is_author = (df['Author'].astype(object).str.lower() == author.strip().lower()).to_numpy()
+    keep = is_author | df['Author'].isin(list(peers['Author'])).to_numpy()
+    return df[keep], is_author[keep]
+
+
+def author_vs_peers(values, is_author, cells, confidence_level, engine='welch'):
+    # The author's posts against the peers' posts within each cell (a mask over the posts), stacked like a breakdown
+    rows = []
+    for cell in cells:
+        result = one_vs_rest(values[cell], (~is_author[cell]).astype(int), 2, confidence_level, engine=engine)
+        rows.append([np.asarray(stat)[0] for stat in result])
+    return [np.array(stat) for stat in zip(*rows)]
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+CELL_DIMENSIONS = ['hour', 'day', 'subreddit', 'duration', 'tag_count']
+
+
+def duration_minutes(durations):
+    # "mm:ss" (or ":ss") durations to whole minutes
+    durations = durations.astype(str)
+    durations = durations.where(~durations.str.startswith(':'), '0' + durations)
+    parts = durations.str.split(':')
+    minutes = pd.to_numeric(parts.str[0].replace('', '0'), errors='coerce')
+    seconds = pd.to_numeric(parts.str[1].where(parts.str.len() == 2).replace('', '0'), errors='coerce').fillna(0)
+    return minutes + seconds // 60
+
+
+def duration_codes(durations):
+    # 0 is no "mm:ss" duration (missing or a script length), 1 is unreadable, 2 + m is m minutes
+    has_duration = (durations.notna() & (durations != '') & ~durations.astype(str).str.contains('-')).to_numpy()
+    minutes = duration_minutes(durations[has_duration]).to_numpy(dtype=float)
+    codes = np.zeros(len(durations), dtype=int)
+    codes[has_duration] = np.where(np.isnan(minutes), 1, np.nan_to_num(minutes) + 2)
+    return codes
+
+
+def tag_counts(tags):
+    return (tags.str.count(r'\|') + 1).fillna(0).to_numpy(dtype=int)
+
+
+def cell_columns(df):
+    # The hour UTC x local day x subreddit x duration x tag count cell of every post
+    if 'Hour_UTC' in df.columns and 'Day_Local' in df.columns:
+        hours, days = df['Hour_UTC'].to_numpy(dtype=int), df['Day_Local'].to_numpy(dtype=int)
+    else:
+        timestamps = pd.to_datetime(df['Timestamp'], utc=True)
+        hours = timestamps.dt.hour.to_numpy(dtype=int)
+        days = timestamps.dt.tz_convert(tz.tzlocal()).dt.dayofweek.to_numpy(dtype=int)
+    durations = df['Duration'] if 'Duration' in df.columns else pd.Series(np.nan, index=df.index)
+    return pd.DataFrame({
+        'hour': hours, 'day': days, 'subreddit': df['Subreddit'].to_numpy(dtype=object),
+        'duration': duration_codes(durations), 'tag_count': tag_counts(df['Tags']),
+    })
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from rtpa.memo import frame_memo
+from rtpa.stats import sufficient_stats, value_shift, welch_one_vs_rest
+from rtpa.tags import tag_index
+
+
+def tag_pairs(df, min_posts):
+    # Every pair of tags (and every tag with itself) shared by at least min_posts posts, among the tags used by at
+    # least min_posts posts. Returns the kept tag names, the two tag codes of each pair, and the post position and
+    # pair code of every post having both tags of a pair.
+    key = ('tag pairs', min_posts)
+    memo = frame_memo(df)
+    if key not in memo:
+        index = tag_index(df)
+        positions, tag_codes = index.postings()
+        kept = np.flatnonzero(np.bincount(tag_codes, minlength=len(index.names)) >= min_posts)
+        columns = np.full(len(index.names), -1)
+        columns[kept] = np.arange(len(kept))
+        used = columns[tag_codes] >= 0
+        positions, columns = positions[used], columns[tag_codes[used]]
+        order = np.lexsort((columns, positions))
+        positions, columns = positions[order], columns[order]
+        # Each tag of a post is paired with itself and with every later tag of the same post
+        starts = np.flatnonzero(np.diff(positions, prepend=-1))
+        sizes = np.diff(np.append(starts, len(positions)))
+        later = np.repeat(starts + sizes, sizes) - np.arange(len(positions))
+        left = np.repeat(np.arange(len(positions)), later)
+        right = left + np.arange(len(left)) - np.repeat(np.cumsum(later) - later, later)
+        pair_codes, keys = pd.factorize(columns[left].astype(np.int64) * len(kept) + columns[right])
+        frequent = np.flatnonzero(np.bincount(pair_codes, minlength=len(keys)) >= min_posts)
+        frequent = frequent[np.argsort(keys[frequent])]
+        codes = np.full(len(keys), -1)
+        codes[frequent] = np.arange(len(frequent))
+        pair_codes = codes[pair_codes]
+        entries = pair_codes >= 0
+        memo[key] = (index.names[kept], keys[frequent] // len(kept), keys[frequent] % len(kept),
+                     positions[left[entries]], pair_codes[entries])
+    return memo[key]
+
+
+def tag_pair_breakdown(df, metrics, confidence_level, min_posts):
+    # Posts with both tags of a pair against every other post, for every pair of tags (and every tag on its own,
+    # as the pair of a tag with itself) shared by at least min_posts posts. Returns the tag names, the two tag codes
+    # of each pair and the welch results as (pair, metric) arrays.
+    key = ('tag pair breakdown', tuple(metrics), confidence_level, min_posts)
+    memo = frame_memo(df)
+    if key not in memo:
+        names, first, second, positions, pair_codes = tag_pairs(df, min_posts)
+        values = df[list(metrics)].to_numpy(dtype=float)
+        shift = value_shift(values)
+        total = sufficient_stats(values, np.zeros(len(values), dtype=int), 1, shift)[:, 0]
+        cells = sufficient_stats(values[positions], pair_codes, len(first), shift)
+        memo[key] = names, first, second, welch_one_vs_rest(cells, total, confidence_level)
+    return memo[key]
@@ -0,0 +1,78 @@
+import json
+import time
+from collections import OrderedDict
+from rtpa.loader import (
+    read_dataset, filter_df, load_df, reads_partitions, reads_store, csv_filenames, file_signature, memory_mb
+)
+from rtpa.memo import share_frame_memo
+
+
+class FrameCache:
+    def __init__(self, budget_mb=1024):
+        self.budget_mb = budget_mb
+        self.entries = OrderedDict()
+
+    def size_mb(self):
+        return sum(size for _, size in self.entries.values())
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, df):
+        size = memory_mb(df)
+        if size > self.budget_mb:
+            print(f"Not caching a {size:.1f} MB frame, it exceeds the {self.budget_mb} MB budget.")
+            return
+        self.entries.pop(key, None)
+        while self.entries and self.size_mb() + size > self.budget_mb:
+            self.entries.popitem(last=False)
+        self.entries[key] = (df, size)
+
+    def clear(self):
+        self.entries.clear()
+
+    def load(self, filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits=False, adjust_inflation=False,
+             columns=None, compact=False, inflation_window=1, subreddit_window=None, stream=False,
+             near_duplicates=None):
+        filenames = csv_filenames(filenames)
+        sources = tuple((filename, json.dumps(file_signature(filename), sort_keys=True)) for filename in filenames)
+        base_key = (sources, normalize_subreddits, adjust_inflation, compact, inflation_window, subreddit_window, stream,
+                    near_duplicates)
+        filter_key = ((subreddit or "").lower(), tuple(tag.strip().lower() for tag in filter_tags), time_cutoff)
+        start = time.perf_counter()
+
+        df = self.get(('filtered', base_key, tuple(columns) if columns else None, filter_key))
+        if df is not None:
+            print(f"Cache hit: reused filtered posts ({len(df)} posts, {time.perf_counter() - start:.3f}s).")
+            return share_frame_memo(df, df.copy(deep=False))
+
+        # Streamed and partitioned loads filter while reading, so there is no unfiltered dataset to keep
+        if (stream or reads_store(filenames, normalize_subreddits, adjust_inflation)
+                or reads_partitions(filenames, normalize_subreddits, adjust_inflation)):
+            df = load_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits, adjust_inflation,
+                         columns, compact, inflation_window, subreddit_window, stream, near_duplicates)
+            self.put(('filtered', base_key, tuple(columns) if columns else None, filter_key), df)
+            print(f"Cache miss: read filtered posts in {time.perf_counter() - start:.3f}s.")
+            return share_frame_memo(df, df.copy(deep=False))
+
+        # A frame holding every column can serve any request for a subset of columns
+        base = None
+        for base_columns in [tuple(columns) if columns else None, None]:
+            base = self.get(('base', base_key, base_columns))
+            if base is not None:
+                print(f"Cache hit: re-slicing cached dataset ({len(base)} posts).")
+                break
+        if base is None:
+            base = read_dataset(filenames, normalize_subreddits, adjust_inflation, columns, compact,
+                                inflation_window, subreddit_window, near_duplicates)
+            self.put(('base', base_key, tuple(columns) if columns else None), base)
+            print(f"Cache miss: loaded dataset in {time.perf_counter() - start:.3f}s.")
+
+        df = filter_df(base, subreddit, filter_tags, time_cutoff)
+        self.put(('filtered', base_key, tuple(columns) if columns else None, filter_key), df)
+        print(f"Filtered posts in {time.perf_counter() - start:.3f}s. "
+              f"({len(self.entries)} frame(s), {self.size_mb():.1f} MB cached)")
+        return share_frame_memo(df, df.copy(deep=False))
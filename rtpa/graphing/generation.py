@@ -1,10 +1,23 @@
-import re
 import numpy as np
 import pandas as pd
 from dateutil import tz
 from datetime import datetime
-from rtpa.stats import perform_analysis_with_groups
-from rtpa.graphing.utils import plot_bar_with_ci
+from rtpa.stats import one_vs_rest, stats_cube
+from rtpa.regression import fit_effects
+from rtpa.cooccurrence import tag_pair_breakdown
+from rtpa.trends import tag_trends
+from rtpa.authors import author_vs_peers
+from rtpa.tags import tag_index
+from rtpa.graphing.utils import plot_bar_with_ci, plot_heatmap, plot_lines_with_ci
+
+METRIC_NAMES = {'Upvotes': 'Upvote', 'Comments': 'Comment', 'Fills': 'Fill'}
+METRIC_PREFIXES = {'Upvotes': 'upv', 'Comments': 'comments', 'Fills': 'fills'}
+STATISTIC_NAMES = {'median': 'Median', 'p90': '90th Percentile'}
+# Engines that test the mean difference without Welch's approximation, named in titles, axis labels and file names
+TEST_NAMES = {'resampling': 'bootstrap CI, permutation p'}
+ENGINE_FILE_NAMES = {'median': 'median', 'p90': 'p90', 'resampling': 'resampled'}
+IGNORED_TAGS = ["script offer", "script fill"]
+DAY_NAMES = ['Sunday','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday']
 
 def format_hour(hour):
     if hour == 0:
@@ -16,152 +29,232 @@ def format_hour(hour):
     else:
         return f'{hour - 12} PM'
 
-def generate_hourly_bar_graph(df, confidence_level, subreddit, directory):
+def metric_list(metric):
+    return [metric] if isinstance(metric, str) else list(metric)
+
+def by_metric(metric, results):
+    # One result list per metric: a single metric name gets its list back, a list of metrics a dict by metric
+    return results[0] if isinstance(metric, str) else dict(zip(metric, results))
+
+def test_name(engine):
+    return f" ({TEST_NAMES[engine]})" if engine in TEST_NAMES else ""
+
+def statistic_title(metric, engine):
+    return f"{STATISTIC_NAMES.get(engine, 'Average')} {METRIC_NAMES.get(metric, metric)} Difference{test_name(engine)}"
+
+def difference_label(engine):
+    return f"{STATISTIC_NAMES.get(engine, 'Mean')} Difference{test_name(engine)}"
+
+def graph_file(directory, metric, name, engine='welch'):
+    statistic = f"_{ENGINE_FILE_NAMES[engine]}" if engine in ENGINE_FILE_NAMES else ""
+    return f"graphs{directory}/{METRIC_PREFIXES.get(metric, metric.lower())}{statistic}_diff_{name}"
+
+def generated(outputs):
+    return "\nand ".join(outputs)
+
+def plot_charts(charts):
+    # Charts map each metric to the arguments of plot_bar_with_ci, or to the message of a graph that failed
+    return generated([plot_bar_with_ci(*chart) if isinstance(chart, tuple) else chart for chart in charts.values()])
+
+def generate_preview_graph(df, fraction, charts, *args):
+    # The graphs of charts(df, *args) drawn from a sample, titled as preview estimates
+    return plot_charts({metric: (*chart[:4], f"{chart[4]}\nPreview estimate from a {fraction:.0%} sample", *chart[5:])
+                        if isinstance(chart, tuple) else chart for metric, chart in charts(df, *args).items()})
+
+def generate_hourly_bar_graph(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
+    return plot_charts(hourly_charts(df, confidence_level, subreddit, directory, engine, metrics))
+
+def hourly_charts(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
     directory = directory + "/time"
-    return generate_hour_graph(df, confidence_level, 1,
-        f"graphs{directory}/upv_diff_by_hour{'_in_' + subreddit if subreddit else ''}", subreddit)
+    return hour_charts(df, confidence_level, 1, directory,
+        f"by_hour{'_in_' + subreddit if subreddit else ''}", subreddit, engine=engine, metrics=metrics)
+
+def generate_hour_block_bar_graph(df, confidence_level, subreddit, hour_block, directory, engine='welch',
+                                  metrics=('Upvotes',)):
+    return plot_charts(hour_block_charts(df, confidence_level, subreddit, hour_block, directory, engine, metrics))
 
-def generate_hour_block_bar_graph(df, confidence_level, subreddit, hour_block, directory):
+def hour_block_charts(df, confidence_level, subreddit, hour_block, directory, engine='welch', metrics=('Upvotes',)):
     directory = directory + "/time"
-    return generate_hour_graph(df, confidence_level, hour_block,
-        f"graphs{directory}/upv_diff_by_{hour_block}_hour_block{'_in_' + subreddit if subreddit else ''}", subreddit)
+    return hour_charts(df, confidence_level, hour_block, directory,
+        f"by_{hour_block}_hour_block{'_in_' + subreddit if subreddit else ''}", subreddit, engine=engine,
+        metrics=metrics)
+
+def generate_hour_graph(df, confidence_level, hours_chunk, directory, name, subreddit, day=None, engine='welch',
+                        metrics=('Upvotes',)):
+    return plot_charts(hour_charts(df, confidence_level, hours_chunk, directory, name, subreddit, day, engine, metrics))
 
-def generate_hour_graph(df, confidence_level, hours_chunk, file_name, subreddit):
-    hourly_results = get_hourly_analysis_results(df, 'Upvotes', confidence_level, hours_chunk)
+def hour_charts(df, confidence_level, hours_chunk, directory, name, subreddit, day=None, engine='welch',
+                metrics=('Upvotes',)):
+    results_by_metric = get_hourly_analysis_results(df, list(metrics), confidence_level, hours_chunk, day, engine)
     utc_zone = tz.tzutc()
     local_zone = tz.tzlocal()
     local_hours = [datetime(2000,1,1,hour,0,0, tzinfo=utc_zone).astimezone(local_zone).hour for hour in range(0,24, hours_chunk)]
     local_hours_12h = [format_hour(hour) for hour in local_hours]
-    hourly_means = [0 if np.isnan(r[0]) else r[0] for r in hourly_results]
-    hourly_cis = [np.array([0,0]) if np.isnan(r[1]).any() else r[1] for r in hourly_results]
-    hourly_significant = [r[2] for r in hourly_results]
     sorted_indices = np.argsort(local_hours)
     local_hours_sorted = np.array(local_hours_12h)[sorted_indices]
-    means_sorted = np.array(hourly_means)[sorted_indices]
-    cis_sorted = np.array(hourly_cis).T[:, sorted_indices]
-    sig_sorted = np.array(hourly_significant)[sorted_indices]
-    return plot_bar_with_ci(local_hours_sorted, means_sorted, cis_sorted, sig_sorted,
-        f'Average Upvote Difference by {"Hour" if hours_chunk==1 else str(hours_chunk)+" Hour Block"} {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Hour', 'Mean Difference', file_name)
-
-def get_hourly_analysis_results(df, metric, confidence_level, hours_chunk=1):
+    charts = {}
+    for metric, hourly_results in results_by_metric.items():
+        hourly_means = [0 if np.isnan(r[0]) else r[0] for r in hourly_results]
+        hourly_cis = [np.array([0,0]) if np.isnan(r[1]).any() else r[1] for r in hourly_results]
+        hourly_significant = [r[2] for r in hourly_results]
+        means_sorted = np.array(hourly_means)[sorted_indices]
+        cis_sorted = np.array(hourly_cis).T[:, sorted_indices]
+        sig_sorted = np.array(hourly_significant)[sorted_indices]
+        charts[metric] = (local_hours_sorted, means_sorted, cis_sorted, sig_sorted,
+            f'{statistic_title(metric, engine)} by {"Hour" if hours_chunk==1 else str(hours_chunk)+" Hour Block"} {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Hour', difference_label(engine), graph_file(directory, metric, name, engine))
+    return charts
+
+def one_vs_rest_results(breakdown, confidence_level, min_amt):
+    # One result list per metric column of the breakdown
+    arrays = [np.asarray(a) for a in breakdown]
+    n_metrics = arrays[0].shape[1] if arrays[0].ndim == 2 else 1
+    mean_diff, ci_low, ci_high, p_value, _, n_with, n_without = (a.reshape(len(a), n_metrics) for a in arrays)
     results = []
-    for hour in range(0,24, hours_chunk):
-        start = hour
-        end = (hour+hours_chunk)%24
+    for j in range(n_metrics):
+        metric_results = []
+        for i in range(len(mean_diff)):
+            if n_with[i, j] > min_amt and n_without[i, j] > min_amt:
+                metric_results.append((mean_diff[i, j], (ci_low[i, j], ci_high[i, j]),
+                                       p_value[i, j] < 1.0 - confidence_level))
+            else:
+                metric_results.append((np.nan, (np.nan, np.nan), False))
+        results.append(metric_results)
+    return results
+
+def get_hourly_analysis_results(df, metric, confidence_level, hours_chunk=1, day=None, engine='welch'):
+    # Blocks are unions of single hours (the last one wraps past midnight), so hour totals are enough
+    hours = np.arange(24)
+    membership = []
+    for start in range(0,24, hours_chunk):
+        end = (start+hours_chunk)%24
         if start < end:
-            group_with = df[(df['Hour_UTC']>=start) & (df['Hour_UTC']<end)]
-            group_without = df[~((df['Hour_UTC']>=start) & (df['Hour_UTC']<end))]
-        else:
-            group_with = df[(df['Hour_UTC']>=start) | (df['Hour_UTC']<end)]
-            group_without = df[~((df['Hour_UTC']>=start) | (df['Hour_UTC']<end))]
-        min_amt = (len(df)//1000)+5
-        if len(group_with) > min_amt and len(group_without) > min_amt:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-            results.append((mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
+            membership.append((hours>=start) & (hours<end))
         else:
-            results.append((np.nan, (np.nan, np.nan), False))
-    return results
+            membership.append((hours>=start) | (hours<end))
+    cube = stats_cube(df, metric_list(metric), engine)
+    where = None if day is None else (lambda dims: dims['day']==day)
+    min_amt = (cube.rows(where)//1000)+5
+    return by_metric(metric, one_vs_rest_results(
+        cube.breakdown('hour', 24, confidence_level, where, np.array(membership), engine), confidence_level, min_amt))
+
+def generate_day_bar_graph(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
+    return plot_charts(day_charts(df, confidence_level, subreddit, directory, engine, metrics))
 
-def generate_day_bar_graph(df, confidence_level, subreddit, directory):
+def day_charts(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
     directory = directory + "/time"
-    daily_results = get_daily_analysis_results(df, 'Upvotes', confidence_level)
-    days = ['Sunday','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday']
-    daily_means = [0 if np.isnan(r[0]) else r[0] for r in daily_results]
-    daily_cis = [np.array([0,0]) if np.isnan(r[1]).any() else r[1] for r in daily_results]
-    daily_sig = [r[2] for r in daily_results]
-    sorted_indices = np.argsort([r[3] for r in daily_results])
-    days_sorted = np.array(days)[sorted_indices]
-    means_sorted = np.array(daily_means)[sorted_indices]
-    cis_sorted = np.array(daily_cis).T[:, sorted_indices]
-    sig_sorted = np.array(daily_sig)[sorted_indices]
-    return plot_bar_with_ci(days_sorted, means_sorted, cis_sorted, sig_sorted,
-        f'Average Upvote Difference by Day of the Week {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Day of the Week', 'Mean Difference', f"graphs{directory}/upv_diff_by_day_of_week{'_in_'+subreddit if subreddit else ''}")
-
-def get_daily_analysis_results(df, metric, confidence_level):
-    results = []
-    for day in range(7):
-        group_with = df[df['Day_Local']==day]
-        group_without = df[df['Day_Local']!=day]
-        if len(group_with)>1 and len(group_without)>1:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-            results.append((mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level, day))
-        else:
-            results.append((np.nan, (np.nan, np.nan), False, day))
-    return results
+    charts = {}
+    for metric, daily_results in get_daily_analysis_results(df, list(metrics), confidence_level, engine).items():
+        daily_means = [0 if np.isnan(r[0]) else r[0] for r in daily_results]
+        daily_cis = [np.array([0,0]) if np.isnan(r[1]).any() else r[1] for r in daily_results]
+        daily_sig = [r[2] for r in daily_results]
+        sorted_indices = np.argsort([r[3] for r in daily_results])
+        days_sorted = np.array(DAY_NAMES)[sorted_indices]
+        means_sorted = np.array(daily_means)[sorted_indices]
+        cis_sorted = np.array(daily_cis).T[:, sorted_indices]
+        sig_sorted = np.array(daily_sig)[sorted_indices]
+        charts[metric] = (days_sorted, means_sorted, cis_sorted, sig_sorted,
+            f'{statistic_title(metric, engine)} by Day of the Week {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Day of the Week', difference_label(engine),
+            graph_file(directory, metric, f"by_day_of_week{'_in_'+subreddit if subreddit else ''}", engine))
+    return charts
+
+def get_daily_analysis_results(df, metric, confidence_level, engine='welch'):
+    cube = stats_cube(df, metric_list(metric), engine)
+    results = one_vs_rest_results(cube.breakdown('day', 7, confidence_level, engine=engine), confidence_level, 1)
+    return by_metric(metric, [[result + (day,) for day, result in enumerate(metric_results)]
+                              for metric_results in results])
 
-def generate_subreddit_bar_graph(df, confidence_level, directory):
-    results = get_subreddit_analysis_results(df, 'Upvotes', confidence_level)
-    if len(results)==1:
+def generate_subreddit_bar_graph(df, confidence_level, directory, engine='welch', metrics=('Upvotes',)):
+    charts = subreddit_charts(df, confidence_level, directory, engine, metrics)
+    if charts is None:
         print("Only one subreddit in dataset, graph generation skipped.")
         return "[SUBREDDIT GRAPH FAILED: ONLY ONE SUBREDDIT]"
-    subreddits = [r[0] for r in results]
-    means = [r[1] for r in results]
-    cis = np.array([r[2] for r in results]).T
-    sig = [r[3] for r in results]
-    return plot_bar_with_ci(subreddits, means, cis, sig,
-        f'Average Upvote Difference by Subreddit\n(Conf={confidence_level*100}%)',
-        'Subreddit', 'Mean Difference', f"graphs{directory}/upv_diff_by_subreddit")
-
-def get_subreddit_analysis_results(df, metric, confidence_level):
-    subs = df['Subreddit'].dropna().unique()
-    results = []
-    for sub in subs:
-        if isinstance(sub, str):
-            group_with = df[df['Subreddit']==sub]
-            group_without = df[df['Subreddit']!=sub]
-            if len(group_with)>1 and len(group_without)>1:
-                mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-                results.append((sub, mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
-            else:
-                results.append((sub, np.nan, (np.nan, np.nan), False))
-        else:
-            results.append((sub, np.nan, (np.nan, np.nan), False))
-    return results
+    return plot_charts(charts)
+
+def subreddit_charts(df, confidence_level, directory, engine='welch', metrics=('Upvotes',)):
+    # None when there is only one subreddit to compare
+    charts = {}
+    for metric, results in get_subreddit_analysis_results(df, list(metrics), confidence_level, engine).items():
+        if len(results)==1:
+            return None
+        subreddits = [r[0] for r in results]
+        means = [r[1] for r in results]
+        cis = np.array([r[2] for r in results]).T
+        sig = [r[3] for r in results]
+        charts[metric] = (subreddits, means, cis, sig,
+            f'{statistic_title(metric, engine)} by Subreddit\n(Conf={confidence_level*100}%)',
+            'Subreddit', difference_label(engine), graph_file(directory, metric, "by_subreddit", engine))
+    return charts
 
-def generate_common_tag_bar_graph(df, confidence_level, subreddit, top_n_tags, directory):
+def get_subreddit_analysis_results(df, metric, confidence_level, engine='welch'):
+    cube = stats_cube(df, metric_list(metric), engine)
+    # The extra code collects posts without a subreddit, which only count towards the rest
+    results = one_vs_rest_results(cube.breakdown('subreddit', len(cube.subreddits)+1, confidence_level, engine=engine),
+                                  confidence_level, 1)
+    return by_metric(metric, [[(sub,) + result for sub, result in zip(cube.subreddits, metric_results)]
+                              for metric_results in results])
+
+def generate_common_tag_bar_graph(df, confidence_level, subreddit, top_n_tags, directory, engine='welch',
+                                  metrics=('Upvotes',)):
+    return plot_charts(common_tag_charts(df, confidence_level, subreddit, top_n_tags, directory, engine, metrics))
+
+def common_tag_charts(df, confidence_level, subreddit, top_n_tags, directory, engine='welch', metrics=('Upvotes',)):
     directory = directory + "/tags"
-    results = get_tags_analysis_results(df, 'Upvotes', confidence_level, top_n_tags)
-    tags = [r[0] for r in results]
-    means = [r[1] for r in results]
-    cis = np.array([r[2] for r in results]).T
-    sig = [r[3] for r in results]
-    return plot_bar_with_ci(tags, means, cis, sig,
-        f'Average Upvote Difference in Top {top_n_tags} Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Tag', 'Mean Difference', f"graphs{directory}/upv_diff_by_top_common_{top_n_tags}_tags{'_in_'+subreddit if subreddit else ''}")
-
-def get_tags_analysis_results(df, metric, confidence_level, n=None):
-    ignored = ["script offer", "script fill"]
-    tag_counts = df['Tags'].str.split('|').explode().value_counts()
+    charts = {}
+    for metric, results in get_tags_analysis_results(df, list(metrics), confidence_level, top_n_tags, engine).items():
+        tags = [r[0] for r in results]
+        means = [r[1] for r in results]
+        cis = np.array([r[2] for r in results]).T
+        sig = [r[3] for r in results]
+        charts[metric] = (tags, means, cis, sig,
+            f'{statistic_title(metric, engine)} in Top {top_n_tags} Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Tag', difference_label(engine),
+            graph_file(directory, metric, f"by_top_common_{top_n_tags}_tags{'_in_'+subreddit if subreddit else ''}", engine))
+    return charts
+
+def get_tags_analysis_results(df, metric, confidence_level, n=None, engine='welch'):
+    metrics = metric_list(metric)
+    cube = stats_cube(df, metrics, engine)
     min_amt = (len(df)//1000)+5
-    tag_counts = tag_counts[tag_counts>=min_amt]
-    top_tags = tag_counts.index
-    results = []
-    count = 0
-    for tag in top_tags:
-        if tag in ignored:
-            continue
-        escaped_tag = re.escape(tag)
-        group_with = df[df['Tags'].str.contains(escaped_tag, na=False, regex=True)]
-        group_without = df[~df['Tags'].str.contains(escaped_tag, na=False, regex=True)]
-        if len(group_with)>min_amt and len(group_without)>min_amt:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-            if np.isnan(mean_diff):
+    # Tags overlap, so each tag has its own cell that is compared with everything else
+    mean_diff, ci_low, ci_high, p_value, _, n_with, n_without = cube.tag_breakdown(confidence_level, engine)
+    codes = np.argsort(-n_with[:, 0], kind='stable')
+    codes = codes[n_with[codes, 0]>=min_amt]
+    all_results = []
+    for j in range(len(metrics)):
+        results = []
+        count = 0
+        for tag, i in zip(cube.tag_names[codes], codes):
+            if tag in IGNORED_TAGS:
                 continue
-            results.append((tag, mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
-            count += 1
-            if n is not None and count==n:
-                break
-    return results
+            if n_with[i, j]>min_amt and n_without[i, j]>min_amt:
+                if np.isnan(mean_diff[i, j]):
+                    continue
+                results.append((tag, mean_diff[i, j], (ci_low[i, j], ci_high[i, j]),
+                                p_value[i, j] < 1.0 - confidence_level))
+                count += 1
+                if n is not None and count==n:
+                    break
+        all_results.append(results)
+    return by_metric(metric, all_results)
+
+def get_top_and_worst_tags(df, metric, confidence_level, n=5, engine='welch'):
+    all_results = get_tags_analysis_results(df, metric_list(metric), confidence_level, n=None, engine=engine)
+    top_and_worst = [(sorted(results, key=lambda x: x[1], reverse=True)[:n], sorted(results, key=lambda x: x[1])[:n])
+                     for results in all_results.values()]
+    return by_metric(metric, top_and_worst)
 
-def get_top_and_worst_tags(df, metric, confidence_level, n=5):
-    all_results = get_tags_analysis_results(df, metric, confidence_level, n=None)
-    best = sorted(all_results, key=lambda x: x[1], reverse=True)[:n]
-    worst = sorted(all_results, key=lambda x: x[1])[:n]
-    return best, worst
+def generate_top_and_worst_tags_graphs(df, confidence_level, subreddit, n, directory, engine='welch',
+                                       metrics=('Upvotes',)):
+    outputs = []
+    for metric, (best_tags, worst_tags) in get_top_and_worst_tags(df, list(metrics), confidence_level, n, engine).items():
+        outputs.extend(generate_top_and_worst_tags_graph(best_tags, worst_tags, confidence_level, subreddit, directory,
+                                                         metric, engine))
+    return generated(outputs)
 
-def generate_top_and_worst_tags_graph(best_tags, worst_tags, confidence_level, subreddit, directory):
+def generate_top_and_worst_tags_graph(best_tags, worst_tags, confidence_level, subreddit, directory, metric='Upvotes',
+                                      engine='welch'):
     directory = directory + "/tags"
     worst_tags.reverse()
     best_means = [tag[1] for tag in best_tags]
@@ -173,93 +266,106 @@ def generate_top_and_worst_tags_graph(best_tags, worst_tags, confidence_level, s
     worst_sig = [tag[3] for tag in worst_tags]
     worst_names = [tag[0] for tag in worst_tags]
     out1 = plot_bar_with_ci(best_names, best_means, best_cis, best_sig,
-        f'Average Upvote Difference in Top Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Tag', 'Mean Difference', f"graphs{directory}/upv_diff_by_top_{len(best_names)}_tags{'_in_'+subreddit if subreddit else ''}")
+        f'{statistic_title(metric, engine)} in Top Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+        'Tag', difference_label(engine),
+        graph_file(directory, metric, f"by_top_{len(best_names)}_tags{'_in_'+subreddit if subreddit else ''}", engine))
     out2 = plot_bar_with_ci(worst_names, worst_means, worst_cis, worst_sig,
-        f'Average Upvote Difference in Worst Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Tag', 'Mean Difference', f"graphs{directory}/upv_diff_by_bottom_{len(worst_names)}_tags{'_in_'+subreddit if subreddit else ''}")
+        f'{statistic_title(metric, engine)} in Worst Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+        'Tag', difference_label(engine),
+        graph_file(directory, metric, f"by_bottom_{len(worst_names)}_tags{'_in_'+subreddit if subreddit else ''}", engine))
     return out1, out2
 
-def generate_duration_bar_graph(df, confidence_level, subreddit, block_minutes, directory):
-    df = df[df['Duration'] != ''].dropna(subset=['Duration'])
-    df = df[~df['Duration'].str.contains('-')]
-    results = get_duration_analysis_results(df, 'Upvotes', confidence_level, block_minutes)
-    if all(np.isnan(r[1]) for r in results):
-        print("Not enough data for duration graph.")
-        return "[DURATION GRAPH FAILED]"
-    durations = [r[0] for r in results]
-    means = [r[1] for r in results]
-    cis = np.array([r[2] for r in results]).T
-    sig = [r[3] for r in results]
-    return plot_bar_with_ci(durations, means, cis, sig,
-        f'Average Upvote Difference by Duration Blocks of {block_minutes} Minutes {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Duration Block', 'Mean Difference', f"graphs{directory}/upv_diff_by_duration_blocks_of_{block_minutes}_minutes{'_in_'+subreddit if subreddit else ''}")
-
-def get_duration_analysis_results(df, metric, confidence_level, block_minutes):
-    df_copy = df.dropna(subset=['Duration']).copy()
-    def convert_to_minutes(tstr):
-        if tstr.startswith(':'):
-            tstr = '0' + tstr
-        parts = tstr.split(':')
-        minutes = int(parts[0]) if parts[0] else 0
-        seconds = int(parts[1]) if len(parts)==2 and parts[1] else 0
-        return minutes + seconds//60
-    df_copy['TotalMinutes'] = df_copy['Duration'].apply(lambda x: convert_to_minutes(x) if isinstance(x, str) else np.nan)
-    df_copy['DurationBlock'] = (df_copy['TotalMinutes'] // block_minutes) * block_minutes
-    min_amt = (len(df)//1000)+5
-    results = []
-    for block in sorted(df_copy['DurationBlock'].unique()):
-        group_with = df_copy[df_copy['DurationBlock']==block]
-        group_without = df_copy[df_copy['DurationBlock']!=block]
-        if len(group_with)>min_amt and len(group_without)>min_amt:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-            label = f"{int(block)}-{int(block)+block_minutes-1} mins"
-            results.append((label, mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
-        else:
-            label = f"{int(block)}-{int(block)+block_minutes-1} mins"
-            results.append((label, np.nan, (np.nan, np.nan), False))
-    return results
+def generate_duration_bar_graph(df, confidence_level, subreddit, block_minutes, directory, engine='welch',
+                                metrics=('Upvotes',)):
+    return plot_charts(duration_charts(df, confidence_level, subreddit, block_minutes, directory, engine, metrics))
+
+def duration_charts(df, confidence_level, subreddit, block_minutes, directory, engine='welch', metrics=('Upvotes',)):
+    charts = {}
+    for metric, results in get_duration_analysis_results(df, list(metrics), confidence_level, block_minutes,
+                                                         engine).items():
+        if all(np.isnan(r[1]) for r in results):
+            print(f"Not enough data for {metric.lower()} duration graph.")
+            charts[metric] = "[DURATION GRAPH FAILED]"
+            continue
+        durations = [r[0] for r in results]
+        means = [r[1] for r in results]
+        cis = np.array([r[2] for r in results]).T
+        sig = [r[3] for r in results]
+        charts[metric] = (durations, means, cis, sig,
+            f'{statistic_title(metric, engine)} by Duration Blocks of {block_minutes} Minutes {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Duration Block', difference_label(engine),
+            graph_file(directory, metric, f"by_duration_blocks_of_{block_minutes}_minutes{'_in_'+subreddit if subreddit else ''}", engine))
+    return charts
+
+def block_results(df, metric, confidence_level, values, block_size, unit, min_amt, engine='welch'):
+    blocks = (values // block_size) * block_size
+    labels = np.unique(blocks[~np.isnan(blocks)])
+    codes = np.where(np.isnan(blocks), -1, np.searchsorted(labels, blocks))
+    results = one_vs_rest_results(one_vs_rest(df[metric_list(metric)].to_numpy(dtype=float), codes, len(labels),
+                                              confidence_level, engine=engine),
+                                  confidence_level, min_amt)
+    return by_metric(metric, [[(f"{int(block)}-{int(block)+block_size-1} {unit}",) + result
+                               for block, result in zip(labels, metric_results)] for metric_results in results])
+
+def get_duration_analysis_results(df, metric, confidence_level, block_minutes, engine='welch'):
+    # Only posts with an "mm:ss" duration take part; unreadable durations only count towards the rest
+    cube = stats_cube(df, metric_list(metric), engine)
+    with_duration = lambda dims: dims['duration']>=1
+    min_amt = (cube.rows(with_duration)//1000)+5
+    minutes = cube.select(with_duration)[1]['duration'] - 2
+    labels = np.unique((minutes[minutes>=0] // block_minutes) * block_minutes)
+    def block_codes(dims):
+        blocks = ((dims['duration']-2) // block_minutes) * block_minutes
+        return np.where(dims['duration']>=2, np.searchsorted(labels, blocks), -1)
+    results = one_vs_rest_results(cube.breakdown(block_codes, len(labels), confidence_level, with_duration, engine=engine),
+                                  confidence_level, min_amt)
+    return by_metric(metric, [[(f"{int(block)}-{int(block)+block_minutes-1} mins",) + result
+                               for block, result in zip(labels, metric_results)] for metric_results in results])
 
-def generate_tag_count_bar_graph(df, confidence_level, subreddit, directory):
+def generate_tag_count_bar_graph(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
+    return plot_charts(tag_count_charts(df, confidence_level, subreddit, directory, engine, metrics))
+
+def tag_count_charts(df, confidence_level, subreddit, directory, engine='welch', metrics=('Upvotes',)):
     directory = directory + "/tags"
-    results = get_tag_count_analysis_results(df, 'Upvotes', confidence_level)
-    if all(np.isnan(r[1]) for r in results):
-        print("Not enough data for tag count graph.")
-        return "[TAG COUNT GRAPH FAILED]"
-    tag_counts = [r[0] for r in results]
-    means = [r[1] for r in results]
-    cis = np.array([r[2] for r in results]).T
-    sig = [r[3] for r in results]
-    return plot_bar_with_ci(tag_counts, means, cis, sig,
-        f'Average Upvote Difference by Number of Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
-        'Number of Tags', 'Mean Difference', f"graphs{directory}/upv_diff_by_tag_count{'_in_'+subreddit if subreddit else ''}")
-
-def get_tag_count_analysis_results(df, metric, confidence_level):
-    df['TagCount'] = df['Tags'].apply(lambda x: len(x.split('|')) if pd.notnull(x) else 0)
-    min_amt = (len(df)//1000)+5
-    results = []
-    for count in range(1,60):
-        group_with = df[df['TagCount']==count]
-        group_without = df[df['TagCount']!=count]
-        if len(group_with)>min_amt and len(group_without)>min_amt:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(group_with, group_without, metric, confidence_level)
-            results.append((count, mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
-        else:
-            results.append((count, np.nan, (np.nan, np.nan), False))
-    df.drop('TagCount', axis=1, inplace=True)
-    return results
+    charts = {}
+    for metric, results in get_tag_count_analysis_results(df, list(metrics), confidence_level, engine).items():
+        if all(np.isnan(r[1]) for r in results):
+            print(f"Not enough data for {metric.lower()} tag count graph.")
+            charts[metric] = "[TAG COUNT GRAPH FAILED]"
+            continue
+        tag_counts = [r[0] for r in results]
+        means = [r[1] for r in results]
+        cis = np.array([r[2] for r in results]).T
+        sig = [r[3] for r in results]
+        charts[metric] = (tag_counts, means, cis, sig,
+            f'{statistic_title(metric, engine)} by Number of Tags {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Number of Tags', difference_label(engine),
+            graph_file(directory, metric, f"by_tag_count{'_in_'+subreddit if subreddit else ''}", engine))
+    return charts
 
-def generate_hour_bar_graph_for_each_day_of_week(df, confidence_level, subreddit, directory):
-    directory = directory + "/time"
+def get_tag_count_analysis_results(df, metric, confidence_level, engine='welch'):
+    cube = stats_cube(df, metric_list(metric), engine)
+    min_amt = (cube.rows()//1000)+5
+    count_codes = lambda dims: np.where((dims['tag_count']>=1) & (dims['tag_count']<60), dims['tag_count'] - 1, -1)
+    results = one_vs_rest_results(cube.breakdown(count_codes, 59, confidence_level, engine=engine), confidence_level, min_amt)
+    return by_metric(metric, [[(count,) + result for count, result in zip(range(1,60), metric_results)]
+                              for metric_results in results])
+
+def generate_hour_bar_graph_for_each_day_of_week(df, confidence_level, subreddit, directory, engine='welch',
+                                                 metrics=('Upvotes',)):
     for day in range(7):
-        day_name = ['Sunday','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday'][day]
-        day_df = df[df['Day_Local']==day]
-        generate_hour_graph(day_df, confidence_level, 1,
-            f"graphs{directory}/days/upv_diff_by_hour{'_in_'+subreddit if subreddit else ''}{'_on_'+day_name}", subreddit)
-    return f"graphs{directory}/days/"
+        generate_day_hour_bar_graph(df, confidence_level, subreddit, day, directory, engine, metrics)
+    return f"graphs{directory}/time/days/"
 
+def generate_day_hour_bar_graph(df, confidence_level, subreddit, day, directory, engine='welch', metrics=('Upvotes',)):
+    directory = directory + "/time/days"
+    day_name = DAY_NAMES[day]
+    return generate_hour_graph(df, confidence_level, 1, directory,
+        f"by_hour{'_in_'+subreddit if subreddit else ''}{'_on_'+day_name}", subreddit, day, engine, metrics)
 
-def generate_script_length_bar_graph(df, confidence_level, subreddit, word_blocks, directory):
+
+def generate_script_length_bar_graph(df, confidence_level, subreddit, word_blocks, directory, engine='welch',
+                                     metrics=('Upvotes',)):
     # Filter rows where Duration is not empty and contains a dash (indicating script length)
     df = df.dropna(subset=['Duration'])
     df = df[df['Duration'] != '']
@@ -268,41 +374,215 @@ def generate_script_length_bar_graph(df, confidence_level, subreddit, word_block
     df['Duration'] = df['Duration'].apply(lambda x: x[1:])
 
     # Calculate analysis results based on word count
-    duration_results = get_word_count_analysis_results(df, 'Upvotes', confidence_level, word_blocks)
-    if all(np.isnan(result[1]) for result in duration_results):
-        print("Not enough data for script length graph.")
-        return "[GENERATION FAILED FOR SCRIPT GRAPH: NOT ENOUGH DATA]"
-    durations = [result[0] for result in duration_results]
-    duration_means = [result[1] for result in duration_results]
-    duration_cis = np.array([result[2] for result in duration_results]).T
-    duration_significant = [result[3] for result in duration_results]
-
-    return plot_bar_with_ci(
-        durations, duration_means, duration_cis, duration_significant,
-        f'Average Upvote Difference by Script Length of {word_blocks} Words '
-        f'{"in " + subreddit if subreddit else ""}\n(Conf={confidence_level * 100}%)',
-        'Script Length Block', 'Mean Difference',
-        f"graphs{directory}/upv_diff_by_word_blocks_of_{word_blocks}_words{'_in_' + subreddit if subreddit else ''}"
-    )
-
-
-def get_word_count_analysis_results(df, metric, confidence_level, word_blocks):
+    outputs = []
+    for metric, duration_results in get_word_count_analysis_results(df, list(metrics), confidence_level, word_blocks,
+                                                                    engine).items():
+        if all(np.isnan(result[1]) for result in duration_results):
+            print(f"Not enough data for {metric.lower()} script length graph.")
+            outputs.append("[GENERATION FAILED FOR SCRIPT GRAPH: NOT ENOUGH DATA]")
+            continue
+        durations = [result[0] for result in duration_results]
+        duration_means = [result[1] for result in duration_results]
+        duration_cis = np.array([result[2] for result in duration_results]).T
+        duration_significant = [result[3] for result in duration_results]
+
+        outputs.append(plot_bar_with_ci(
+            durations, duration_means, duration_cis, duration_significant,
+            f'{statistic_title(metric, engine)} by Script Length of {word_blocks} Words '
+            f'{"in " + subreddit if subreddit else ""}\n(Conf={confidence_level * 100}%)',
+            'Script Length Block', difference_label(engine),
+            graph_file(directory, metric, f"by_word_blocks_of_{word_blocks}_words{'_in_' + subreddit if subreddit else ''}", engine)
+        ))
+    return generated(outputs)
+
+
+def get_word_count_analysis_results(df, metric, confidence_level, word_blocks, engine='welch'):
     # Convert the Duration column to integer word count (assuming duration values represent word counts)
-    df = df.copy()
-    df['Duration'] = df['Duration'].astype(int)
-    df['DurationBlock'] = (df['Duration'] // word_blocks) * word_blocks
     min_amt = (len(df) // 1000) + 5
-    results = []
-    for block in sorted(df['DurationBlock'].unique()):
-        group_with = df[df['DurationBlock'] == block]
-        group_without = df[df['DurationBlock'] != block]
-        if len(group_with) > min_amt and len(group_without) > min_amt:
-            mean_diff, ci_low, ci_high, p_value, _ = perform_analysis_with_groups(
-                group_with, group_without, metric, confidence_level
-            )
-            block_label = f"{int(block)}-{int(block) + word_blocks - 1} words"
-            results.append((block_label, mean_diff, (ci_low, ci_high), p_value < 1.0 - confidence_level))
-        else:
-            block_label = f"{int(block)}-{int(block) + word_blocks - 1} words"
-            results.append((block_label, np.nan, (np.nan, np.nan), False))
-    return results
+    return block_results(df, metric, confidence_level, df['Duration'].astype(int).to_numpy(dtype=float),
+                         word_blocks, "words", min_amt, engine)
+
+
+def get_controlled_effects_results(df, metric, confidence_level, block_minutes=3):
+    # Per-factor (feature, coefficient, CI, significant) lists from one joint ridge fit, tags by most common first
+    all_results = []
+    for effects in fit_effects(df, metric_list(metric), confidence_level, block_minutes).values():
+        results = {}
+        for factor, features in effects.groupby('factor', sort=False):
+            if factor == 'tag':
+                features = features.sort_values('posts', ascending=False, kind='stable')
+            results[factor] = [(row.name, row.coefficient, (row.ci_low, row.ci_high),
+                                row.p_value < 1.0 - confidence_level) for row in features.itertuples()]
+        all_results.append(results)
+    return by_metric(metric, all_results)
+
+def generate_controlled_effects_graphs(df, confidence_level, subreddit, top_n_tags, block_minutes, directory,
+                                       metrics=('Upvotes',)):
+    directory = directory + "/controlled"
+    titles = {'tag': f'Top {top_n_tags} Tags', 'hour': 'Hour (UTC)', 'day': 'Day of the Week',
+              'subreddit': 'Subreddit', 'duration': f'Duration Blocks of {block_minutes} Minutes'}
+    outputs = []
+    for metric, results in get_controlled_effects_results(df, list(metrics), confidence_level, block_minutes).items():
+        for factor, factor_results in results.items():
+            if factor == 'tag':
+                factor_results = factor_results[:top_n_tags]
+            if len(factor_results) < 2:
+                continue
+            names = [r[0] for r in factor_results]
+            coefficients = [r[1] for r in factor_results]
+            cis = np.array([r[2] for r in factor_results]).T
+            sig = [r[3] for r in factor_results]
+            outputs.append(plot_bar_with_ci(names, coefficients, cis, sig,
+                f'Controlled {METRIC_NAMES.get(metric, metric)} Effect by {titles[factor]} {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+                titles[factor], 'Effect (other factors held fixed)',
+                graph_file(directory, metric, f"controlled_by_{factor}{'_in_'+subreddit if subreddit else ''}")))
+    return generated(outputs)
+
+def get_tag_pair_analysis_results(df, metric, confidence_level, n=None):
+    # Tag pairs by mean difference, best first, each with the better of its two tags' own mean differences
+    metrics = metric_list(metric)
+    min_amt = (len(df)//1000)+5
+    names, first, second, (mean_diff, ci_low, ci_high, p_value, _, n_with, n_without) = \
+        tag_pair_breakdown(df, metrics, confidence_level, min_amt)
+    alone = np.full((len(names), len(metrics)), np.nan)
+    single = first == second
+    alone[first[single]] = mean_diff[single]
+    ignored = np.isin(names, IGNORED_TAGS)
+    all_results = []
+    for j in range(len(metrics)):
+        results = []
+        for i in np.argsort(-mean_diff[:, j], kind='stable'):
+            if single[i] or ignored[first[i]] or ignored[second[i]] or np.isnan(mean_diff[i, j]):
+                continue
+            if n_with[i, j]>min_amt and n_without[i, j]>min_amt:
+                results.append((f"{names[first[i]]} + {names[second[i]]}", mean_diff[i, j],
+                                (ci_low[i, j], ci_high[i, j]), p_value[i, j] < 1.0 - confidence_level,
+                                np.nanmax([alone[first[i], j], alone[second[i], j]])))
+                if n is not None and len(results)==n:
+                    break
+        all_results.append(results)
+    return by_metric(metric, all_results)
+
+def generate_tag_pair_bar_graph(df, confidence_level, subreddit, top_n_pairs, directory, metrics=('Upvotes',)):
+    directory = directory + "/tags"
+    outputs = []
+    for metric, results in get_tag_pair_analysis_results(df, list(metrics), confidence_level, top_n_pairs).items():
+        if not results:
+            print(f"Not enough data for {metric.lower()} tag pair graph.")
+            outputs.append("[TAG PAIR GRAPH FAILED]")
+            continue
+        pairs = [r[0] for r in results]
+        means = [r[1] for r in results]
+        cis = np.array([r[2] for r in results]).T
+        sig = [r[3] for r in results]
+        outputs.append(plot_bar_with_ci(pairs, means, cis, sig,
+            f'{statistic_title(metric, "welch")} in Top {top_n_pairs} Tag Pairs {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Tag Pair', difference_label("welch"),
+            graph_file(directory, metric, f"by_top_{top_n_pairs}_tag_pairs{'_in_'+subreddit if subreddit else ''}", "welch")))
+    return generated(outputs)
+
+def generate_tag_pair_heatmap(df, confidence_level, subreddit, top_k_tags, directory, metrics=('Upvotes',)):
+    # Mean difference of posts with both tags, for the top_k_tags most common tags; the diagonal is each tag alone
+    directory = directory + "/tags"
+    metrics = list(metrics)
+    min_amt = (len(df)//1000)+5
+    names, first, second, (mean_diff, _, _, p_value, _, n_with, n_without) = \
+        tag_pair_breakdown(df, metrics, confidence_level, min_amt)
+    single = first == second
+    common = [i for i in np.flatnonzero(single)[np.argsort(-n_with[single, 0], kind='stable')]
+              if names[first[i]] not in IGNORED_TAGS][:top_k_tags]
+    position = np.full(len(names), -1)
+    position[first[common]] = np.arange(len(common))
+    shown = (position[first] >= 0) & (position[second] >= 0)
+    outputs = []
+    for j, metric in enumerate(metrics):
+        enough = shown & (n_with[:, j] > min_amt) & (n_without[:, j] > min_amt)
+        grid = np.full((len(common), len(common)), np.nan)
+        significant = np.zeros(grid.shape, dtype=bool)
+        for rows, cols in [(position[first[enough]], position[second[enough]]),
+                           (position[second[enough]], position[first[enough]])]:
+            grid[rows, cols] = mean_diff[enough, j]
+            significant[rows, cols] = p_value[enough, j] < 1.0 - confidence_level
+        outputs.append(plot_heatmap(list(names[first[common]]), grid, significant,
+            f'{statistic_title(metric, "welch")} by Tag Pair {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            difference_label("welch"),
+            graph_file(directory, metric, f"tag_pair_heatmap_of_top_{top_k_tags}_tags{'_in_'+subreddit if subreddit else ''}", "welch")))
+    return generated(outputs)
+
+def get_tag_trend_results(df, metric, confidence_level, n=5, window_months=6):
+    # The n most common tags' (window end, mean diff, CI, significant) over sliding windows of window_months months
+    metrics = metric_list(metric)
+    counts = tag_index(df).counts()
+    tags = list(counts.index[~counts.index.isin(IGNORED_TAGS)][:n])
+    ends, trends = tag_trends(df, metrics, confidence_level, tags, window_months)
+    if trends is None:
+        return by_metric(metric, [{} for _ in metrics])
+    mean_diff, ci_low, ci_high, p_value, _, n_with, n_without = trends
+    # The usual minimum sample size, scaled to the posts in each window
+    min_amt = ((n_with + n_without)[:, :1, :]//1000)+5
+    enough = (n_with > min_amt) & (n_without > min_amt)
+    all_results = []
+    for j in range(len(metrics)):
+        all_results.append({tag: [(str(end), mean_diff[w, i, j], (ci_low[w, i, j], ci_high[w, i, j]),
+                                   p_value[w, i, j] < 1.0 - confidence_level) if enough[w, i, j] else
+                                  (str(end), np.nan, (np.nan, np.nan), False) for w, end in enumerate(ends)]
+                            for i, tag in enumerate(tags)})
+    return by_metric(metric, all_results)
+
+def generate_tag_trend_graph(df, confidence_level, subreddit, top_n_tags, window_months, directory,
+                             metrics=('Upvotes',)):
+    directory = directory + "/tags"
+    outputs = []
+    for metric, trends in get_tag_trend_results(df, list(metrics), confidence_level, top_n_tags,
+                                                window_months).items():
+        if not trends or all(np.isnan(r[1]) for results in trends.values() for r in results):
+            print(f"Not enough data for {metric.lower()} tag trend graph.")
+            outputs.append("[TAG TREND GRAPH FAILED]")
+            continue
+        windows = [r[0] for r in next(iter(trends.values()))]
+        series = {tag: ([r[1] for r in results], [r[2][0] for r in results], [r[2][1] for r in results])
+                  for tag, results in trends.items()}
+        outputs.append(plot_lines_with_ci(windows, series,
+            f'{statistic_title(metric, "welch")} of Top {top_n_tags} Tags over {window_months} Month Windows {"in "+subreddit if subreddit else ""}\n(Conf={confidence_level*100}%)',
+            'Window Ending', difference_label("welch"),
+            graph_file(directory, metric, f"trend_of_top_{top_n_tags}_tags_over_{window_months}_months{'_in_'+subreddit if subreddit else ''}", "welch")))
+    return generated(outputs)
+
+def get_peer_analysis_results(df, is_author, metric, confidence_level, top_n_tags, engine='welch'):
+    # The author's posts against their peers' by local hour, by day and in the author's most used tags, each as
+    # (name, title, axis label, labels, results by metric)
+    metrics = metric_list(metric)
+    values = df[metrics].to_numpy(dtype=float)
+    hours, days = df['Hour_Local'].to_numpy(dtype=int), df['Day_Local'].to_numpy(dtype=int)
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    author_tags = np.bincount(tag_codes[is_author[positions]], minlength=len(index.names))
+    order = np.argsort(-author_tags, kind='stable')
+    order = [i for i in order if author_tags[i] > 0 and index.names[i] not in IGNORED_TAGS][:top_n_tags]
+    tag_cells = []
+    for i in order:
+        cell = np.zeros(len(df), dtype=bool)
+        cell[positions[tag_codes == i]] = True
+        tag_cells.append(cell)
+    groups = [("by_hour", "by Hour", "Hour", [format_hour(hour) for hour in range(24)],
+               [hours == hour for hour in range(24)]),
+              ("by_day_of_week", "by Day of the Week", "Day of the Week", DAY_NAMES, [days == day for day in range(7)]),
+              (f"by_top_{top_n_tags}_tags", f"in Top {top_n_tags} Tags", "Tag", [index.names[i] for i in order],
+               tag_cells)]
+    return [(name, title, xlabel, labels, by_metric(metric, one_vs_rest_results(
+                author_vs_peers(values, is_author, cells, confidence_level, engine), confidence_level, 1)))
+            for name, title, xlabel, labels, cells in groups if cells]
+
+def generate_peer_graphs(df, is_author, author, confidence_level, top_n_tags, directory, engine='welch',
+                         metrics=('Upvotes',)):
+    outputs = []
+    for name, title, xlabel, labels, results_by_metric in get_peer_analysis_results(df, is_author, list(metrics),
+                                                                             confidence_level, top_n_tags, engine):
+        for metric, results in results_by_metric.items():
+            means = [0 if np.isnan(r[0]) else r[0] for r in results]
+            cis = np.array([np.array([0,0]) if np.isnan(r[1]).any() else r[1] for r in results]).T
+            sig = [r[2] for r in results]
+            outputs.append(plot_bar_with_ci(labels, means, cis, sig,
+                f'{author} vs Similar Creators: {statistic_title(metric, engine)} {title}\n(Conf={confidence_level*100}%)',
+                xlabel, difference_label(engine), graph_file(directory, metric, f"{name}_vs_peers", engine)))
+    return generated(outputs)
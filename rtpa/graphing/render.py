@@ -0,0 +1,127 @@
+import os
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import matplotlib
+import numpy as np
+import pandas as pd
+from rtpa import stats
+from rtpa.graphing.utils import GRAPH_COUNTS
+
+# Columns the graphs read besides the metrics
+GRAPH_COLUMNS = ['Subreddit', 'Tags', 'Hour_UTC', 'Day_Local', 'Duration', 'Timestamp', 'Timestamp_Local']
+GRAPH_FRAME = None
+GRAPH_BLOCKS = []
+
+
+class SharedFrame:
+    # Columns of a frame in shared memory blocks, so worker processes map them instead of each receiving a pickled
+    # copy. Numbers are shared as they are, timestamps as UTC datetimes and everything else as codes into its
+    # distinct values, which are the only part sent to the workers.
+    def __init__(self, df, columns):
+        self.length = len(df)
+        self.blocks, self.layout = [], []
+        try:
+            for column in columns:
+                series = df[column]
+                labels, tz = None, None
+                if isinstance(series.dtype, pd.DatetimeTZDtype):
+                    tz = series.dt.tz
+                    values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+                elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+                    values = series.to_numpy()
+                else:
+                    codes, labels = pd.factorize(series)
+                    values = np.asarray(codes, dtype=np.int32)
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                self.layout.append((column, block.name, values.dtype.str, labels, series.dtype, tz))
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_frame(layout, length):
+    # Worker initializer: rebuilds the frame once over the shared blocks; numeric columns stay views of them
+    global GRAPH_FRAME
+    matplotlib.use('agg')
+    # The graphs already use every core, resampling runs inside each worker
+    stats.RESAMPLE_WORKERS = 1
+    columns = {}
+    for column, name, dtype, labels, original, tz in layout:
+        block = shared_memory.SharedMemory(name=name)
+        GRAPH_BLOCKS.append(block)
+        values = np.ndarray(length, dtype=dtype, buffer=block.buf)
+        if labels is not None:
+            columns[column] = pd.Series(pd.Categorical.from_codes(values, labels)).astype(original)
+        elif tz is not None:
+            columns[column] = pd.Series(values, copy=False).dt.tz_localize('UTC').dt.tz_convert(tz)
+        else:
+            columns[column] = pd.Series(values, copy=False)
+    GRAPH_FRAME = pd.DataFrame(columns, copy=False)
+
+
+def render_graph(task):
+    # The output of the task with the graphs it reused from the cache and rendered
+    function, args = task
+    GRAPH_COUNTS.clear()
+    output = function(GRAPH_FRAME, *args)
+    return output, dict(GRAPH_COUNTS)
+
+
+def task_name(task):
+    return task[0].__name__.removeprefix('generate_')
+
+
+def render(df, tasks):
+    # Renders every (function, args) graph task in turn, printing each result; returns one message per failed task
+    errors = []
+    GRAPH_COUNTS.clear()
+    for task in tasks:
+        function, args = task
+        try:
+            print(f"Generated {function(df, *args)}")
+        except Exception as e:
+            errors.append(f"{task_name(task)}: {e}")
+    report_counts(GRAPH_COUNTS)
+    return errors
+
+
+def report_counts(counts):
+    print(f"Reused {counts.get('reused', 0)} unchanged graph(s) from the cache, rendered {counts.get('rendered', 0)}.")
+
+
+def render_parallel(df, tasks, metrics, workers=None):
+    # The same as render, with the tasks spread over a pool of processes that share the frame's graph columns.
+    # Results are printed as they finish.
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return render(df, tasks)
+    columns = [column for column in GRAPH_COLUMNS + list(metrics) if column in df.columns]
+    errors = []
+    counts = Counter()
+    shared = SharedFrame(df, list(dict.fromkeys(columns)))
+    try:
+        # Spawned workers start clean instead of forking the GUI and its threads
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=attach_frame,
+                                 initargs=(shared.layout, shared.length)) as pool:
+            futures = {pool.submit(render_graph, task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    output, task_counts = future.result()
+                    counts.update(task_counts)
+                    print(f"Generated {output}")
+                except Exception as e:
+                    errors.append(f"{task_name(futures[future])}: {e}")
+    finally:
+        shared.close()
+    report_counts(counts)
+    return errors
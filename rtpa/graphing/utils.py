@@ -1,11 +1,183 @@
 import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from collections import Counter
 import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.ticker import AutoMinorLocator, MaxNLocator
 import matplotlib.patches as mpatches
 
+STYLE_FILE = './rose-pine-dawn.mplstyle'
+STYLE_APPLIED = False
+# Figure sizes whose figure and axes are kept for reuse, per thread
+FIGURE_TEMPLATES = 4
+TEMPLATES = threading.local()
+SIG_COLOR = '#FFD580'
+NON_SIG_COLOR = 'lightgrey'
+# Rendered graphs are kept by the hash of their inputs in this directory next to them, up to GRAPH_CACHE_MB per
+# output directory. GRAPH_CACHE_VERSION changes with the drawing code, so older renders are not reused. The graphs in
+# the output directory are hard links to these renders rather than copies where the file system allows it.
+GRAPH_CACHE_DIR = '.graph_cache'
+GRAPH_CACHE_MB = 64
+GRAPH_CACHE_VERSION = 2
+# A manifest lock older than this many seconds was left by a process that was killed while holding it
+MANIFEST_LOCK_TIMEOUT = 10
+STYLE_DIGEST = None
+# Graphs reused from the cache and rendered in this process
+GRAPH_COUNTS = Counter()
+
+def use_style():
+    # Parsing the style file takes longer than drawing a small graph, so it is applied once per process
+    global STYLE_APPLIED
+    if not STYLE_APPLIED:
+        plt.style.use(STYLE_FILE)
+        STYLE_APPLIED = True
+
+def style_digest():
+    global STYLE_DIGEST
+    if STYLE_DIGEST is None:
+        with open(STYLE_FILE, 'rb') as f:
+            STYLE_DIGEST = hashlib.sha256(f.read()).hexdigest()
+    return STYLE_DIGEST
+
+def update_digest(digest, value):
+    # Arrays, strings, numbers and lists, tuples or dicts of them, with their structure
+    if isinstance(value, dict):
+        digest.update(b'd%d' % len(value))
+        for key, item in value.items():
+            update_digest(digest, key)
+            update_digest(digest, item)
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'l%d' % len(value))
+        for item in value:
+            update_digest(digest, item)
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        digest.update(f"a{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    else:
+        digest.update(f"v{value!r}".encode())
+
+def read_manifest(cache):
+    # The used size and last use of every cached graph, and the key of the graph at every output file name
+    try:
+        with open(os.path.join(cache, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'graphs': {}, 'outputs': {}}
+    if 'graphs' not in manifest:
+        # Manifests written before the outputs were recorded only hold the graphs
+        return {'graphs': manifest, 'outputs': {}}
+    return manifest
+
+@contextmanager
+def manifest_lock(cache):
+    # Graphs rendered in parallel processes update the same manifest, one at a time
+    lock = os.path.join(cache, 'manifest.lock')
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > MANIFEST_LOCK_TIMEOUT:
+                    os.remove(lock)
+            except OSError:
+                pass
+            time.sleep(0.005)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+def record_graph(cache, key, size, output):
+    # Marks key as just used by the output file name and drops the least recently used graphs beyond GRAPH_CACHE_MB
+    with manifest_lock(cache):
+        manifest = read_manifest(cache)
+        graphs = manifest['graphs']
+        graphs[key] = {'size': size, 'used': time.time()}
+        manifest['outputs'][output] = key
+        total = sum(entry['size'] for entry in graphs.values())
+        for old in sorted(graphs, key=lambda k: graphs[k]['used']):
+            if total <= GRAPH_CACHE_MB * 2 ** 20 or old == key:
+                break
+            total -= graphs.pop(old)['size']
+            try:
+                os.remove(os.path.join(cache, f"{old}.png"))
+            except OSError:
+                pass
+        temporary = os.path.join(cache, f"manifest.{os.getpid()}.{threading.get_ident()}.json")
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temporary, os.path.join(cache, 'manifest.json'))
+
+def place_graph(cached, path):
+    # The output is replaced rather than written over, so the cached render it may be linked to is never changed
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.png"
+    try:
+        os.link(cached, temporary)
+    except OSError:
+        shutil.copyfile(cached, temporary)
+    os.replace(temporary, path)
+
+def cached_graph(filename, inputs, draw):
+    # Draws the graph with draw(path) only if no graph drawn from the same inputs, title and style is cached in the
+    # output directory. An output that already holds that graph is left as it is, a cached one is linked into place.
+    directory = os.path.dirname(filename)
+    cache = os.path.join(directory, GRAPH_CACHE_DIR)
+    # Graphs rendered in parallel can create the same directory at once
+    os.makedirs(cache, exist_ok=True)
+    digest = hashlib.sha256(f"{GRAPH_CACHE_VERSION} {style_digest()}".encode())
+    update_digest(digest, inputs)
+    key = digest.hexdigest()
+    path = f"{filename}.png"
+    output = os.path.basename(path)
+    manifest = read_manifest(cache)
+    if manifest['outputs'].get(output) == key and os.path.exists(path):
+        GRAPH_COUNTS['reused'] += 1
+        return path
+    cached = os.path.join(cache, f"{key}.png")
+    if key in manifest['graphs'] and os.path.exists(cached):
+        GRAPH_COUNTS['reused'] += 1
+    else:
+        temporary = os.path.join(cache, f"{key}.{os.getpid()}.{threading.get_ident()}.png")
+        draw(temporary)
+        os.replace(temporary, cached)
+        GRAPH_COUNTS['rendered'] += 1
+    place_graph(cached, path)
+    record_graph(cache, key, os.path.getsize(cached), output)
+    return path
+
+def figure_template(figsize):
+    # A cleared figure and axes of the given size (None for the style's default), reused by the next graph of the
+    # same size instead of building a new figure. Every thread keeps its own, the oldest size is dropped first.
+    templates = getattr(TEMPLATES, 'figures', None)
+    if templates is None:
+        templates = TEMPLATES.figures = {}
+    if figsize in templates:
+        fig, ax = templates.pop(figsize)
+        ax.clear()
+    else:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        if len(templates) >= FIGURE_TEMPLATES:
+            templates.pop(next(iter(templates)))
+    templates[figsize] = (fig, ax)
+    return fig, ax
+
 def plot_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, filename):
-    plt.style.use('./rose-pine-dawn.mplstyle')
+    return cached_graph(filename, ('bar', x, means, cis, significant, title, xlabel, ylabel),
+                        lambda path: draw_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, path))
+
+def draw_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, path):
+    use_style()
     valid = ~np.isnan(means)
     x = np.array(x)[valid]
     means = np.array(means)[valid]
@@ -13,21 +185,15 @@ def plot_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, filename
     significant = np.array(significant)[valid]
     error = np.abs(cis - means) if cis.ndim == 2 else None
 
-    if len(x) > 10:
-        fig, ax = plt.subplots(figsize=(len(x), 8))
-    else:
-        fig, ax = plt.subplots()
+    fig, ax = figure_template((len(x), 8) if len(x) > 10 else None)
 
-    non_sig_color = 'lightgrey'
-    sig_color = '#FFD580'
-    sig_patch = mpatches.Patch(color=sig_color, label='Significant')
-    non_sig_patch = mpatches.Patch(color=non_sig_color, label='Not Significant')
-    plt.legend(handles=[sig_patch, non_sig_patch])
+    sig_patch = mpatches.Patch(color=SIG_COLOR, label='Significant')
+    non_sig_patch = mpatches.Patch(color=NON_SIG_COLOR, label='Not Significant')
+    ax.legend(handles=[sig_patch, non_sig_patch])
 
-    for xi, mean, err, sig in zip(x, means, error.T if error is not None else [None]*len(means), significant):
-        color = sig_color if sig else non_sig_color
-        ax.bar(xi, mean, color=color, edgecolor='black',
-               yerr=err.reshape(2, 1) if err is not None else None, capsize=5)
+    # Every bar and error bar in one call, coloured per bar
+    ax.bar(x, means, color=np.where(significant, SIG_COLOR, NON_SIG_COLOR), edgecolor='black', yerr=error,
+           capsize=5)
 
     ax.axhline(y=0, color='grey', linestyle='--', linewidth=1)
     ax.set_xticks(x)
@@ -38,9 +204,54 @@ def plot_bar_with_ci(x, means, cis, significant, title, xlabel, ylabel, filename
     ax.set_xlabel(xlabel)
     ax.set_ylabel(ylabel)
 
-    directory = os.path.dirname(filename)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    fig.savefig(f'{filename}.png', bbox_inches='tight')
+    fig.savefig(path, bbox_inches='tight')
+
+def plot_heatmap(labels, values, significant, title, colorbar_label, filename):
+    return cached_graph(filename, ('heatmap', labels, values, significant, title, colorbar_label),
+                        lambda path: draw_heatmap(labels, values, significant, title, colorbar_label, path))
+
+def draw_heatmap(labels, values, significant, title, colorbar_label, path):
+    use_style()
+    fig, ax = plt.subplots(figsize=(max(6, len(labels) * 0.6 + 2), max(5, len(labels) * 0.6 + 1)))
+    limit = np.nanmax(np.abs(values)) if not np.isnan(values).all() else 1
+    image = ax.imshow(np.ma.masked_invalid(values), cmap='RdBu', vmin=-limit, vmax=limit)
+    fig.colorbar(image, ax=ax, label=colorbar_label)
+    # Significant differences are marked with a star
+    for i, j in zip(*np.nonzero(significant)):
+        ax.text(j, i, '*', ha='center', va='center', color='black')
+
+    ax.set_xticks(np.arange(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_yticks(np.arange(len(labels)))
+    ax.set_yticklabels(labels)
+    ax.grid(False)
+    ax.set_title(title)
+
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+
+def plot_lines_with_ci(x, series, title, xlabel, ylabel, filename):
+    # series maps a label to its (means, ci lows, ci highs); gaps (NaN) break the lines and bands
+    return cached_graph(filename, ('lines', x, series, title, xlabel, ylabel),
+                        lambda path: draw_lines_with_ci(x, series, title, xlabel, ylabel, path))
+
+def draw_lines_with_ci(x, series, title, xlabel, ylabel, path):
+    use_style()
+    fig, ax = plt.subplots(figsize=(max(8, len(x) * 0.35), 6))
+    positions = np.arange(len(x))
+    for label, (means, lows, highs) in series.items():
+        line, = ax.plot(positions, means, marker='o', markersize=3, label=label)
+        ax.fill_between(positions, lows, highs, color=line.get_color(), alpha=0.15)
+
+    ax.axhline(y=0, color='grey', linestyle='--', linewidth=1)
+    ax.set_xticks(positions)
+    ax.set_xticklabels(x, rotation=45, ha='right')
+    ax.yaxis.set_minor_locator(AutoMinorLocator())
+    ax.yaxis.set_major_locator(MaxNLocator(10))
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+
+    fig.savefig(path, bbox_inches='tight')
     plt.close(fig)
-    return f"{filename}.png"
@@ -1,17 +1,26 @@
 import sys
 import os
+import threading
 import dearpygui.dearpygui as dpg
 import matplotlib
-from rtpa.analysis import analyze
+import numpy as np
+from matplotlib.colors import to_rgb
+from rtpa.analysis import perform_analysis
 from rtpa.exceptions import InsufficientData
 from rtpa.graphing.generation import (
     generate_duration_bar_graph, generate_tag_count_bar_graph, generate_script_length_bar_graph,
     generate_subreddit_bar_graph, generate_hourly_bar_graph, generate_hour_block_bar_graph,
-    generate_day_bar_graph, generate_common_tag_bar_graph, get_top_and_worst_tags,
-    generate_top_and_worst_tags_graph, generate_hour_bar_graph_for_each_day_of_week
+    generate_day_bar_graph, generate_common_tag_bar_graph, generate_preview_graph,
+    generate_top_and_worst_tags_graphs, generate_day_hour_bar_graph, generate_controlled_effects_graphs,
+    generate_tag_pair_bar_graph, generate_tag_pair_heatmap, generate_tag_trend_graph, generate_peer_graphs,
+    subreddit_charts, hourly_charts, hour_block_charts, day_charts, common_tag_charts, duration_charts, tag_count_charts
 )
-from rtpa.scraping.old_reddit import scrape as scrape_old_reddit
-from rtpa.loader import load_df
+from rtpa.graphing.utils import plot_bar_with_ci, SIG_COLOR, NON_SIG_COLOR
+from rtpa.graphing.render import render, render_parallel
+from rtpa.authors import author_leaderboard, export_author_leaderboard, similar_authors, peer_frame
+from rtpa.scraping.old_reddit import scrape_old_reddit
+from rtpa.frame_cache import FrameCache
+from rtpa.preview import preview_frames
 
 class GuiOutputStream:
     def __init__(self):
@@ -29,6 +38,13 @@ class GuiOutputStream:
         pass
 
 gos = GuiOutputStream()
+frame_cache = FrameCache(budget_mb=2048)
+# Tabs of the results window and the chart each one shows, for exporting
+RESULT_TABS = ["Subreddit", "Hour", "Hour Block", "Day", "Common Tags", "Duration", "Tag Count"]
+result_charts_shown = {}
+# The thread rendering a preview, and the event that stops it between stages
+PREVIEW_WORKER = None
+PREVIEW_CANCEL = threading.Event()
 
 def clear():
     gos.clear()
@@ -62,62 +78,170 @@ def get_input_fields():
     except Exception:
         print("Please enter a valid integer for Minute Block.")
         return
+    try:
+        inputs['inflation_window'] = int(dpg.get_value("inflation_window_input")) if dpg.get_value("inflation_window_input") != "" else 1
+    except Exception:
+        print("Please enter a valid integer for Inflation Window.")
+        return
+    try:
+        inputs['subreddit_window'] = int(dpg.get_value("subreddit_window_input")) if dpg.get_value("subreddit_window_input") != "" else None
+    except Exception:
+        print("Please enter a valid integer for Subreddit Window.")
+        return
     inputs['graph_style'] = dpg.get_value("graph_style_dropdown")
+    inputs['engine'] = 'resampling' if dpg.get_value("engine_dropdown") == "Bootstrap/Permutation" else 'welch'
+    inputs['quantile_engines'] = [engine for engine in ["median", "p90"] if dpg.get_value(f"quantile_graphs_{engine}")]
+    inputs['controlled_effects'] = dpg.get_value("controlled_effects_graphs")
+    inputs['tag_pairs'] = dpg.get_value("tag_pair_graphs")
+    inputs['tag_trends'] = dpg.get_value("tag_trend_graphs")
+    inputs['preview'] = dpg.get_value("preview_graphs")
+    inputs['parallel'] = dpg.get_value("parallel_graphs")
+    inputs['graph_metrics'] = [metric for metric in ["Upvotes", "Comments", "Fills"]
+                               if dpg.get_value(f"graph_metric_{metric.lower()}")]
     inputs['analysis_type'] = dpg.get_value("analysis_type_dropdown")
     inputs['analysis_type_value'] = dpg.get_value("analysis_type_value_input")
     inputs['analysis_metric'] = dpg.get_value("analysis_metric_dropdown")
+    inputs['similar_author'] = dpg.get_value("similar_author_input").strip()
     inputs['user_subreddit'] = dpg.get_value("user_subreddit_dropdown")
     inputs['user_subreddit_value'] = dpg.get_value("user_subreddit_value_input")
     inputs['time_frame'] = dpg.get_value("time_frame_dropdown")
+    inputs['export_csv'] = dpg.get_value("export_csv")
     inputs['time_input'] = dpg.get_value("time_input")
     inputs['normalize_subreddits'] = dpg.get_value("normalize_subreddits") == "Yes"
     inputs['normalize_inflation'] = dpg.get_value("normalize_inflation") == "Yes"
+    inputs['compact'] = dpg.get_value("compact_memory") == "Yes"
+    inputs['stream'] = dpg.get_value("stream_loading") == "Yes"
+    near_duplicates = dpg.get_value("near_duplicates")
+    inputs['near_duplicates'] = None if near_duplicates == "Off" else float(near_duplicates)
     return inputs
 
 def generate_graphs_callback(sender, app_data, user_data):
+    global PREVIEW_WORKER
     clear()
+    if PREVIEW_WORKER is not None and PREVIEW_WORKER.is_alive():
+        print("Graphs are still being generated.")
+        return
     inputs = get_input_fields()
     if inputs is None:
         return
-    file = inputs['file']
-    subreddit = inputs['subreddit']
-    filter_tag = inputs['filter_tag']
-    confidence_level = inputs['confidence_level']
-    n_common_tags = inputs['n_common_tags']
-    n_best_worst_tags = inputs['n_best_worst_tags']
-    hour_block = inputs['hour_block']
-    minute_block = inputs['minute_block']
-    df = get_df()
+    df = get_df(columns=['Duration'] + inputs['graph_metrics'])
     if df is None:
         return
+    metrics = [metric for metric in inputs['graph_metrics'] if metric in df.columns]
+    if not metrics:
+        print("None of the selected metrics are in the dataset.")
+        return
     if not os.path.exists("graphs"):
         os.mkdir("graphs")
-    directory = "/" + " ".join([file.replace(".csv", "") for file in file.split(',')])
-    if subreddit != "":
-        directory += f"_{subreddit}"
-    if filter_tag != "":
-        directory += f"_{filter_tag}"
-    time_input = inputs['time_input']
-    if time_input is not None:
-        directory += f"_{time_input}"
+    directory = graph_directory(inputs)
     print(f"Generating graphs in /graphs{directory}/")
+    if inputs['preview']:
+        # One preview at a time: the button stays disabled until the worker is done
+        PREVIEW_CANCEL.clear()
+        dpg.configure_item("generate_graphs_button", enabled=False)
+        PREVIEW_WORKER = threading.Thread(target=progressive_graphs, args=(df, inputs, directory, metrics), daemon=True)
+        PREVIEW_WORKER.start()
+        return
+    render_graphs(df, inputs, directory, metrics)
+    print("Done generating graphs. Check the /graphs/ directory.")
+
+def graph_directory(inputs):
+    directory = "/" + " ".join([file.replace(".csv", "") for file in inputs['file'].split(',')])
+    if inputs['subreddit'] != "":
+        directory += f"_{inputs['subreddit']}"
+    if inputs['filter_tag'] != "":
+        directory += f"_{inputs['filter_tag']}"
+    if inputs['time_input'] is not None:
+        directory += f"_{inputs['time_input']}"
+    return directory
+
+def progressive_graphs(df, inputs, directory, metrics):
+    # Welch graphs of growing stratified samples first, each overwritten by the next, then the exact graphs. Stops
+    # between stages once PREVIEW_CANCEL is set.
+    subreddit = inputs['subreddit']
+    confidence_level = inputs['confidence_level']
     try:
-        newline = "\nand "
-        print(f"Generated {generate_subreddit_bar_graph(df, confidence_level, directory)}")
-        print(f"Generated {generate_hourly_bar_graph(df, confidence_level, subreddit, directory)}")
-        print(f"Generated {generate_hour_block_bar_graph(df, confidence_level, subreddit, hour_block, directory)}")
-        print(f"Generated {generate_day_bar_graph(df, confidence_level, subreddit, directory)}")
-        print(f"Generated {generate_common_tag_bar_graph(df, confidence_level, subreddit, n_common_tags, directory)}")
-        best_tags, worst_tags = get_top_and_worst_tags(df, 'Upvotes', confidence_level, n_best_worst_tags)
-        out1, out2 = generate_top_and_worst_tags_graph(best_tags, worst_tags, confidence_level, subreddit, directory)
-        print(f"Generated {out1 + newline + out2}")
-        print(f"Generated {generate_duration_bar_graph(df, confidence_level, subreddit, minute_block, directory)}")
-        print(f"Generated {generate_script_length_bar_graph(df, confidence_level, subreddit, 100, directory)}")
-        print(f"Generated {generate_tag_count_bar_graph(df, confidence_level, subreddit, directory)}")
-        print(f"Generated {generate_hour_bar_graph_for_each_day_of_week(df, confidence_level, subreddit, directory)}")
+        try:
+            for fraction, sample in preview_frames(df, metrics):
+                if PREVIEW_CANCEL.is_set():
+                    break
+                print(f"Preview estimates from a {fraction:.0%} stratified sample ({len(sample)} posts):")
+                render(sample, [(generate_preview_graph, (fraction,) + task) for task in [
+                    (subreddit_charts, confidence_level, directory, 'welch', metrics),
+                    (hourly_charts, confidence_level, subreddit, directory, 'welch', metrics),
+                    (hour_block_charts, confidence_level, subreddit, inputs['hour_block'], directory, 'welch', metrics),
+                    (day_charts, confidence_level, subreddit, directory, 'welch', metrics),
+                    (common_tag_charts, confidence_level, subreddit, inputs['n_common_tags'], directory, 'welch', metrics),
+                    (duration_charts, confidence_level, subreddit, inputs['minute_block'], directory, 'welch', metrics),
+                    (tag_count_charts, confidence_level, subreddit, directory, 'welch', metrics),
+                ]])
+        except Exception as e:
+            print(f"An error occurred:\n {e}")
+        if PREVIEW_CANCEL.is_set():
+            print("Stopped generating graphs.")
+            return
+        print("Exact results from every post:")
+        render_graphs(df, inputs, directory, metrics)
+        print("Done generating graphs. Check the /graphs/ directory.")
+    finally:
+        dpg.configure_item("generate_graphs_button", enabled=True)
+
+def stop_preview():
+    # Lets a running preview finish its current stage instead of leaving graphs half-written at exit
+    PREVIEW_CANCEL.set()
+    if PREVIEW_WORKER is not None:
+        PREVIEW_WORKER.join()
+
+def graph_tasks(inputs, directory, metrics):
+    # Every graph to render as a (function, arguments after the frame) task; the tasks do not depend on each other
+    subreddit = inputs['subreddit']
+    confidence_level = inputs['confidence_level']
+    n_common_tags = inputs['n_common_tags']
+    n_best_worst_tags = inputs['n_best_worst_tags']
+    engine = inputs['engine']
+    tasks = [
+        (generate_subreddit_bar_graph, (confidence_level, directory, engine, metrics)),
+        (generate_hourly_bar_graph, (confidence_level, subreddit, directory, engine, metrics)),
+        (generate_hour_block_bar_graph, (confidence_level, subreddit, inputs['hour_block'], directory, engine, metrics)),
+        (generate_day_bar_graph, (confidence_level, subreddit, directory, engine, metrics)),
+        (generate_common_tag_bar_graph, (confidence_level, subreddit, n_common_tags, directory, engine, metrics)),
+        (generate_top_and_worst_tags_graphs, (confidence_level, subreddit, n_best_worst_tags, directory, engine, metrics)),
+        (generate_duration_bar_graph, (confidence_level, subreddit, inputs['minute_block'], directory, engine, metrics)),
+        (generate_script_length_bar_graph, (confidence_level, subreddit, 100, directory, engine, metrics)),
+        (generate_tag_count_bar_graph, (confidence_level, subreddit, directory, engine, metrics)),
+    ]
+    tasks += [(generate_day_hour_bar_graph, (confidence_level, subreddit, day, directory, engine, metrics))
+              for day in range(7)]
+    # Median and 90th percentile differences, next to the mean differences
+    for quantile_engine in inputs['quantile_engines']:
+        tasks += [
+            (generate_subreddit_bar_graph, (confidence_level, directory, quantile_engine, metrics)),
+            (generate_hourly_bar_graph, (confidence_level, subreddit, directory, quantile_engine, metrics)),
+            (generate_day_bar_graph, (confidence_level, subreddit, directory, quantile_engine, metrics)),
+            (generate_common_tag_bar_graph, (confidence_level, subreddit, n_common_tags, directory, quantile_engine, metrics)),
+        ]
+    if inputs['controlled_effects']:
+        tasks.append((generate_controlled_effects_graphs, (confidence_level, subreddit, n_common_tags, inputs['minute_block'], directory, metrics)))
+    if inputs['tag_pairs']:
+        tasks.append((generate_tag_pair_bar_graph, (confidence_level, subreddit, n_best_worst_tags, directory, metrics)))
+        tasks.append((generate_tag_pair_heatmap, (confidence_level, subreddit, n_common_tags, directory, metrics)))
+    if inputs['tag_trends']:
+        tasks.append((generate_tag_trend_graph, (confidence_level, subreddit, n_best_worst_tags, 6, directory, metrics)))
+    return tasks
+
+def render_graphs(df, inputs, directory, metrics):
+    tasks = graph_tasks(inputs, directory, metrics)
+    try:
+        if inputs['parallel']:
+            print(f"Rendering {len(tasks)} graph sets in parallel...")
+            errors = render_parallel(df, tasks, metrics)
+        else:
+            errors = render(df, tasks)
     except Exception as e:
         print(f"An error occurred:\n {e}")
-    print("Done generating graphs. Check the /graphs/ directory.")
+        return
+    if errors:
+        print(f"{len(errors)} graph set(s) failed:\n " + "\n ".join(errors))
 
 def generate_analysis_callback(sender, app_data, user_data):
     clear()
@@ -129,16 +253,163 @@ def generate_analysis_callback(sender, app_data, user_data):
     analysis_value = inputs['analysis_type_value']
     analysis_metric = inputs['analysis_metric']
     confidence_level = inputs['confidence_level']
-    df = get_df()
+    df = get_df(columns=[analysis_metric])
     if df is None:
         return
+    if analysis_metric not in df.columns:
+        print(f"{analysis_metric} is not in the dataset.")
+        return
     try:
-        dpg.set_value("console_output",
-                      str(analyze()))
+        print(perform_analysis(df, analysis_type, analysis_metric, analysis_value, confidence_level, False,
+                               engine=inputs['engine']))
     except Exception as e:
         print(f"An error occurred:\n {e}")
 
-def get_df():
+def author_leaderboard_callback(sender, app_data, user_data):
+    clear()
+    inputs = get_input_fields()
+    if inputs is None:
+        return
+    metric = inputs['analysis_metric']
+    df = get_df(columns=[metric])
+    if df is None:
+        return
+    if metric not in df.columns:
+        print(f"{metric} is not in the dataset.")
+        return
+    try:
+        board = author_leaderboard(df, metric, inputs['confidence_level'])
+        filename = "leaderboards/" + " ".join([file.replace(".csv", "") for file in inputs['file'].split(',')])
+        if inputs['subreddit'] != "":
+            filename += f"_{inputs['subreddit']}"
+        filename = export_author_leaderboard(board, f"{filename}_{metric.lower()}.csv")
+        print(f"Ranked {len(board)} authors by {metric.lower()}, exported to {filename}\n")
+        print(board.head(10)[['Author', 'Posts', f'Mean {metric}', f'Median {metric}', 'Mean Difference',
+                              'Best Tag', 'Best Hour UTC']].to_string(index=False))
+    except Exception as e:
+        print(f"An error occurred:\n {e}")
+
+def similar_creators_callback(sender, app_data, user_data):
+    clear()
+    inputs = get_input_fields()
+    if inputs is None:
+        return
+    author = inputs['similar_author']
+    if author == "":
+        print("Please enter an author.")
+        return
+    df = get_df(columns=['Duration'] + inputs['graph_metrics'])
+    if df is None:
+        return
+    metrics = [metric for metric in inputs['graph_metrics'] if metric in df.columns]
+    if not metrics:
+        print("None of the selected metrics are in the dataset.")
+        return
+    peers = similar_authors(df, author, 10)
+    if peers is None:
+        print(f"No posts by {author} in the dataset.")
+        return
+    print(f"Creators most similar to {author} by tags and posting schedule:\n")
+    print(peers.to_string(index=False))
+    # The author's posts are compared with the posts of their peers
+    peers_df, is_author = peer_frame(df, author, 10)
+    directory = f"/peers_of_{author}"
+    try:
+        print(f"\nGenerated {generate_peer_graphs(peers_df, is_author, author, inputs['confidence_level'], inputs['n_common_tags'], directory, inputs['engine'], metrics)}")
+    except Exception as e:
+        print(f"An error occurred:\n {e}")
+
+def result_charts(df, inputs, directory, metric):
+    # The chart of every results tab for one metric: the arguments of plot_bar_with_ci, or why there is none
+    subreddit = inputs['subreddit']
+    confidence_level = inputs['confidence_level']
+    engine = inputs['engine']
+    metrics = [metric]
+    subreddits = subreddit_charts(df, confidence_level, directory, engine, metrics)
+    return {
+        "Subreddit": "Only one subreddit in the dataset" if subreddits is None else subreddits[metric],
+        "Hour": hourly_charts(df, confidence_level, subreddit, directory, engine, metrics)[metric],
+        "Hour Block": hour_block_charts(df, confidence_level, subreddit, inputs['hour_block'], directory, engine, metrics)[metric],
+        "Day": day_charts(df, confidence_level, subreddit, directory, engine, metrics)[metric],
+        "Common Tags": common_tag_charts(df, confidence_level, subreddit, inputs['n_common_tags'], directory, engine, metrics)[metric],
+        "Duration": duration_charts(df, confidence_level, subreddit, inputs['minute_block'], directory, engine, metrics)[metric],
+        "Tag Count": tag_count_charts(df, confidence_level, subreddit, directory, engine, metrics)[metric],
+    }
+
+def result_tag(name, item):
+    return f"results_{name.lower().replace(' ', '_')}_{item}"
+
+def show_chart(name, chart):
+    # Replaces the data of the tab's plot in place; bars without a mean are left out as in the PNG graphs
+    if not isinstance(chart, tuple):
+        dpg.configure_item(result_tag(name, "plot"), label=chart)
+        dpg.set_value(result_tag(name, "sig"), [[], []])
+        dpg.set_value(result_tag(name, "non_sig"), [[], []])
+        dpg.set_value(result_tag(name, "error"), [[], [], [], []])
+        dpg.reset_axis_ticks(result_tag(name, "x"))
+        return
+    x, means, cis, significant, title, xlabel, ylabel, _ = chart
+    means = np.asarray(means, dtype=float)
+    valid = ~np.isnan(means)
+    labels = [str(label) for label in np.asarray(x)[valid]]
+    means = means[valid]
+    lows, highs = np.asarray(cis, dtype=float).reshape(2, -1)[:, valid]
+    significant = np.asarray(significant, dtype=bool)[valid]
+    positions = np.arange(len(labels), dtype=float)
+    dpg.set_value(result_tag(name, "sig"), [positions[significant].tolist(), means[significant].tolist()])
+    dpg.set_value(result_tag(name, "non_sig"), [positions[~significant].tolist(), means[~significant].tolist()])
+    dpg.set_value(result_tag(name, "error"), [positions.tolist(), means.tolist(),
+                                              np.nan_to_num(np.abs(means - lows)).tolist(),
+                                              np.nan_to_num(np.abs(highs - means)).tolist()])
+    dpg.configure_item(result_tag(name, "plot"), label=" ".join(title.split()))
+    dpg.configure_item(result_tag(name, "x"), label=xlabel)
+    dpg.configure_item(result_tag(name, "y"), label=ylabel)
+    if labels:
+        dpg.set_axis_ticks(result_tag(name, "x"), tuple(zip(labels, positions.tolist())))
+    else:
+        dpg.reset_axis_ticks(result_tag(name, "x"))
+    dpg.fit_axis_data(result_tag(name, "x"))
+    dpg.fit_axis_data(result_tag(name, "y"))
+
+def update_results():
+    inputs = get_input_fields()
+    if inputs is None:
+        return
+    metric = dpg.get_value("results_metric")
+    df = get_df(columns=['Duration', metric])
+    if df is None:
+        return
+    if metric not in df.columns:
+        print(f"{metric} is not in the dataset.")
+        return
+    try:
+        charts = result_charts(df, inputs, graph_directory(inputs), metric)
+    except Exception as e:
+        print(f"An error occurred:\n {e}")
+        return
+    result_charts_shown.clear()
+    result_charts_shown.update(charts)
+    for name, chart in charts.items():
+        show_chart(name, chart)
+
+def show_results_callback(sender, app_data, user_data):
+    clear()
+    dpg.show_item("results_window")
+    update_results()
+
+def results_changed_callback(sender, app_data, user_data):
+    # Edited parameters redraw the results in place while the results window is open
+    if dpg.is_item_shown("results_window"):
+        update_results()
+
+def export_chart_callback(sender, app_data, user_data):
+    chart = result_charts_shown.get(user_data)
+    if not isinstance(chart, tuple):
+        print(f"No {user_data.lower()} chart to export.")
+        return
+    print(f"Generated {plot_bar_with_ci(*chart)}")
+
+def get_df(columns=None):
     inputs = get_input_fields()
     if inputs is None:
         return
@@ -167,9 +438,13 @@ def get_df():
     try:
         if ',' in file:
             files = file.split(',')
-            df = load_df(files, subreddit, filter_tags, time_input, inputs['normalize_subreddits'], inputs['normalize_inflation'])
+            df = frame_cache.load(files, subreddit, filter_tags, time_input, inputs['normalize_subreddits'], inputs['normalize_inflation'],
+                         columns, inputs['compact'], inputs['inflation_window'], inputs['subreddit_window'],
+                                    inputs['stream'], inputs['near_duplicates'])
         else:
-            df = load_df([file], subreddit, filter_tags, time_input, inputs['normalize_subreddits'], inputs['normalize_inflation'])
+            df = frame_cache.load([file], subreddit, filter_tags, time_input, inputs['normalize_subreddits'], inputs['normalize_inflation'],
+                         columns, inputs['compact'], inputs['inflation_window'], inputs['subreddit_window'],
+                                    inputs['stream'], inputs['near_duplicates'])
     except Exception as e:
         print(e)
         return
@@ -187,14 +462,14 @@ def scrape_callback(sender, app_data, user_data):
         print("Please enter a value for User/Subreddit.")
         return
     if user_subreddit == "user":
-        scrape_old_reddit(user_value, None, None)
+        scrape_old_reddit(user_value, None, None, inputs['export_csv'])
     elif user_subreddit == "subreddit":
-        scrape_old_reddit(None, user_value, time_frame)
+        scrape_old_reddit(None, user_value, time_frame, inputs['export_csv'])
 
 def scrape_gwasi_callback(sender, app_data, user_data):
     clear()
     from rtpa.scraping.gwasi import scrape_gwasi
-    scrape_gwasi()
+    scrape_gwasi(dpg.get_value("export_csv"))
 
 def main():
     global gos
@@ -228,7 +503,9 @@ def main():
                 dpg.add_input_text(tag="user_subreddit_value_input", width=section_width//2+50)
                 dpg.add_button(label="Scrape", callback=scrape_callback, width=section_width//2)
         dpg.add_spacer(height=spacing_height)
-        dpg.add_button(label="Scrape GWASI", callback=scrape_gwasi_callback, width=main_window_width+10)
+        with dpg.group(horizontal=True):
+            dpg.add_button(label="Scrape GWASI", callback=scrape_gwasi_callback, width=main_window_width-150)
+            dpg.add_checkbox(tag="export_csv", label="Also save as CSV")
         dpg.add_spacer(height=spacing_height)
         dpg.add_text("Data Loading/Filtering", color=(255,255,255), tag="data_text")
         with dpg.group(horizontal=True):
@@ -251,7 +528,7 @@ def main():
                 dpg.add_input_text(tag="subreddit_input", width=section_width)
             with dpg.group():
                 dpg.add_text("Filter Tag(s)")
-                dpg.add_input_text(tag="filter_tag_input", width=section_width)
+                dpg.add_input_text(tag="filter_tag_input", width=section_width, hint="f4m and (comfort or asmr) and not rough")
         with dpg.group(horizontal=True):
             with dpg.group():
                 dpg.add_text("Adj Upvotes by Subreddit")
@@ -259,6 +536,22 @@ def main():
             with dpg.group():
                 dpg.add_text("Adj Upvotes for Inflation")
                 dpg.add_combo(tag="normalize_inflation", items=["No","Yes"], width=section_width//2-4, default_value="No")
+            with dpg.group():
+                dpg.add_text("Compact Memory")
+                dpg.add_combo(tag="compact_memory", items=["No","Yes"], width=section_width//2-4, default_value="No")
+        with dpg.group(horizontal=True):
+            with dpg.group():
+                dpg.add_text("Subreddit Window (months)")
+                dpg.add_input_text(tag="subreddit_window_input", width=section_width//2-4)
+            with dpg.group():
+                dpg.add_text("Inflation Window (months)")
+                dpg.add_input_text(tag="inflation_window_input", width=section_width//2-4)
+            with dpg.group():
+                dpg.add_text("Streaming Load")
+                dpg.add_combo(tag="stream_loading", items=["No","Yes"], width=section_width//2-4, default_value="No")
+            with dpg.group():
+                dpg.add_text("Merge Near-Duplicates")
+                dpg.add_combo(tag="near_duplicates", items=["Off","0.9","0.8","0.7"], width=section_width//2-4, default_value="Off")
         dpg.add_spacer(height=spacing_height*1.5)
         with dpg.group(horizontal=True):
             with dpg.group():
@@ -268,9 +561,13 @@ def main():
                 dpg.add_text("Analysis Value")
                 dpg.add_input_text(tag="analysis_type_value_input", width=section_width)
                 dpg.add_text("Analysis Metric")
-                dpg.add_combo(tag="analysis_metric_dropdown", items=["Upvotes","Comments"], width=section_width, default_value="Upvotes")
+                dpg.add_combo(tag="analysis_metric_dropdown", items=["Upvotes","Comments","Fills"], width=section_width, default_value="Upvotes")
                 dpg.add_spacer(height=12)
                 dpg.add_button(label="Generate Analysis", callback=generate_analysis_callback, width=section_width)
+                dpg.add_button(label="Author Leaderboard", callback=author_leaderboard_callback, width=section_width)
+                with dpg.group(horizontal=True):
+                    dpg.add_input_text(tag="similar_author_input", width=section_width//2, hint="author")
+                    dpg.add_button(label="Similar Creators", callback=similar_creators_callback, width=section_width//2-8)
             with dpg.group():
                 dpg.add_text("Graphing", color=(255,255,255), tag="graphing_text")
                 with dpg.group(horizontal=True):
@@ -289,15 +586,72 @@ def main():
                         dpg.add_input_text(tag="minute_block_input", width=section_width//2)
                 dpg.add_text("Graph Style")
                 dpg.add_combo(tag="graph_style_dropdown", items=["Statistical Analysis","Analytics"], width=section_width, default_value="Statistical Analysis")
+                dpg.add_text("Significance Test")
+                dpg.add_combo(tag="engine_dropdown", items=["Welch's t-test","Bootstrap/Permutation"], width=section_width, default_value="Welch's t-test")
+                dpg.add_text("Quantile Graphs")
+                with dpg.group(horizontal=True):
+                    dpg.add_checkbox(tag="quantile_graphs_median", label="Median")
+                    dpg.add_checkbox(tag="quantile_graphs_p90", label="90th Percentile")
+                dpg.add_checkbox(tag="controlled_effects_graphs", label="Controlled Effects (joint regression)")
+                with dpg.group(horizontal=True):
+                    dpg.add_checkbox(tag="tag_pair_graphs", label="Tag Pairs")
+                    dpg.add_checkbox(tag="tag_trend_graphs", label="Tag Trends (6 month windows)")
+                dpg.add_text("Graph Metrics")
+                with dpg.group(horizontal=True):
+                    dpg.add_checkbox(tag="graph_metric_upvotes", label="Upvotes", default_value=True)
+                    dpg.add_checkbox(tag="graph_metric_comments", label="Comments")
+                    dpg.add_checkbox(tag="graph_metric_fills", label="Fills")
+                with dpg.group(horizontal=True):
+                    dpg.add_checkbox(tag="preview_graphs", label="Preview from samples first")
+                    dpg.add_checkbox(tag="parallel_graphs", label="Render in parallel")
                 dpg.add_spacer(height=12)
-                dpg.add_button(label="Generate Graphs", callback=generate_graphs_callback, width=section_width)
+                with dpg.group(horizontal=True):
+                    dpg.add_button(label="Generate Graphs", tag="generate_graphs_button", callback=generate_graphs_callback,
+                                   width=section_width//2)
+                    dpg.add_button(label="Show Results", callback=show_results_callback, width=section_width//2-8)
         dpg.add_spacer(height=spacing_height)
         with dpg.child_window(label="Console", width=section_width*2+5, height=bottom_section_height, border=True):
             dpg.add_text("Console Output:", tag="console_output", wrap=section_width*2-30)
+    with dpg.window(label="Results", tag="results_window", show=False, width=main_window_width,
+                    height=main_window_height - 100, pos=(20, 60)):
+        with dpg.group(horizontal=True):
+            dpg.add_combo(tag="results_metric", items=["Upvotes","Comments","Fills"], width=section_width//2,
+                          default_value="Upvotes", callback=results_changed_callback)
+            dpg.add_button(label="Refresh", callback=results_changed_callback)
+        with dpg.tab_bar():
+            for name in RESULT_TABS:
+                with dpg.tab(label=name):
+                    with dpg.plot(tag=result_tag(name, "plot"), label=name, width=-1, height=-30):
+                        dpg.add_plot_legend()
+                        dpg.add_plot_axis(dpg.mvXAxis, tag=result_tag(name, "x"))
+                        with dpg.plot_axis(dpg.mvYAxis, tag=result_tag(name, "y")):
+                            dpg.add_bar_series([], [], label="Significant", weight=0.8, tag=result_tag(name, "sig"))
+                            dpg.add_bar_series([], [], label="Not Significant", weight=0.8,
+                                               tag=result_tag(name, "non_sig"))
+                            dpg.add_error_series([], [], [], [], label="CI", tag=result_tag(name, "error"))
+                    dpg.add_button(label="Export PNG", callback=export_chart_callback, user_data=name)
+    # Bars coloured as in the PNG graphs
+    for series, color in [("sig", SIG_COLOR), ("non_sig", NON_SIG_COLOR)]:
+        with dpg.theme() as theme:
+            with dpg.theme_component(dpg.mvBarSeries):
+                dpg.add_theme_color(dpg.mvPlotCol_Fill, [int(c * 255) for c in to_rgb(color)],
+                                    category=dpg.mvThemeCat_Plots)
+        for name in RESULT_TABS:
+            dpg.bind_item_theme(result_tag(name, series), theme)
+    # Text fields only count as changed once their edit is finished
+    with dpg.item_handler_registry(tag="results_inputs_handler"):
+        dpg.add_item_deactivated_after_edit_handler(callback=results_changed_callback)
+    for item in ["file_input", "subreddit_input", "filter_tag_input", "n_common_tags_input", "hour_block_input",
+                 "minute_block_input", "subreddit_window_input", "inflation_window_input"]:
+        dpg.bind_item_handler_registry(item, "results_inputs_handler")
+    for item in ["confidence_level_input", "time_input", "engine_dropdown", "normalize_subreddits",
+                 "normalize_inflation", "near_duplicates"]:
+        dpg.configure_item(item, callback=results_changed_callback)
     dpg.create_viewport(title='Reddit Tagged Posts Analyzer', width=main_window_width+window_padding_width, height=main_window_height+int(1.6*window_padding_height))
     dpg.setup_dearpygui()
     dpg.show_viewport()
     dpg.start_dearpygui()
+    stop_preview()
     dpg.destroy_context()
 
 if __name__ == '__main__':
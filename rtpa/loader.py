@@ -1,95 +1,514 @@
+import hashlib
+import json
 import os
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 from dateutil import tz
+from rtpa import store
 from rtpa.exceptions import InsufficientData
+from rtpa.memo import frame_memo
+from rtpa.near_duplicates import near_duplicate_clusters
+from rtpa.stats import aggregate_cube
+from rtpa.tags import tag_index, query_tags, combine_filters
 
+CACHE_DIR = os.path.join("data", ".cache")
+CACHE_VERSION = 1
+DEDUPE_RULES = {
+    'Tags': 'first', 'Upvotes': 'max', 'Comments': 'max',
+    'Post URL': 'first', 'Timestamp': 'first', 'Audio Link': 'first',
+    'Duration': 'first', 'Fills': 'first', 'Hour_UTC': 'first', 'Hour_Local': 'first', 'Day_Local': 'first'
+}
+REQUIRED_COLUMNS = ['Title', 'Subreddit', 'Author', 'Tags', 'Upvotes', 'Timestamp', 'Hour_UTC', 'Hour_Local', 'Day_Local']
+DEDUPE_KEY = ['Title', 'Subreddit', 'Author']
+CATEGORICAL_COLUMNS = ['Subreddit', 'Author', 'Tags']
+DERIVED_COLUMNS = ['Timestamp_Local', 'Adjusted Upvotes', 'Scaling Factor', 'NormalizedUpvotes', 'YearMonth']
 
-def add_adjusted_upvotes(df):
-    if len(df) < 1000:
-        print("Error: Less than 1,000 posts. Inflation adjustment would probably be inaccurate. Aborting adjustment.")
-        return df
 
-    df['YearMonth'] = df['Timestamp'].dt.to_period('M')
-    monthly_upvotes = df.groupby('YearMonth')['Upvotes'].mean()
-    window_size = 1
-    monthly_upvotes = monthly_upvotes.rolling(window_size, center=False).mean()
+def year_months(timestamps):
+    return timestamps.dt.tz_localize(None).dt.to_period('M').rename('YearMonth')
+
+
+def table_path(key):
+    return os.path.join(CACHE_DIR, "tables", f"{key}.json")
+
+
+def load_table(key, index_names):
+    if key is None or not os.path.exists(table_path(key)):
+        return None
+    with open(table_path(key), 'r') as f:
+        table = pd.DataFrame(json.load(f))
+    if 'YearMonth' in table.columns:
+        table['YearMonth'] = pd.PeriodIndex(table['YearMonth'], freq='M')
+    return table.set_index(index_names)['Scaling Factor']
+
 
-    # Fill NaN values for the first and last few points
-    for i in range(window_size - 1):
-        monthly_upvotes.iloc[i] = monthly_upvotes.iloc[i + 1:i + window_size].mean()
-    for i in range(window_size - 1, 0, -1):
-        monthly_upvotes.iloc[-i] = monthly_upvotes.iloc[-i - window_size:-i].mean()
+def save_table(key, table):
+    if key is None:
+        return
+    records = table.rename('Scaling Factor').reset_index()
+    if 'YearMonth' in records.columns:
+        records['YearMonth'] = records['YearMonth'].astype(str)
+    try:
+        os.makedirs(os.path.dirname(table_path(key)), exist_ok=True)
+        records.to_json(table_path(key), orient='records', double_precision=15)
+    except OSError as e:
+        print(f"Could not save scaling table: {e}")
 
+
+def describes_posts(stats, df, metric):
+    # Whether aggregated rows, n and sum of metric add up to the posts' own, so aggregates of other posts are not used
+    values = pd.to_numeric(df[metric], errors='coerce')
+    return (stats['rows'].sum() == len(df) and stats['n'].sum() == values.notna().sum() and
+            stats['sum'].sum() == values.fillna(0).astype('int64').sum())
+
+
+def fit_inflation_table(df, window_size=1, monthly=None):
+    if monthly is not None and describes_posts(monthly, df, 'Upvotes'):
+        # Monthly means kept up to date by the post store
+        monthly = monthly.sort_values('month')
+        monthly_upvotes = pd.Series((monthly['sum'] / monthly['n']).to_numpy(),
+                                    index=pd.PeriodIndex(monthly['month'], freq='M', name='YearMonth'),
+                                    name='Upvotes')
+    else:
+        monthly_upvotes = df.groupby('YearMonth')['Upvotes'].mean()
+    monthly_upvotes = monthly_upvotes.rolling(window_size, min_periods=1).mean()
     baseline_upvotes = monthly_upvotes.max()
     baseline_period = monthly_upvotes.idxmax()
     print(f"Baseline period: {baseline_period}, Baseline mean upvotes: {baseline_upvotes}")
+    return baseline_upvotes / monthly_upvotes
+
+
+def add_adjusted_upvotes(df, window_size=1, cache_key=None, monthly=None):
+    if len(df) < 1000:
+        print("Error: Less than 1,000 posts. Inflation adjustment would probably be inaccurate. Aborting adjustment.")
+        return df
+
+    df['YearMonth'] = year_months(df['Timestamp'])
+    key = f"{cache_key}_inflation_{window_size}" if cache_key else None
+    scaling_factors = load_table(key, 'YearMonth')
+    if scaling_factors is None:
+        scaling_factors = fit_inflation_table(df, window_size, monthly)
+        save_table(key, scaling_factors)
+    else:
+        print(f"Reusing monthly scaling factors (window of {window_size} month(s)).")
 
-    scaling_factors = baseline_upvotes / monthly_upvotes
-    df['Adjusted Upvotes'] = df.apply(
-        lambda row: row['Upvotes'] * scaling_factors.get(row['Timestamp'].to_period('M'), 1),
-        axis=1
-    )
-    df['Scaling Factor'] = df['Timestamp'].apply(lambda ts: scaling_factors.get(ts.to_period('M'), 1))
+    df['Scaling Factor'] = df['YearMonth'].map(scaling_factors).fillna(1).astype(float)
+    df['Adjusted Upvotes'] = df['Upvotes'] * df['Scaling Factor']
     df['Upvotes'] = df['Adjusted Upvotes']
     return df
 
 
-def normalize_upvotes_across_subreddits(df):
-    subreddit_upvotes = df.groupby('Subreddit')['Upvotes'].mean()
-    baseline_upvotes = subreddit_upvotes.max()
-    scaling_factors = baseline_upvotes / subreddit_upvotes
+def fit_subreddit_table(df, window_size=None):
+    if window_size is None:
+        subreddit_upvotes = df.groupby('Subreddit', observed=True)['Upvotes'].mean()
+        return subreddit_upvotes.max() / subreddit_upvotes
+    # Per-month factors, smoothed per subreddit and scaled against the best subreddit of each month
+    monthly_upvotes = df.groupby(['Subreddit', year_months(df['Timestamp'])], observed=True)['Upvotes'].mean()
+    monthly_upvotes = monthly_upvotes.groupby(level=0, observed=True).transform(
+        lambda x: x.rolling(window_size, min_periods=1).mean())
+    return monthly_upvotes.groupby(level=1).transform('max') / monthly_upvotes
+
+
+def normalize_upvotes_across_subreddits(df, window_size=None, cache_key=None):
+    key = f"{cache_key}_subreddit_{window_size}" if cache_key else None
+    index_names = 'Subreddit' if window_size is None else ['Subreddit', 'YearMonth']
+    scaling_factors = load_table(key, index_names)
+    if scaling_factors is None:
+        scaling_factors = fit_subreddit_table(df, window_size)
+        save_table(key, scaling_factors)
+    else:
+        print("Reusing subreddit scaling factors.")
 
-    df['NormalizedUpvotes'] = df.apply(
-        lambda row: row['Upvotes'] * scaling_factors.get(row['Subreddit'], 1),
-        axis=1
-    )
-    print(df.groupby('Subreddit').apply(lambda x: x.sample(min(len(x), 3)))[
-              ['Subreddit', 'Upvotes', 'NormalizedUpvotes']])
+    if window_size is None:
+        factors = scaling_factors.reindex(df['Subreddit'].astype(object))
+    else:
+        factors = scaling_factors.reindex(pd.MultiIndex.from_arrays(
+            [df['Subreddit'].astype(object), year_months(df['Timestamp'])]))
+    df['NormalizedUpvotes'] = df['Upvotes'] * factors.fillna(1).to_numpy()
+    print(df.groupby('Subreddit', observed=True).head(3)[['Subreddit', 'Upvotes', 'NormalizedUpvotes']])
     df['Upvotes'] = df['NormalizedUpvotes']
     return df
 
 
-def load_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits=False, adjust_inflation=False):
-    dfs = []
+def is_store_source(filename):
+    return filename == "store" or filename.startswith("store:")
+
+
+def store_sources(filenames):
+    # "store" selects every stored post, "store:<name>" only the posts scraped into <name>
+    if "store" in filenames:
+        return None
+    return [filename[len("store:"):] for filename in filenames]
+
+
+def file_signature(filename):
+    return source_signature(store.STORE_PATH if is_store_source(filename) else f"data/{filename}")
+
+
+def dataset_key(filenames):
+    signatures = [[filename, file_signature(filename)] for filename in filenames]
+    return hashlib.sha1(json.dumps(signatures).encode()).hexdigest()[:16]
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'tz': list(time.tzname), 'utc_offset': time.timezone,
+            'version': CACHE_VERSION}
+
+
+def sidecar_paths(filename):
+    name = filename[:-len(".csv")] if filename.endswith(".csv") else filename
+    return os.path.join(CACHE_DIR, f"{name}.parquet"), os.path.join(CACHE_DIR, f"{name}.json")
+
+
+def dedupe_posts(df):
+    agg = {column: rule for column, rule in DEDUPE_RULES.items() if column in df.columns}
+    return df.groupby(DEDUPE_KEY, as_index=False, observed=True).agg(agg)
+
+
+def merge_near_duplicates(df, threshold, cache_key=None):
+    # Posts by the same author with near-identical titles (edited cross-posts, trailing tags, emoji) are merged
+    # with the same rules as exact duplicates
+    size = len(df)
+    labels = near_duplicate_clusters(df['Title'].to_numpy(dtype=object), df['Author'].to_numpy(dtype=object),
+                                     threshold, cache_key)
+    agg = {column: rule for column, rule in DEDUPE_RULES.items() if column in df.columns}
+    agg.update({column: 'first' for column in DEDUPE_KEY})
+    df = df.groupby(labels, sort=False).agg(agg)[list(df.columns)]
+    df = df.sort_values(DEDUPE_KEY, kind='stable').reset_index(drop=True)
+    print(f"Merged {size - len(df)} near-duplicate posts (similarity >= {threshold}). ({size} -> {len(df)})")
+    return df
+
+
+@contextmanager
+def peak_memory(enabled):
+    # Tracing slows every allocation down, so only compact loads report their peak
+    if not enabled or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+        print(f"Peak memory while loading: {tracemalloc.get_traced_memory()[1] / 1024 ** 2:.1f} MB")
+    finally:
+        tracemalloc.stop()
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def compact_df(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in ['Hour_UTC', 'Hour_Local', 'Day_Local']:
+        if column in df.columns:
+            df[column] = df[column].astype('int8')
+    if 'Upvotes' in df.columns:
+        upvotes = pd.to_numeric(df['Upvotes'], errors='coerce')
+        is_whole = upvotes.notna().all() and (upvotes % 1 == 0).all()
+        df['Upvotes'] = upvotes.astype('int32' if is_whole else 'float32')
+    for column in ['Comments', 'Fills']:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float32')
+    return df
+
+
+def unify_categories(dfs):
+    # Concatenating categoricals with different categories silently falls back to object columns
+    for column in CATEGORICAL_COLUMNS:
+        if all(column in df.columns for df in dfs):
+            categories = pd.api.types.union_categoricals([df[column] for df in dfs]).categories
+            for df in dfs:
+                df[column] = df[column].cat.set_categories(categories)
+    return dfs
+
+
+def add_time_columns(df):
     local_zone = tz.tzlocal()
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], utc=True)
+    df['Hour_UTC'] = df['Timestamp'].dt.hour
+    timestamp_local = df['Timestamp'].dt.tz_convert(local_zone)
+    df['Hour_Local'] = timestamp_local.dt.hour
+    df['Day_Local'] = timestamp_local.dt.dayofweek
+    return df
+
+
+def fresh_sidecar_columns(filename):
+    parquet_path, meta_path = sidecar_paths(filename)
+    if not os.path.exists(parquet_path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return meta['columns'] if meta['signature'] == source_signature(f"data/{filename}") else None
+
+
+def partition_dir(filename):
+    return os.path.join("data", filename[:-len(".csv")] if filename.endswith(".csv") else filename)
+
+
+def partition_manifest(filename):
+    path = os.path.join(partition_dir(filename), "_manifest.json")
+    if not os.path.exists(path) or not os.path.exists(f"data/{filename}"):
+        return None
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    return manifest if manifest['signature'] == source_signature(f"data/{filename}") else None
+
+
+def partition_csv(filename):
+    if not filename.endswith(".csv"):
+        filename += ".csv"
+    signature = source_signature(f"data/{filename}")
+    df = add_time_columns(dedupe_posts(pd.read_csv(f"data/{filename}")))
+    root = partition_dir(filename)
+    staging = root + ".partitioning"
+    shutil.rmtree(staging, ignore_errors=True)
+    partitions = []
+    for (subreddit, month), part in df.groupby(['Subreddit', year_months(df['Timestamp'])], observed=True):
+        path = os.path.join(f"subreddit={subreddit}", f"month={month}", "part-0.parquet")
+        os.makedirs(os.path.dirname(os.path.join(staging, path)), exist_ok=True)
+        part.to_parquet(os.path.join(staging, path), index=False)
+        partitions.append({'subreddit': subreddit, 'month': str(month), 'path': path, 'posts': len(part)})
+    with open(os.path.join(staging, "_manifest.json"), 'w') as f:
+        json.dump({'signature': signature, 'columns': list(df.columns), 'partitions': partitions}, f)
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(staging, root)
+    print(f"Saved {len(partitions)} partitions of {filename} to {root}/.")
+
+
+def export_csv(df, filename):
+    # Saves scraped posts to data/<filename> with its partitions, so they also load as a file
+    os.makedirs("data", exist_ok=True)
+    df.to_csv(f"data/{filename}", index=False)
+    print(f"Saved data/{filename}.")
+    partition_csv(filename)
+
+
+def read_partitions(filename, manifest, columns=None, subreddit=None, time_cutoff=None):
+    parts = pd.DataFrame(manifest['partitions'], columns=['subreddit', 'month', 'path', 'posts'])
+    if subreddit:
+        parts = parts[parts['subreddit'].str.lower() == subreddit.lower()]
+    skipped = parts.iloc[0:0]
+    since = None
+    if time_cutoff is not None and len(parts) > 0:
+        # Two extra months cover the two-week margin and the gap between the latest post and its month
+        months = pd.PeriodIndex(parts['month'], freq='M')
+        since = months.max() - (time_cutoff + 2)
+        skipped = parts[months < since]
+        parts = parts[months >= since]
+        since = since.start_time.tz_localize('UTC')
+    if columns is not None:
+        columns = [c for c in columns if c in manifest['columns']]
+    dfs = [pd.read_parquet(os.path.join(partition_dir(filename), path), columns=columns) for path in parts['path']]
+    df = pd.concat(dfs) if dfs else pd.DataFrame(columns=columns or manifest['columns'])
+    print(f"Read {len(parts)} of {len(manifest['partitions'])} partitions of {filename}.")
+    return df, skipped, since
+
+
+def from_store(df):
+    if df.duplicated(DEDUPE_KEY).any():
+        df = dedupe_posts(df)
+    else:
+        df = df.dropna(subset=DEDUPE_KEY).sort_values(DEDUPE_KEY, kind='stable').reset_index(drop=True)
+    return add_time_columns(df)
+
+
+def read_source(filename, columns=None):
+    if is_store_source(filename):
+        print(f"Loading {filename} from {store.STORE_PATH}...")
+        return from_store(store.query_posts(store_sources([filename]), columns=columns))
+    manifest = partition_manifest(filename)
+    if manifest is not None:
+        df, _, _ = read_partitions(filename, manifest, columns)
+        return df.sort_values(DEDUPE_KEY, kind='stable').reset_index(drop=True)
+    parquet_path, meta_path = sidecar_paths(filename)
+    cached_columns = fresh_sidecar_columns(filename)
+    if cached_columns is not None:
+        print(f"Loading {filename} from cache...")
+        if columns is not None:
+            columns = [c for c in columns if c in cached_columns]
+        return pd.read_parquet(parquet_path, columns=columns)
+
+    print(f"Loading {filename}...")
+    signature = source_signature(f"data/{filename}")
+    df = pd.read_csv(f"data/{filename}")
+    size = len(df)
+    df = dedupe_posts(df)
+    print(f"Dropped {size - len(df)} duplicate posts from {filename}. ({size} -> {len(df)})")
+    df = add_time_columns(df)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(parquet_path, index=False)
+        with open(meta_path, 'w') as f:
+            json.dump({'signature': signature, 'columns': list(df.columns)}, f)
+    except (OSError, ImportError, ValueError) as e:
+        print(f"Could not write cache for {filename}: {e}")
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def iter_source_chunks(filename, columns, chunksize):
+    if is_store_source(filename):
+        for chunk in store.iter_posts(store_sources([filename]), columns=columns, chunksize=chunksize):
+            yield add_time_columns(chunk)
+        return
+    cached_columns = fresh_sidecar_columns(filename)
+    if cached_columns is not None:
+        import pyarrow.parquet as pq
+        if columns is not None:
+            columns = [c for c in columns if c in cached_columns]
+        for batch in pq.ParquetFile(sidecar_paths(filename)[0]).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    usecols = None if columns is None else (lambda c: c in columns)
+    for chunk in pd.read_csv(f"data/{filename}", chunksize=chunksize, usecols=usecols):
+        yield add_time_columns(chunk)
+
+
+def tag_filter_mask(tags, filter_tags):
+    return query_tags(tags.reset_index(drop=True), filter_tags)
+
+
+def merge_into(retained, chunk):
+    # Rows of the chunk whose key is already retained update it with the usual max/first rules
+    overlap = chunk.index.isin(retained.index)
+    updates = chunk[overlap]
+    if len(updates) > 0:
+        current = retained.loc[updates.index]
+        for column, rule in DEDUPE_RULES.items():
+            if column not in chunk.columns:
+                continue
+            if rule == 'max':
+                merged = np.fmax(pd.to_numeric(current[column], errors='coerce'),
+                                 pd.to_numeric(updates[column], errors='coerce'))
+            else:
+                merged = current[column].where(current[column].notna(), updates[column])
+            retained.loc[updates.index, column] = merged
+    return pd.concat([retained, chunk[~overlap]])
+
+
+def stream_dataset(filenames, subreddit=None, filter_tags=(), time_cutoff=None, columns=None, chunksize=100_000):
+    retained = None
+    dropped_keys = np.empty(0, dtype=np.uint64)
+    pruned_counts = {}
+    prune_limit = None
+    running_max = None
+    read = 0
     for filename in filenames:
-        if not filename.endswith(".csv"):
-            filename += ".csv"
-        if not os.path.exists("data"):
-            os.mkdir("data")
-        print(f"Loading {filename}...")
-        df = pd.read_csv(f"data/{filename}")
-        dfs.append(df)
-    df = pd.concat(dfs)
+        print(f"Streaming {filename}...")
+        for chunk in iter_source_chunks(filename, columns, chunksize):
+            read += len(chunk)
+            chunk = chunk.dropna(subset=DEDUPE_KEY)
+            if subreddit:
+                chunk = chunk[chunk['Subreddit'].str.lower() == subreddit.lower()]
+            chunk.index = pd.util.hash_pandas_object(chunk[DEDUPE_KEY], index=False).to_numpy()
+            if len(dropped_keys) > 0:
+                chunk = chunk[~np.isin(chunk.index.to_numpy(), dropped_keys)]
+            # A new post whose first tags miss a filter tag can never pass it, so its key is remembered and skipped
+            rejected = pd.Series(chunk['Tags'].notna().to_numpy() & ~tag_filter_mask(chunk['Tags'], filter_tags),
+                                 index=chunk.index)
+            if rejected.any():
+                first_rejected = rejected.groupby(level=0, sort=False).first()
+                rejected_keys = first_rejected.index[first_rejected.to_numpy()].to_numpy()
+                if retained is not None:
+                    rejected_keys = rejected_keys[~np.isin(rejected_keys, retained.index.to_numpy())]
+                dropped_keys = np.union1d(dropped_keys, rejected_keys)
+                chunk = chunk[~np.isin(chunk.index.to_numpy(), rejected_keys)]
+            agg = {column: rule for column, rule in DEDUPE_RULES.items() if column in chunk.columns}
+            agg.update({column: 'first' for column in DEDUPE_KEY})
+            chunk = chunk.groupby(level=0, sort=False).agg(agg)
+            retained = chunk if retained is None else merge_into(retained, chunk)
+
+            if time_cutoff is not None and len(retained) > 0:
+                running_max = max(running_max, retained['Timestamp'].max()) if running_max else retained['Timestamp'].max()
+                # A month of slack keeps the final cut-off, which sits a little below the running maximum, exact
+                prune_limit = running_max - pd.Timedelta(days=14 + 30 * time_cutoff + 30)
+                expired = (retained['Timestamp'] <= prune_limit).to_numpy()
+                if expired.any():
+                    dropped_keys = np.union1d(dropped_keys, retained.index[expired].to_numpy())
+                    expired_posts = retained[expired]
+                    expired_posts = expired_posts[tag_filter_mask(expired_posts['Tags'], filter_tags)]
+                    for sub, count in expired_posts['Subreddit'].value_counts().items():
+                        pruned_counts[sub] = pruned_counts.get(sub, 0) + count
+                    retained = retained[~expired]
+        print(f"Streamed {read} posts so far, {len(retained) if retained is not None else 0} retained.")
+    if retained is None:
+        raise InsufficientData()
+    df = retained.sort_values(DEDUPE_KEY, kind='stable').reset_index(drop=True)
+    return df, prune_limit, pruned_counts
+
+
+def read_dataset(filenames, normalize_subreddits=False, adjust_inflation=False, columns=None, compact=False,
+                 inflation_window=1, subreddit_window=None, near_duplicates=None):
+    if not os.path.exists("data"):
+        os.mkdir("data")
+    filenames = csv_filenames(filenames)
+    dfs = [read_source(filename, required_columns(columns)) for filename in filenames]
+    if compact:
+        size_before = sum(memory_mb(df) for df in dfs)
+        dfs = unify_categories([compact_df(df) for df in dfs])
+    df = pd.concat(dfs) if len(dfs) > 1 else dfs[0]
     print(f"Loaded {len(filenames)} file(s) for a total of {len(df)} posts.")
+    if compact:
+        print(f"Compacted loaded posts in memory. ({size_before:.1f} MB -> {memory_mb(df):.1f} MB)")
+
+    # Drop duplicates by Title, Subreddit, and Author (each file is already deduplicated on its own)
+    if len(dfs) > 1:
+        size = len(df)
+        df = dedupe_posts(df)
+        print(f"Dropped {size - len(df)} duplicate posts. ({size} -> {len(df)})")
+    return prepare_dataset(df, filenames, normalize_subreddits, adjust_inflation, compact,
+                           inflation_window, subreddit_window, near_duplicates)
 
-    # Drop duplicates by Title, Subreddit, and Author
-    size = len(df)
-    df = df.groupby(['Title', 'Subreddit', 'Author'], as_index=False).agg({
-        'Tags': 'first', 'Upvotes': 'max', 'Comments': 'max',
-        'Post URL': 'first', 'Timestamp': 'first', 'Audio Link': 'first',
-        'Duration': 'first', 'Fills': 'first'
-    })
-    print(f"Dropped {size - len(df)} duplicate posts. ({size} -> {len(df)})")
-
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Hour_UTC'] = df['Timestamp'].dt.hour
-    df['Timestamp_Local'] = df['Timestamp'].dt.tz_convert(local_zone)
-    df['Hour_Local'] = df['Timestamp_Local'].dt.hour
-    df['Day_Local'] = df['Timestamp_Local'].dt.dayofweek
+
+def prepare_dataset(df, filenames, normalize_subreddits=False, adjust_inflation=False, compact=False,
+                    inflation_window=1, subreddit_window=None, near_duplicates=None):
+    key = dataset_key(filenames)
+    if near_duplicates:
+        df = merge_near_duplicates(df, near_duplicates, key)
+        key += f"_near_{near_duplicates}"
+    df['Timestamp_Local'] = df['Timestamp'].dt.tz_convert(tz.tzlocal())
 
     if normalize_subreddits:
         print("Normalizing upvotes across subreddits...")
-        df = normalize_upvotes_across_subreddits(df)
+        df = normalize_upvotes_across_subreddits(df, subreddit_window, key)
+        key += f"_subreddit_{subreddit_window}"
     if adjust_inflation:
         print("Adjusting upvotes for inflation...")
-        df = add_adjusted_upvotes(df)
+        monthly = None
+        if not normalize_subreddits and len(filenames) == 1 and is_store_source(filenames[0]):
+            monthly = store.read_aggregates('month_cells', (store_sources(filenames) or [None])[0])
+        df = add_adjusted_upvotes(df, inflation_window, key, monthly)
+    if compact:
+        df = compact_df(df)
+    return df
+
+
+def csv_filenames(filenames):
+    return [filename if filename.endswith(".csv") or is_store_source(filename) else filename + ".csv"
+            for filename in filenames]
+
 
+def required_columns(columns):
+    if columns is None:
+        return None
+    return list(dict.fromkeys(REQUIRED_COLUMNS + [c for c in columns if c not in DERIVED_COLUMNS]))
+
+
+def filter_df(df, subreddit, filter_tags, time_cutoff, extra_counts=None):
+    # The filters applied to the posts of every load path, whatever they already skipped while reading
     size = len(df)
-    for filter_tag in filter_tags:
-        tag = filter_tag.strip().lower()
-        df = df[df['Tags'].str.contains(tag, na=False)]
-        print(f"Filtered out {size - len(df)} posts not containing {tag}.")
+    expression = combine_filters(filter_tags)
+    if expression is not None:
+        df = df[tag_index(df).query(expression)]
+        print(f"Filtered out {size - len(df)} posts not matching {', '.join(filter_tags)}.")
         size = len(df)
     if subreddit:
         df = df[df['Subreddit'].str.lower() == subreddit.lower()]
@@ -101,10 +520,14 @@ def load_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits
     df = df[df['Timestamp_Local'] < df['Timestamp_Local'].max() - pd.Timedelta(days=14)]
     print(f"Filtered out {size - len(df)} posts within 2 weeks of the latest post.")
 
-    if len(df.groupby('Subreddit').filter(lambda x: len(x) < 3)) > 0:
+    # Posts that were skipped while reading (extra_counts) still count towards their subreddit's total
+    sizes = df.groupby('Subreddit', observed=True)['Subreddit'].transform('size')
+    if extra_counts:
+        sizes = sizes + df['Subreddit'].astype(object).map(extra_counts).fillna(0).to_numpy()
+    if (sizes < 3).any():
         size = len(df)
         print("Filtering out subreddits with insufficient data...")
-        df = df.groupby('Subreddit').filter(lambda x: len(x) >= 3)
+        df = df[(sizes >= 3).to_numpy()]
         print(f"Filtered out subreddits with less than 3 posts. ({size} -> {len(df)})")
 
     if time_cutoff is not None:
@@ -112,3 +535,196 @@ def load_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits
         df = df[df['Timestamp_Local'] > df['Timestamp_Local'].max() - pd.Timedelta(days=30 * time_cutoff)]
         print(f"Filtered out {size - len(df)} posts before {time_cutoff} months ago.")
     return df
+
+
+def time_pushdown_is_exact(df, time_cutoff, prune_limit):
+    # Posts skipped before prune_limit must also fall before the final time cut-off
+    if prune_limit is None:
+        return True
+    return len(df) > 0 and prune_limit <= df['Timestamp'].max() - pd.Timedelta(days=30 * time_cutoff)
+
+
+def stream_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits=False, adjust_inflation=False,
+              columns=None, compact=False, inflation_window=1, subreddit_window=None, chunksize=100_000,
+              time_pushdown=True, near_duplicates=None):
+    if not os.path.exists("data"):
+        os.mkdir("data")
+    filenames = csv_filenames(filenames)
+    # Dataset-wide normalization needs every post, so only the deduplication is streamed in that case
+    pushdown = not (normalize_subreddits or adjust_inflation)
+    df, prune_limit, pruned_counts = stream_dataset(
+        filenames, subreddit if pushdown else None, filter_tags if pushdown else [],
+        time_cutoff if pushdown and time_pushdown else None, required_columns(columns), chunksize)
+    print(f"Streamed {len(filenames)} file(s), keeping {len(df)} deduplicated posts.")
+    df = prepare_dataset(df, filenames, normalize_subreddits, adjust_inflation, compact,
+                         inflation_window, subreddit_window, near_duplicates)
+    return df, prune_limit, pruned_counts
+
+
+def reads_partitions(filenames, normalize_subreddits=False, adjust_inflation=False):
+    # Dataset-wide normalization needs every partition, so those loads go through read_dataset
+    if normalize_subreddits or adjust_inflation:
+        return False
+    return all(partition_manifest(filename) is not None for filename in csv_filenames(filenames))
+
+
+def refresh_partitions(filenames, normalize_subreddits=False, adjust_inflation=False):
+    # CSVs that were changed, exported by hand or saved before partitioning existed get their partitions on first load
+    filenames = csv_filenames(filenames)
+    if normalize_subreddits or adjust_inflation or any(is_store_source(filename) for filename in filenames):
+        return
+    for filename in filenames:
+        if os.path.exists(f"data/{filename}") and partition_manifest(filename) is None:
+            partition_csv(filename)
+
+
+def skipped_counts(filenames, skipped, df, filter_tags):
+    if len(filenames) == 1 and not filter_tags:
+        return skipped[0].groupby('subreddit')['posts'].sum().to_dict()
+    # Deduplicating and tag-filtering the skipped posts only needs their keys and tags
+    keys = [pd.read_parquet(os.path.join(partition_dir(filename), path), columns=DEDUPE_KEY + ['Tags'])
+            for filename, parts in zip(filenames, skipped) for path in parts['path']]
+    if not keys:
+        return {}
+    keys = pd.concat(keys).dropna(subset=DEDUPE_KEY).drop_duplicates(DEDUPE_KEY)
+    keys = keys[tag_filter_mask(keys['Tags'], filter_tags)]
+    retained = pd.MultiIndex.from_frame(df[DEDUPE_KEY].astype(object))
+    keys = keys[~pd.MultiIndex.from_frame(keys[DEDUPE_KEY]).isin(retained)]
+    return keys['Subreddit'].value_counts().to_dict()
+
+
+def partitioned_df(filenames, subreddit, filter_tags, time_cutoff, columns=None, compact=False, time_pushdown=True,
+                   near_duplicates=None):
+    filenames = csv_filenames(filenames)
+    dfs, skipped, prune_limit = [], [], None
+    for filename in filenames:
+        df, skipped_parts, since = read_partitions(filename, partition_manifest(filename), required_columns(columns),
+                                                   subreddit, time_cutoff if time_pushdown else None)
+        dfs.append(df)
+        skipped.append(skipped_parts)
+        if since is not None:
+            prune_limit = since if prune_limit is None else max(prune_limit, since)
+    df = pd.concat(dfs) if len(dfs) > 1 else dfs[0]
+    df = dedupe_posts(df) if len(dfs) > 1 else df.sort_values(DEDUPE_KEY, kind='stable').reset_index(drop=True)
+    print(f"Loaded {len(df)} posts from {len(filenames)} partitioned file(s).")
+    if len(df) > 0:
+        df = prepare_dataset(df, filenames, compact=compact, near_duplicates=near_duplicates)
+    return df, prune_limit, skipped_counts(filenames, skipped, df, filter_tags)
+
+
+def reads_store(filenames, normalize_subreddits=False, adjust_inflation=False):
+    if normalize_subreddits or adjust_inflation:
+        return False
+    return all(is_store_source(filename) for filename in filenames)
+
+
+def store_df(filenames, subreddit, filter_tags, time_cutoff, columns=None, compact=False, time_pushdown=True,
+             near_duplicates=None):
+    sources = store_sources(filenames)
+    tags = combine_filters(filter_tags)
+    since, skipped = None, {}
+    if time_cutoff is not None and time_pushdown:
+        latest = store.latest_timestamp(sources, subreddit, tags)
+        if latest is not None:
+            since = latest - pd.Timedelta(days=14 + 30 * time_cutoff + 30)
+            skipped = store.counts_until(since, sources, subreddit, tags)
+    df = store.query_posts(sources, subreddit, tags, since, required_columns(columns))
+    print(f"Loaded {len(df)} posts from {store.STORE_PATH}.")
+    if len(df) > 0:
+        df = prepare_dataset(from_store(df), filenames, compact=compact, near_duplicates=near_duplicates)
+    return df, since, skipped
+
+
+def seed_store_cubes(df, filenames, subreddit):
+    # Without tag or time filters the breakdown statistics follow from the store's aggregates, corrected for the
+    # few posts the loader merges or drops, so they are not recomputed from the rows
+    sources = store_sources(filenames)
+    if (sources is not None and len(sources) != 1) or len(df) < 1 or 'Duration' not in df.columns:
+        return
+    source = sources[0] if sources else ''
+    cutoff = store.latest_timestamp(sources, subreddit) - pd.Timedelta(days=14)
+    unsettled = store.unsettled_posts(cutoff - pd.Timedelta(seconds=1), sources, subreddit)
+    kept = df[pd.MultiIndex.from_frame(df[DEDUPE_KEY].astype(object)).isin(
+        pd.MultiIndex.from_frame(unsettled[DEDUPE_KEY]))]
+    kept = kept.reindex(columns=unsettled.columns).astype({'Tags': object, 'Subreddit': object})
+    corrections = [store.post_aggregates(posts.reset_index(drop=True).assign(source=source), sign)
+                   for posts, sign in [(unsettled, -1), (kept, 1)] if len(posts) > 0]
+    metrics = [metric for metric in store.METRICS if metric in df.columns]
+    tables = {'cells': [], 'tag_cells': [], 'cell_sketches': [], 'tag_sketches': []}
+    for metric in metrics:
+        column = store.METRICS[metric]
+        for name in tables:
+            table = store.read_aggregates(name, source, metric)
+            if table is None:
+                return
+            table = pd.concat([table] + [c[name][c[name]['metric'] == column] for c in corrections])
+            tables[name].append(table.assign(metric=metric))
+    if not metrics:
+        return
+    cells = pd.concat(tables['cells']).groupby(store.AGGREGATE_KEYS['cells'], as_index=False)[store.STATS].sum()
+    if subreddit:
+        cells = cells[cells['subreddit'].str.lower() == subreddit.lower()]
+    sizes = cells.groupby(['metric', 'subreddit'])['rows'].transform('sum')
+    cells = cells[((sizes >= 3) | (cells['subreddit'] == '')) & (cells['rows'] > 0)]
+    if not all(describes_posts(cells[cells['metric'] == metric], df, metric) for metric in metrics):
+        print("The store's aggregates do not describe the loaded posts, computing the statistics from them.")
+        return
+    tag_cells = pd.concat(tables['tag_cells'])
+    tag_cells = tag_cells[tag_cells['subreddit'].isin(cells['subreddit'])]
+    tag_cells = tag_cells.groupby(['metric', 'tag'], as_index=False)[store.STATS].sum()
+    # Sketch entries of cells that were left out above are left out of the cube's sketches as well
+    cell_sketches = pd.concat(tables['cell_sketches'])
+    cell_sketches = cell_sketches.groupby(store.AGGREGATE_KEYS['cell_sketches'], as_index=False)['count'].sum()
+    tag_sketches = pd.concat(tables['tag_sketches'])
+    tag_sketches = tag_sketches[tag_sketches['subreddit'].isin(cells['subreddit'])]
+    tag_sketches = tag_sketches.groupby(['metric', 'tag', 'bucket'], as_index=False)['count'].sum()
+    frame_memo(df)[('cube', tuple(metrics))] = aggregate_cube(metrics, cells, tag_cells[tag_cells['rows'] > 0],
+                                                              pd.Index(pd.factorize(df['Subreddit'])[1]),
+                                                              cell_sketches[cell_sketches['count'] > 0],
+                                                              tag_sketches[tag_sketches['count'] > 0])
+
+
+def read_posts(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits=False, adjust_inflation=False,
+               columns=None, compact=False, inflation_window=1, subreddit_window=None, stream=False,
+               near_duplicates=None, time_pushdown=True):
+    # The posts of whichever load path fits, not yet filtered. Paths that skip posts while reading return the time
+    # before which the time cut-off skipped posts (None if it skipped none) and the posts skipped per subreddit.
+    if stream:
+        return stream_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits, adjust_inflation,
+                         columns, compact, inflation_window, subreddit_window, time_pushdown=time_pushdown,
+                         near_duplicates=near_duplicates)
+    if reads_store(filenames, normalize_subreddits, adjust_inflation):
+        return store_df(filenames, subreddit, filter_tags, time_cutoff, columns, compact, time_pushdown,
+                        near_duplicates)
+    refresh_partitions(filenames, normalize_subreddits, adjust_inflation)
+    if reads_partitions(filenames, normalize_subreddits, adjust_inflation):
+        return partitioned_df(filenames, subreddit, filter_tags, time_cutoff, columns, compact, time_pushdown,
+                              near_duplicates)
+    return read_dataset(filenames, normalize_subreddits, adjust_inflation, columns, compact,
+                        inflation_window, subreddit_window, near_duplicates), None, {}
+
+
+def load_df(filenames, subreddit, filter_tags, time_cutoff, normalize_subreddits=False, adjust_inflation=False,
+            columns=None, compact=False, inflation_window=1, subreddit_window=None, stream=False,
+            near_duplicates=None):
+    # near_duplicates is the title similarity (0 to 1) above which posts by the same author are merged
+    options = (normalize_subreddits, adjust_inflation, columns, compact, inflation_window, subreddit_window, stream,
+               near_duplicates)
+    with peak_memory(compact):
+        df, prune_limit, skipped = read_posts(filenames, subreddit, filter_tags, time_cutoff, *options)
+        try:
+            df = filter_df(df, subreddit, filter_tags, time_cutoff, skipped)
+        except InsufficientData:
+            if prune_limit is None:
+                raise
+            df = df.iloc[0:0]
+        if not time_pushdown_is_exact(df, time_cutoff, prune_limit):
+            print("Posts skipped for the time cut-off are still needed, reading them as well...")
+            df, _, skipped = read_posts(filenames, subreddit, filter_tags, time_cutoff, *options, time_pushdown=False)
+            df = filter_df(df, subreddit, filter_tags, time_cutoff, skipped)
+        if (not stream and reads_store(filenames, normalize_subreddits, adjust_inflation) and not filter_tags
+                and time_cutoff is None and not near_duplicates):
+            seed_store_cubes(df, filenames, subreddit)
+    if compact:
+        print(f"Memory usage of the filtered posts: {memory_mb(df):.1f} MB")
+    return df
@@ -0,0 +1,20 @@
+import weakref
+
+FRAME_MEMOS = {}
+
+
+def frame_memo(df):
+    # Values derived from a frame, kept until the frame is garbage collected
+    memo = FRAME_MEMOS.get(id(df))
+    if memo is None:
+        memo = {}
+        FRAME_MEMOS[id(df)] = memo
+        weakref.finalize(df, FRAME_MEMOS.pop, id(df), None)
+    return memo
+
+
+def share_frame_memo(df, copy):
+    # Shallow copies hold the same rows in the same order, so they can reuse everything derived from the frame
+    FRAME_MEMOS[id(copy)] = frame_memo(df)
+    weakref.finalize(copy, FRAME_MEMOS.pop, id(copy), None)
+    return copy
@@ -0,0 +1,120 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+SIGNATURES_DIR = os.path.join("data", ".cache", "signatures")
+NUM_HASHES = 64
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_SEED = 0
+# Buckets up to this size compare every pair of their members
+SMALL_BUCKET = 32
+BRACKETS = re.compile(r'[\[\(\{][^\]\)\}]*[\]\)\}]')
+NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_titles(titles):
+    # Lower case, without bracketed tags, emoji or punctuation
+    titles = pd.Series(titles, dtype=object).fillna('').str.lower()
+    return titles.str.replace(BRACKETS, ' ', regex=True).str.replace(NON_WORD, ' ', regex=True).str.strip()
+
+
+def hash_coefficients():
+    rng = np.random.default_rng(HASH_SEED)
+    return (rng.integers(1, 1 << 31, NUM_HASHES, dtype=np.uint64),
+            rng.integers(0, 1 << 31, NUM_HASHES, dtype=np.uint64))
+
+
+def minhash_signatures(titles):
+    # One row of NUM_HASHES minimum shingle hashes per (normalized) title. Each hash is (a x + b) mod p of the
+    # shingle's 32-bit hash x, so a x stays below 2^63
+    padded = [f" {title} " for title in titles]
+    lengths = np.array([max(len(title) - SHINGLE_SIZE + 1, 1) for title in padded])
+    shingles = [title[i:i + SHINGLE_SIZE] for title in padded for i in range(max(len(title) - SHINGLE_SIZE + 1, 1))]
+    x = pd.util.hash_array(np.array(shingles, dtype=object)) & np.uint64(0xFFFFFFFF)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    a, b = hash_coefficients()
+    signatures = np.empty((len(titles), NUM_HASHES), dtype=np.uint32)
+    for k in range(NUM_HASHES):
+        signatures[:, k] = np.minimum.reduceat(((a[k] * x + b[k]) % np.uint64(MERSENNE_PRIME)) &
+                                               np.uint64(0xFFFFFFFF), starts)
+    return signatures
+
+
+def cached_signatures(titles, cache_key=None):
+    # Signatures of distinct titles, kept with the dataset so reloads only hash titles they have not seen
+    path = os.path.join(SIGNATURES_DIR, f"{cache_key}.parquet") if cache_key else None
+    cached = None
+    if path is not None and os.path.exists(path):
+        cached = pd.read_parquet(path)
+        cached = cached.set_index('title')
+    titles = pd.Index(titles)
+    missing = titles if cached is None else titles[~titles.isin(cached.index)]
+    if len(missing) > 0:
+        computed = pd.DataFrame(minhash_signatures(list(missing)), index=missing,
+                                columns=[f"h{k}" for k in range(NUM_HASHES)])
+        cached = computed if cached is None else pd.concat([cached, computed])
+        if path is not None:
+            try:
+                os.makedirs(SIGNATURES_DIR, exist_ok=True)
+                cached.rename_axis('title').reset_index().to_parquet(path, index=False)
+            except (OSError, ImportError, ValueError) as e:
+                print(f"Could not save title signatures: {e}")
+    else:
+        print("Reusing cached title signatures.")
+    return cached.loc[titles].to_numpy(dtype=np.uint32)
+
+
+def lsh_bands(threshold):
+    # The band count whose candidate threshold (1/bands)^(1/rows) sits just below the similarity threshold
+    options = [(bands, NUM_HASHES // bands) for bands in [1, 2, 4, 8, 16, 32, 64]]
+    below = [(bands, rows) for bands, rows in options if (1 / bands) ** (1 / rows) <= threshold]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1])) if below else options[-1]
+
+
+def near_duplicate_clusters(titles, authors, threshold, cache_key=None):
+    # A cluster label per post. Posts by the same author whose titles have an estimated Jaccard similarity of at
+    # least threshold are linked; candidates only come from shared LSH buckets, never from all pairs
+    normalized = normalize_titles(titles)
+    # Titles that are nothing but tags keep their full text
+    normalized = normalized.where(normalized != '', pd.Series(titles, dtype=object).fillna('').str.lower().to_numpy())
+    title_codes, unique_titles = pd.factorize(normalized)
+    author_codes = np.asarray(pd.factorize(pd.Series(authors, dtype=object))[0])
+    signatures = cached_signatures(unique_titles, cache_key)
+    # Posts sharing the author and normalized title are linked outright, so the buckets hold distinct titles
+    pairs, post_keys = np.unique(np.stack([author_codes, title_codes]), axis=1, return_inverse=True)
+    post_keys = post_keys.ravel()
+    pair_authors, pair_titles = pairs
+    bands, rows = lsh_bands(threshold)
+    # Distinct titles in signature order, so that neighbours within a bucket are the most alike
+    by_signature = np.lexsort(signatures[pair_titles].T[::-1])
+    edges = []
+    for band in range(bands):
+        columns = signatures[pair_titles, band * rows:(band + 1) * rows]
+        bucket = pd.util.hash_pandas_object(pd.DataFrame(columns).assign(author=pair_authors), index=False).to_numpy()
+        order = by_signature[np.argsort(bucket[by_signature], kind='stable')]
+        ordered = bucket[order]
+        ends = np.searchsorted(ordered, ordered, side='right')
+        small = ends - np.searchsorted(ordered, ordered) <= SMALL_BUCKET
+        # Small buckets compare all their pairs, larger ones each member with its predecessor in signature order
+        positions = np.arange(len(order))
+        lefts, rights = [], []
+        for step in range(1, SMALL_BUCKET):
+            left = positions[(positions + step < ends) & (small | (step == 1))]
+            if len(left) == 0:
+                break
+            lefts.append(order[left])
+            rights.append(order[left + step])
+        if not lefts:
+            continue
+        lefts, rights = np.concatenate(lefts), np.concatenate(rights)
+        agreement = (signatures[pair_titles[lefts]] == signatures[pair_titles[rights]]).mean(axis=1)
+        keep = agreement >= threshold
+        edges.append(np.stack([lefts[keep], rights[keep]]))
+    edges = np.concatenate(edges, axis=1) if edges else np.empty((2, 0), dtype=int)
+    graph = sparse.coo_matrix((np.ones(edges.shape[1]), (edges[0], edges[1])), shape=(len(pair_titles),) * 2)
+    _, labels = connected_components(graph, directed=False)
+    return labels[post_keys]
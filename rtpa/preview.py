@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from rtpa.memo import frame_memo
+from rtpa.stats import StatsCube, cell_layout, sufficient_stats, value_shift
+from rtpa.tags import tag_index
+
+# Sample sizes of the preview steps; the exact result follows them
+PREVIEW_FRACTIONS = [0.05, 0.2, 0.5]
+PREVIEW_SEED = 0
+
+
+def stratified_order(df, seed=PREVIEW_SEED):
+    # Rows ordered so that every prefix is a stratified sample by subreddit and month: each row's random rank within
+    # its stratum, as a fraction of the stratum, sorts it. Longer prefixes contain the shorter ones.
+    months = df['Timestamp_Local'].dt.tz_localize(None).dt.to_period('M') if 'Timestamp_Local' in df.columns \
+        else pd.to_datetime(df['Timestamp'], utc=True).dt.tz_localize(None).dt.to_period('M')
+    strata = pd.Series(pd.factorize(pd.MultiIndex.from_arrays([df['Subreddit'].astype(object).to_numpy(),
+                                                                months.to_numpy()]))[0])
+    keys = np.random.default_rng(seed).random(len(df))
+    ranks = pd.Series(keys).groupby(strata.to_numpy()).rank(method='first').to_numpy()
+    sizes = strata.map(strata.value_counts()).to_numpy()
+    return np.argsort((ranks - 0.5) / sizes, kind='stable')
+
+
+def preview_frames(df, metrics, fractions=PREVIEW_FRACTIONS):
+    # Growing stratified samples of df, each carrying a Welch cube for the metrics. Every step only adds the
+    # statistics of the rows that entered the sample to the previous step's cells. The cells and dimensions are
+    # those of the whole frame, so cells the sample has not reached yet are empty.
+    metrics = list(metrics)
+    order = stratified_order(df)
+    values = df[metrics].to_numpy(dtype=float)
+    shift = value_shift(values)
+    cell_codes, dims, subreddits = cell_layout(df)
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    rank = np.empty(len(df), dtype=int)
+    rank[order] = np.arange(len(df))
+    posting_ranks = rank[positions]
+    cells = np.zeros((4, len(dims['hour']), len(metrics)))
+    tag_cells = np.zeros((4, len(index.names), len(metrics)))
+    done = 0
+    for fraction in fractions:
+        size = int(np.ceil(fraction * len(df)))
+        if size <= done:
+            continue
+        rows = order[done:size]
+        cells += sufficient_stats(values[rows], cell_codes[rows], cells.shape[1], shift)
+        entering = (posting_ranks >= done) & (posting_ranks < size)
+        tag_cells += sufficient_stats(values[positions[entering]], tag_codes[entering], tag_cells.shape[1], shift)
+        done = size
+        sample = df.iloc[np.sort(order[:size])]
+        frame_memo(sample)[('cube', tuple(metrics))] = StatsCube(metrics, cells.copy(), dims, subreddits,
+                                                                 tag_cells.copy(), index.names)
+        yield fraction, sample
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from scipy import linalg, sparse, stats
+from rtpa.cells import cell_columns
+from rtpa.memo import frame_memo
+from rtpa.tags import tag_index
+
+RIDGE_ALPHA = 1.0
+FACTORS = ['tag', 'hour', 'day', 'subreddit', 'duration']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def one_hot(codes, n_codes):
+    # One column per code; negative codes get an empty row
+    rows = np.flatnonzero(codes >= 0)
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, codes[rows])), shape=(len(codes), n_codes))
+
+
+def design_matrix(df, block_minutes, min_posts):
+    # Sparse one-hot columns for every tag used by at least min_posts posts, the UTC hour, the local day, the
+    # subreddit and the duration block; every level keeps its column, so the fit needs a penalty or a pseudo-inverse
+    key = ('design', block_minutes, min_posts)
+    memo = frame_memo(df)
+    if key in memo:
+        return memo[key]
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    counts = np.bincount(tag_codes, minlength=len(index.names))
+    kept = np.flatnonzero(counts >= min_posts)
+    columns = np.full(len(index.names), -1)
+    columns[kept] = np.arange(len(kept))
+    used = columns[tag_codes] >= 0
+    tags = sparse.csr_matrix((np.ones(used.sum()), (positions[used], columns[tag_codes[used]])),
+                             shape=(len(df), len(kept)))
+
+    cells = cell_columns(df)
+    subreddit_codes, subreddits = pd.factorize(cells['subreddit'])
+    minutes = cells['duration'].to_numpy() - 2
+    blocks = np.where(minutes >= 0, (minutes // block_minutes) * block_minutes, -1)
+    block_labels, block_codes = np.unique(blocks, return_inverse=True)
+    matrices = [tags, one_hot(cells['hour'].to_numpy(), 24), one_hot(cells['day'].to_numpy(), 7),
+                one_hot(subreddit_codes, len(subreddits)), one_hot(block_codes.ravel(), len(block_labels))]
+    names = [list(index.names[kept]), [f"{hour}:00 UTC" for hour in range(24)], DAYS,
+             [subreddit if subreddit else "missing" for subreddit in subreddits],
+             [f"{int(block)}-{int(block)+block_minutes-1} mins" if block >= 0 else "no duration"
+              for block in block_labels]]
+    features = pd.DataFrame({'factor': np.repeat(FACTORS, [m.shape[1] for m in matrices]),
+                             'name': [name for factor_names in names for name in factor_names],
+                             'posts': np.concatenate([np.asarray(m.sum(axis=0)).ravel() for m in matrices])})
+    memo[key] = (sparse.hstack(matrices, format='csr'), features)
+    return memo[key]
+
+
+def ridge_fit(X, Y, alpha):
+    # Ridge on the centered design, built from the p x p gram matrix so the cost grows with the number of features
+    # rather than the number of posts. Returns the coefficients, their standard errors and the residual degrees of
+    # freedom, one column per column of Y
+    n = X.shape[0]
+    means = np.asarray(X.mean(axis=0)).ravel()
+    gram = (X.T @ X).toarray() - n * np.outer(means, means)
+    y_means = Y.mean(axis=0)
+    cross = X.T @ Y - np.outer(means, Y.sum(axis=0))
+    if alpha > 0:
+        inverse = linalg.cho_solve(linalg.cho_factor(gram + alpha * np.eye(len(gram))), np.eye(len(gram)))
+    else:
+        inverse = np.linalg.pinv(gram, rtol=1e-9, hermitian=True)
+    coefficients = inverse @ cross
+    residuals = Y - y_means - (X @ coefficients - means @ coefficients)
+    hat = inverse @ gram
+    dof = max(n - 1 - np.trace(hat), 1)
+    variance = (residuals ** 2).sum(axis=0) / dof
+    # Var(b) = s^2 A^-1 G A^-1 with A = G + alpha I, of which only the diagonal is needed
+    spread = np.einsum('ij,ji->i', hat, inverse)
+    return coefficients, np.sqrt(np.clip(spread, 0, None)[:, None] * variance[None, :]), dof
+
+
+def fit_effects(df, metrics, confidence_level, block_minutes=3, alpha=RIDGE_ALPHA, min_posts=None):
+    # The effect of each tag, hour, day, subreddit and duration block with all the others held fixed, as one
+    # frame per metric with a coefficient, confidence interval and p-value per feature
+    if min_posts is None:
+        min_posts = (len(df)//1000)+5
+    X, features = design_matrix(df, block_minutes, min_posts)
+    Y = df[metrics].to_numpy(dtype=float)
+    valid = ~np.isnan(Y)
+    results = {}
+    # Metrics missing on the same posts share one fit
+    for mask in np.unique(valid, axis=1).T:
+        columns = [j for j in range(len(metrics)) if (valid[:, j] == mask).all()]
+        coefficients, errors, dof = ridge_fit(X[mask], Y[mask][:, columns], alpha)
+        t = stats.t.ppf((1 + confidence_level) / 2, dof)
+        for k, j in enumerate(columns):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                p_value = 2 * stats.t.sf(np.abs(coefficients[:, k] / errors[:, k]), dof)
+            results[metrics[j]] = features.assign(
+                coefficient=coefficients[:, k], ci_low=coefficients[:, k] - t * errors[:, k],
+                ci_high=coefficients[:, k] + t * errors[:, k], p_value=p_value)
+    return {metric: results[metric] for metric in metrics}
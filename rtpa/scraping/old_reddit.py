@@ -1,13 +1,14 @@
-import csv
-import os
 import re
 import time
+import pandas as pd
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
+from rtpa.loader import export_csv
+from rtpa.store import COLUMNS, upsert_posts
 
 def scrape():
     valid = ['profile','p','subreddit','s']
@@ -29,9 +30,10 @@ def scrape():
         while time_frame not in ["all time", "past year", "past month", "past week"]:
             print("Invalid time frame.")
             time_frame = input("Enter the time frame (all time, past year, past month, past week): ").strip().lower()
-    scrape_old_reddit(username, subreddit, time_frame)
+    export = input("Also save the posts as a CSV file? (y/n): ").strip().lower() in ('y', 'yes')
+    scrape_old_reddit(username, subreddit, time_frame, export)
 
-def scrape_old_reddit(username, subreddit, time_frame="all time"):
+def scrape_old_reddit(username, subreddit, time_frame="all time", export=False):
     if username:
         url = f'https://old.reddit.com/user/{username}/submitted/'
     elif subreddit:
@@ -151,23 +153,23 @@ def scrape_old_reddit(username, subreddit, time_frame="all time"):
     if time_frame:
         time_frame = time_frame.replace(" ", "_")
     filename = f"{'s' if subreddit else 'u'}_{subreddit if subreddit else username}{'_' + time_frame if time_frame else ''}.csv"
-    if not os.path.exists("data"):
-        os.mkdir("data")
-    with open(f"data/{filename}", 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Title', 'Tags', 'Upvotes', 'Subreddit', 'Comments', 'Post URL', 'Timestamp', 'Author', 'Audio Link', 'Duration', 'Fills'])
-        for idx, post in enumerate(posts_data, start=1):
-            print(f"Processing post {idx}/{len(posts_data)}...")
+    rows = []
+    for idx, post in enumerate(posts_data, start=1):
+        print(f"Processing post {idx}/{len(posts_data)}...")
+        try:
+            title = re.findall(r'(?<=])(?![\s\[\]]*$)[^\[\]]+\w+[^\[\]]+(?=\[)', post['title'])[0].strip()
+        except IndexError:
             try:
-                title = re.findall(r'(?<=])(?![\s\[\]]*$)[^\[\]]+\w+[^\[\]]+(?=\[)', post['title'])[0].strip()
+                title = re.findall(r'^(?![\s\[\]]*$)[^\[\]]+\w+[^\[\]]+(?=\[)', post['title'])[0].strip()
             except IndexError:
-                try:
-                    title = re.findall(r'^(?![\s\[\]]*$)[^\[\]]+\w+[^\[\]]+(?=\[)', post['title'])[0].strip()
-                except IndexError:
-                    print(f"No title found in {post['title']}. Skipping.")
-                    continue
-            tags = re.findall(r'(?<=\[).+?(?=])', post['title'])
-            tags_str = '|'.join(tags).lower()
-            writer.writerow([title, tags_str, post['upvotes'], post['subreddit'], post['comments'], post['post_url'], post['timestamp'], post['author'], post['audiolink'], post['duration'], ''])
-    print(f"Scraping complete. Data saved to {filename}.")
+                print(f"No title found in {post['title']}. Skipping.")
+                continue
+        tags = re.findall(r'(?<=\[).+?(?=])', post['title'])
+        tags_str = '|'.join(tags).lower()
+        rows.append([title, tags_str, post['upvotes'], post['subreddit'], post['comments'], post['post_url'], post['timestamp'], post['author'], post['audiolink'], post['duration'], ''])
+    df = pd.DataFrame(rows, columns=list(COLUMNS))
+    upsert_posts(df, filename[:-len(".csv")])
+    if export:
+        export_csv(df, filename)
+    print(f"Scraping complete.{f' Data saved to {filename}.' if export else ''}")
     driver.quit()
@@ -0,0 +1,74 @@
+import numpy as np
+from scipy import stats
+
+# DDSketch-style log buckets: every value is reported within RELATIVE_ACCURACY of itself. Magnitudes below
+# MIN_MAGNITUDE share the zero bucket.
+RELATIVE_ACCURACY = 0.01
+MIN_MAGNITUDE = 1e-3
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+
+def bucket_keys(values):
+    # 0 for (near) zero, +-k for magnitudes in (MIN_MAGNITUDE * GAMMA^(k-1), MIN_MAGNITUDE * GAMMA^k]
+    magnitudes = np.abs(values)
+    keys = np.ceil(np.log(np.maximum(magnitudes, MIN_MAGNITUDE) / MIN_MAGNITUDE) / np.log(GAMMA))
+    keys = np.where(magnitudes < MIN_MAGNITUDE, 0, np.maximum(keys, 1))
+    return (np.sign(values) * keys).astype(np.int64)
+
+
+def key_values(keys):
+    magnitudes = MIN_MAGNITUDE * 2 * GAMMA ** np.abs(keys) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * magnitudes)
+
+
+class Sketches:
+    # One mergeable histogram of a metric per code, stored sparsely as (code, bucket, count) entries; merging
+    # histograms is adding their counts. counts weighs the values, e.g. bucket values counted by the post store.
+    def __init__(self, values, codes, n_codes, counts=None):
+        values = np.asarray(values, dtype=float)
+        codes = np.asarray(codes)
+        valid = (codes >= 0) & ~np.isnan(values)
+        self.keys, buckets = np.unique(bucket_keys(values[valid]), return_inverse=True)
+        entries, inverse = np.unique(codes[valid] * len(self.keys) + buckets.ravel(), return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=None if counts is None else np.asarray(counts)[valid],
+                                  minlength=len(entries))
+        self.codes, self.buckets = np.divmod(entries, max(len(self.keys), 1))
+        self.n_codes = n_codes
+        self.values = key_values(self.keys)
+
+    def merged(self, groups, n_groups):
+        # Bucket counts of each group of codes, as an (n_groups, n_buckets) array; negative groups are left out
+        group = np.asarray(groups)[self.codes]
+        inside = group >= 0
+        return np.bincount(group[inside] * len(self.keys) + self.buckets[inside], weights=self.counts[inside],
+                           minlength=n_groups * len(self.keys)).reshape(n_groups, len(self.keys))
+
+
+def sketch_quantiles(histograms, values, quantile, z):
+    # The quantile of each histogram, with the standard error implied by the distribution-free order statistic
+    # interval around its rank
+    n = histograms.sum(axis=1)
+    cumulative = np.cumsum(histograms, axis=1)
+
+    def at(rank):
+        index = (cumulative <= rank[:, None]).sum(axis=1)
+        return np.where(n > 0, values[np.minimum(index, len(values) - 1)] if len(values) else np.nan, np.nan)
+
+    rank = quantile * (n - 1)
+    spread = z * np.sqrt(n * quantile * (1 - quantile))
+    low = at(np.clip(np.floor(rank - spread), 0, None))
+    high = at(np.clip(np.ceil(rank + spread), None, np.maximum(n - 1, 0)))
+    return at(rank), (high - low) / (2 * z)
+
+
+def quantile_one_vs_rest(groups, total, values, quantile, confidence_level):
+    # groups holds the bucket counts of each group, total those of every post; the rest is their difference
+    z = stats.norm.ppf((1 + confidence_level) / 2)
+    quantile1, se1 = sketch_quantiles(groups, values, quantile, z)
+    quantile2, se2 = sketch_quantiles(total[None, :] - groups, values, quantile, z)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diff = quantile1 - quantile2
+        se_diff = np.sqrt(se1 ** 2 + se2 ** 2)
+        z_stat = diff / se_diff
+        p_value = 2 * stats.norm.sf(np.abs(z_stat))
+    return diff, diff - z * se_diff, diff + z * se_diff, p_value, z_stat
@@ -1,26 +1,389 @@
-from scipy import stats
-
-def perform_analysis_with_groups(group_with_value, group_without_value, metric, confidence_level):
-    # Perform an independent two-sample T-test
-    t_stat, p_value = stats.ttest_ind(
-        group_with_value[metric],
-        group_without_value[metric],
-        equal_var=False,
-        nan_policy='omit'
-    )
-
-    mean_diff, ci_low, ci_high = calculate_confidence_interval(
-        group_with_value, group_without_value, metric, confidence_level
-    )
-    return mean_diff, ci_low, ci_high, p_value, t_stat
-
-def calculate_confidence_interval(group1, group2, metric, confidence_level):
-    se1 = stats.sem(group1[metric], nan_policy='omit')
-    se2 = stats.sem(group2[metric], nan_policy='omit')
-    se_diff = (se1 ** 2 + se2 ** 2) ** 0.5
-    df = min(len(group1[metric]) - 1, len(group2[metric]) - 1)
-    t_critical = stats.t.ppf((1 + confidence_level) / 2, df)
-    mean_diff = group1[metric].mean() - group2[metric].mean()
-    ci_low = mean_diff - t_critical * se_diff
-    ci_high = mean_diff + t_critical * se_diff
-    return mean_diff, ci_low, ci_high
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+from rtpa.cells import CELL_DIMENSIONS, cell_columns
+from rtpa.memo import frame_memo
+from rtpa.sketches import Sketches, key_values, quantile_one_vs_rest
+from rtpa.tags import tag_index
+
+# Bootstrap/permutation engine settings. Both are exact: a bootstrap side with few distinct values draws how often
+# each value is picked (multinomial counts) instead of the picked positions, whichever is cheaper. A multinomial
+# draw costs about MULTINOMIAL_COST index draws per distinct value.
+RESAMPLES = 10_000
+RESAMPLE_SEED = 0
+MULTINOMIAL_COST = 5
+RESAMPLE_BATCH = 2 ** 22
+PARALLEL_RESAMPLE_WORK = 2 * 10 ** 8
+# Processes for resampling, all cores when None
+RESAMPLE_WORKERS = None
+RESAMPLE_VALUES = None
+RESAMPLE_MEMBERSHIP = None
+# Engines that compare a quantile of each group with the rest instead of the mean
+QUANTILE_ENGINES = {'median': 0.5, 'p90': 0.9}
+
+def perform_analysis_with_groups(group_with_value, group_without_value, metric, confidence_level, engine='welch'):
+    # Welch's independent two-sample T-test, computed with the same engine as the one-vs-rest breakdowns
+    values = np.concatenate([np.asarray(group_with_value[metric], dtype=float),
+                             np.asarray(group_without_value[metric], dtype=float)])
+    codes = np.repeat([0, 1], [len(group_with_value), len(group_without_value)])
+    mean_diff, ci_low, ci_high, p_value, t_stat, _, _ = one_vs_rest(values, codes, 2, confidence_level,
+                                                                    engine=engine)
+    return mean_diff[0], ci_low[0], ci_high[0], p_value[0], t_stat[0]
+
+def sufficient_stats(values, codes, n_codes, shift=0.0):
+    # Rows, non-missing values, sum and sum of squares of (value - shift) for each code; negative codes are skipped.
+    # A 2D values array holds one metric per column, whose statistics are stacked on the last axis.
+    x = np.asarray(values, dtype=float)
+    if x.ndim == 2:
+        shift = np.broadcast_to(shift, x.shape[1])
+        return np.stack([sufficient_stats(np.ascontiguousarray(x[:, j]), codes, n_codes, shift[j])
+                         for j in range(x.shape[1])], axis=-1)
+    x = x - shift
+    codes = np.asarray(codes)
+    rows = codes >= 0
+    valid = rows & ~np.isnan(x)
+    return np.stack([
+        np.bincount(codes[rows], minlength=n_codes),
+        np.bincount(codes[valid], minlength=n_codes),
+        np.bincount(codes[valid], weights=x[valid], minlength=n_codes),
+        np.bincount(codes[valid], weights=x[valid] ** 2, minlength=n_codes),
+    ]).astype(float)
+
+def value_shift(values):
+    # Centering on the mean keeps the sums of squares from cancelling catastrophically
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 2:
+        return np.array([value_shift(np.ascontiguousarray(column)) for column in values.T])
+    return 0.0 if np.isnan(values).all() else float(np.nanmean(values))
+
+def apply_membership(cells, membership):
+    # Statistics of each union of codes in the membership matrix
+    membership = np.asarray(membership, dtype=float).T
+    if cells.ndim == 3:
+        return np.stack([np.ascontiguousarray(cells[..., j]) @ membership for j in range(cells.shape[2])], axis=-1)
+    return cells @ membership
+
+def welch_one_vs_rest(cells, total, confidence_level):
+    rows1, n1, s1, ss1 = cells
+    rows2, n2, s2, ss2 = total[:, None] - cells
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean1, mean2 = s1 / n1, s2 / n2
+        var1 = np.maximum(ss1 - s1 * mean1, 0) / (n1 - 1)
+        var2 = np.maximum(ss2 - s2 * mean2, 0) / (n2 - 1)
+        vn1, vn2 = var1 / n1, var2 / n2
+        se_diff = np.sqrt(vn1 + vn2)
+        mean_diff = mean1 - mean2
+        t_stat = mean_diff / se_diff
+        dof = (vn1 + vn2) ** 2 / (vn1 ** 2 / (n1 - 1) + vn2 ** 2 / (n2 - 1))
+        p_value = 2 * stats.t.sf(np.abs(t_stat), dof)
+        t_critical = stats.t.ppf((1 + confidence_level) / 2, np.minimum(rows1, rows2) - 1)
+        ci_low = mean_diff - t_critical * se_diff
+        ci_high = mean_diff + t_critical * se_diff
+    return mean_diff, ci_low, ci_high, p_value, t_stat, rows1.astype(int), rows2.astype(int)
+
+def one_vs_rest(values, codes, n_codes, confidence_level, membership=None, engine='welch'):
+    # Each code (or each row of the code membership matrix) against every other row, all at once
+    shift = value_shift(values)
+    cells = sufficient_stats(values, codes, n_codes, shift)
+    if membership is not None:
+        cells = apply_membership(cells, membership)
+    total = sufficient_stats(values, np.zeros(len(values), dtype=int), 1, shift)[:, 0]
+    welch = welch_one_vs_rest(cells, total, confidence_level)
+    if engine == 'welch':
+        return welch
+    if engine in QUANTILE_ENGINES:
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        sketches = [(Sketches(column, codes, n_codes), Sketches(column, np.zeros(len(column), dtype=int), 1))
+                    for column in values.T]
+        return quantile_results(welch, [(groups.merged(np.arange(n_codes), n_codes), total.merged([0], 1)[0],
+                                         total.values) for groups, total in sketches],
+                                membership, QUANTILE_ENGINES[engine], confidence_level)
+    return resampled_results(welch, values, code_groups(np.asarray(codes), n_codes, membership), confidence_level)
+
+def quantile_results(welch, histograms, membership, quantile, confidence_level):
+    # histograms holds the (group, bucket) and total bucket counts of each metric; rows stay those of the welch test
+    rows1, rows2 = welch[5], welch[6]
+    columns = []
+    for groups, total, values in histograms:
+        if membership is not None:
+            groups = np.asarray(membership, dtype=float) @ groups
+        columns.append(quantile_one_vs_rest(groups, total, values, quantile, confidence_level))
+    if np.ndim(rows1) == 1:
+        return columns[0] + (rows1, rows2)
+    return tuple(np.stack(stat, axis=-1) for stat in zip(*columns)) + (rows1, rows2)
+
+def code_groups(codes, n_codes, membership=None):
+    # Row positions of each code, or of each union of codes in the membership matrix
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=n_codes)
+    groups = np.split(order[len(codes) - counts.sum():], np.cumsum(counts)[:-1])
+    if membership is None:
+        return groups
+    return [np.sort(np.concatenate([groups[code] for code in np.flatnonzero(row)] or [np.empty(0, dtype=int)]))
+            for row in np.asarray(membership, dtype=bool)]
+
+def resampled_results(welch, values, groups, confidence_level):
+    # Keep the observed difference and the t statistic, replace the CI and the p-value
+    mean_diff, _, _, _, t_stat, rows1, rows2 = welch
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 2:
+        columns = [resampled_one_vs_rest(np.ascontiguousarray(values[:, j]), groups, confidence_level)
+                   for j in range(values.shape[1])]
+        ci_low, ci_high, p_value = (np.stack(stat, axis=-1) for stat in zip(*columns))
+    else:
+        ci_low, ci_high, p_value = resampled_one_vs_rest(values, groups, confidence_level)
+    return mean_diff, ci_low, ci_high, p_value, t_stat, rows1, rows2
+
+def resampled_one_vs_rest(values, groups, confidence_level, resamples=RESAMPLES, seed=RESAMPLE_SEED, workers=None):
+    # Bootstrap CIs and permutation p-values of each group against the rest. Every group's bootstrap and every batch
+    # of permutations draws from its own child seed, so the results do not depend on the number of processes.
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    remap = np.cumsum(valid) - 1
+    x = values[valid]
+    groups = [remap[group[valid[group]]] for group in groups]
+    batch = max(1, RESAMPLE_BATCH // max(len(x), 1))
+    batches = [min(batch, resamples - start) for start in range(0, resamples, batch)]
+    children = np.random.SeedSequence(seed).spawn(len(groups) + len(batches))
+    tasks = [(group, child, resamples, confidence_level) for group, child in zip(groups, children)]
+    permutation_tasks = list(zip(children[len(groups):], batches))
+    membership = sparse.csc_matrix((np.ones(sum(len(group) for group in groups)),
+                                    (np.concatenate(groups + [np.empty(0, dtype=int)]),
+                                     np.repeat(np.arange(len(groups)), [len(group) for group in groups]))),
+                                   shape=(len(x), len(groups)))
+    distinct_cost = MULTINOMIAL_COST * len(np.unique(x))
+    work = resamples * (len(x) + sum(min(len(group), distinct_cost) + min(len(x) - len(group), distinct_cost)
+                                     for group in groups))
+    workers = workers or RESAMPLE_WORKERS or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1 and work > PARALLEL_RESAMPLE_WORK:
+        print(f"Resampling {len(tasks)} groups {resamples} times on {workers} processes...")
+        with ProcessPoolExecutor(workers, initializer=set_resample_values, initargs=(x, membership)) as pool:
+            results = list(pool.map(resample_group, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+            permuted = list(pool.map(permuted_group_sums, permutation_tasks))
+    else:
+        set_resample_values(x, membership)
+        try:
+            results = [resample_group(task) for task in tasks]
+            permuted = [permuted_group_sums(task) for task in permutation_tasks]
+        finally:
+            set_resample_values(None)
+    if not results:
+        return np.empty(0), np.empty(0), np.empty(0)
+    ci_low, ci_high = (np.array(column, dtype=float).reshape(len(tasks)) for column in zip(*results))
+    # Permutation: each group's posts are replaced by a random subset of all posts of the same size, drawn without
+    # replacement, and its difference is compared with the observed one
+    n1 = np.array([len(group) for group in groups], dtype=float)
+    n2 = len(x) - n1
+    total = x.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = np.abs(np.asarray(membership.T @ x).ravel() / n1 - (total - membership.T @ x) / n2)
+        sums = np.concatenate(permuted)
+        null = np.abs(sums / n1 - (total - sums) / n2)
+    tolerance = 1e-9 * np.maximum(observed, 1.0)
+    p_value = (1 + np.count_nonzero(null >= observed - tolerance, axis=0)) / (resamples + 1)
+    p_value = np.where((n1 < 2) | (n2 < 2), np.nan, p_value)
+    return ci_low, ci_high, p_value
+
+def set_resample_values(values, membership=None):
+    global RESAMPLE_VALUES, RESAMPLE_MEMBERSHIP
+    RESAMPLE_VALUES = values
+    RESAMPLE_MEMBERSHIP = membership
+
+def resample_group(task):
+    # Bootstrap CI of the group's mean difference: both sides are resampled with replacement
+    positions, seed, resamples, confidence_level = task
+    x = RESAMPLE_VALUES
+    n1, n2 = len(positions), len(x) - len(positions)
+    if n1 < 2 or n2 < 2:
+        return np.nan, np.nan
+    rng = np.random.default_rng(seed)
+    group = x[positions]
+    rest = np.delete(x, positions)
+    diffs = resampled_means(group, len(group), rng, resamples) - resampled_means(rest, len(rest), rng, resamples)
+    alpha = 1 - confidence_level
+    return tuple(np.quantile(diffs, [alpha / 2, 1 - alpha / 2]))
+
+def permuted_group_sums(task):
+    # Sums of every group's positions in a batch of full permutations of the values, as a (permutation, group) array
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    permuted = rng.permuted(np.broadcast_to(RESAMPLE_VALUES, (size, len(RESAMPLE_VALUES))), axis=1)
+    return np.asarray(RESAMPLE_MEMBERSHIP.T @ permuted.T).T
+
+def resampled_means(sample, size, rng, resamples):
+    # Means of resamples drawn with replacement, in batches of index matrices or of multinomial count matrices
+    distinct, counts = np.unique(sample, return_counts=True)
+    means = np.empty(resamples)
+    if MULTINOMIAL_COST * len(distinct) < size:
+        batch = max(1, RESAMPLE_BATCH // (MULTINOMIAL_COST * len(distinct)))
+        for start in range(0, resamples, batch):
+            stop = min(start + batch, resamples)
+            means[start:stop] = rng.multinomial(size, counts / size, size=stop - start) @ distinct / size
+        return means
+    batch = max(1, RESAMPLE_BATCH // size)
+    for start in range(0, resamples, batch):
+        stop = min(start + batch, resamples)
+        means[start:stop] = sample[rng.integers(0, len(sample), (stop - start, size))].mean(axis=1)
+    return means
+
+def cell_totals(cells):
+    # Summed along contiguous cells, so every metric is summed exactly as a single-metric cube would sum it
+    return np.ascontiguousarray(np.moveaxis(cells, -1, 1)).sum(axis=-1)
+
+class StatsCube:
+    # Sufficient statistics of every metric for every occupied hour UTC x local day x subreddit x duration minute x
+    # tag count cell, plus one overlapping cell per tag. Breakdowns are answered from the cells instead of the rows,
+    # for all metrics at once: statistics are (stat, cell, metric) arrays and results are (code, metric) arrays.
+    def __init__(self, metrics, cells, dims, subreddits, tag_cells, tag_names, values=None, row_cells=None,
+                 postings=None):
+        self.metrics = list(metrics)
+        self.cells = cells
+        self.dims = dims
+        self.subreddits = subreddits
+        self.tag_cells = tag_cells
+        self.tag_names = tag_names
+        # Cubes built from a frame also keep its rows, which the resampling and quantile engines need
+        self.values = values
+        self.row_cells = row_cells
+        self.postings = postings
+        self.row_sketches = {}
+
+    def select(self, where=None):
+        if where is None:
+            return self.cells, self.dims
+        mask = where(self.dims)
+        return self.cells[:, mask], {name: dim[mask] for name, dim in self.dims.items()}
+
+    def rows(self, where=None):
+        return int(self.select(where)[0][0, :, 0].sum())
+
+    def subset(self, metrics):
+        columns = [self.metrics.index(metric) for metric in metrics]
+        cube = StatsCube(metrics, self.cells[..., columns], self.dims, self.subreddits, self.tag_cells[..., columns],
+                         self.tag_names, None if self.values is None else self.values[:, columns], self.row_cells,
+                         self.postings)
+        cube.row_sketches = {metric: sketches for metric, sketches in self.row_sketches.items() if metric in metrics}
+        return cube
+
+    def answers(self, engine, metrics):
+        # Welch needs the cells only, the quantile engines the sketches of every metric and resampling the rows
+        if engine == 'welch' or self.values is not None:
+            return True
+        return engine in QUANTILE_ENGINES and all(metric in self.row_sketches for metric in metrics)
+
+    def sketches(self, metric):
+        # Quantile sketches of every cell and every tag, built from the rows on first use unless the store's were given
+        if metric not in self.row_sketches:
+            values = self.values[:, self.metrics.index(metric)]
+            positions, tag_codes = self.postings
+            self.row_sketches[metric] = (Sketches(values, self.row_cells, self.cells.shape[1]),
+                                         Sketches(values[positions], tag_codes, len(self.tag_names)))
+        return self.row_sketches[metric]
+
+    def breakdown(self, codes, n_codes, confidence_level, where=None, membership=None, engine='welch'):
+        # codes names a dimension or maps the dimensions to a code per cell; negative codes only count as the rest
+        cells, dims = self.select(where)
+        codes = dims[codes] if isinstance(codes, str) else codes(dims)
+        inside = codes >= 0
+        grouped = np.stack([np.stack([np.bincount(codes[inside], weights=column[inside], minlength=n_codes)
+                                      for column in stat.T], axis=-1) for stat in cells])
+        if membership is not None:
+            grouped = apply_membership(grouped, membership)
+        welch = welch_one_vs_rest(grouped, cell_totals(cells), confidence_level)
+        if engine == 'welch':
+            return welch
+        selected = np.ones(self.cells.shape[1], dtype=bool) if where is None else where(self.dims)
+        cell_codes = np.full(len(selected), -1)
+        cell_codes[selected] = codes
+        if engine in QUANTILE_ENGINES:
+            in_total = np.where(selected, 0, -1)
+            histograms = [(sketch.merged(cell_codes, n_codes), sketch.merged(in_total, 1)[0], sketch.values)
+                          for sketch in (self.sketches(metric)[0] for metric in self.metrics)]
+            return quantile_results(welch, histograms, membership, QUANTILE_ENGINES[engine], confidence_level)
+        rows = selected[self.row_cells]
+        return resampled_results(welch, self.values[rows],
+                                 code_groups(cell_codes[self.row_cells[rows]], n_codes, membership), confidence_level)
+
+    def tag_breakdown(self, confidence_level, engine='welch'):
+        welch = welch_one_vs_rest(self.tag_cells, cell_totals(self.cells), confidence_level)
+        if engine == 'welch':
+            return welch
+        if engine in QUANTILE_ENGINES:
+            histograms = []
+            for metric in self.metrics:
+                cells, tags = self.sketches(metric)
+                # The tag sketch numbers its own buckets, so they are mapped onto the cell sketch's buckets
+                groups = np.zeros((len(self.tag_names), len(cells.keys)))
+                np.add.at(groups, (tags.codes, np.searchsorted(cells.keys, tags.keys[tags.buckets])), tags.counts)
+                histograms.append((groups, cells.merged(np.zeros(cells.n_codes, dtype=int), 1)[0], cells.values))
+            return quantile_results(welch, histograms, None, QUANTILE_ENGINES[engine], confidence_level)
+        # Postings are grouped by tag
+        positions, tag_codes = self.postings
+        counts = np.bincount(tag_codes, minlength=len(self.tag_names))
+        return resampled_results(welch, self.values, np.split(positions, np.cumsum(counts)[:-1]), confidence_level)
+
+def cell_layout(df):
+    # The cube cell of every row, the dimensions of every occupied cell and the frame's subreddits
+    columns = cell_columns(df)
+    subreddit_codes, subreddits = pd.factorize(df['Subreddit'])
+    columns['subreddit'] = np.where(subreddit_codes < 0, len(subreddits), subreddit_codes)
+    shape = [24, 7, len(subreddits) + 1] + [columns[name].to_numpy().max(initial=0) + 1 for name in ['duration', 'tag_count']]
+    keys, cell_codes = np.unique(np.ravel_multi_index(columns[CELL_DIMENSIONS].to_numpy(dtype=int).T, shape),
+                                 return_inverse=True)
+    return cell_codes.ravel(), dict(zip(CELL_DIMENSIONS, np.unravel_index(keys, shape))), subreddits
+
+def frame_cube(df, metrics):
+    values = df[list(metrics)].to_numpy(dtype=float)
+    shift = value_shift(values)
+    cell_codes, dims, subreddits = cell_layout(df)
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    return StatsCube(metrics, sufficient_stats(values, cell_codes, len(dims['hour']), shift), dims, subreddits,
+                     sufficient_stats(values[positions], tag_codes, len(index.names), shift), index.names,
+                     values, cell_codes, (positions, tag_codes))
+
+def aggregate_cube(metrics, cells, tag_cells, subreddits, cell_sketches=None, tag_sketches=None):
+    # cells and tag_cells hold exact integer rows, n, sum and squares columns per metric column, and the sketch
+    # tables bucket counts per metric, as persisted by the post store; subreddits missing from the frame (such as
+    # the store's '') only count towards the rest
+    cells = cells.pivot_table(index=CELL_DIMENSIONS, columns='metric', values=['rows', 'n', 'sum', 'squares'],
+                              aggfunc='sum', fill_value=0)
+    tag_cells = tag_cells.pivot_table(index='tag', columns='metric', values=['rows', 'n', 'sum', 'squares'],
+                                      aggfunc='sum', fill_value=0)
+    shift = cells['sum'][metrics].sum().to_numpy(dtype=float) / np.maximum(cells['n'][metrics].sum().to_numpy(), 1)
+
+    def centered(table):
+        n, total, squares = (table[column][metrics].to_numpy(dtype=float) for column in ['n', 'sum', 'squares'])
+        return np.stack([table['rows'][metrics].to_numpy(dtype=float), n, total - n * shift,
+                         squares - 2 * shift * total + n * shift ** 2])
+
+    keys = cells.index.to_frame(index=False)
+    codes = subreddits.get_indexer(keys['subreddit'])
+    dims = {name: keys[name].to_numpy(dtype=int) for name in CELL_DIMENSIONS if name != 'subreddit'}
+    dims['subreddit'] = np.where(codes < 0, len(subreddits), codes)
+    cube = StatsCube(metrics, centered(cells), dims, subreddits, centered(tag_cells), pd.Index(tag_cells.index))
+    if cell_sketches is not None:
+        for metric in metrics:
+            entries = cell_sketches[cell_sketches['metric'] == metric]
+            tag_entries = tag_sketches[tag_sketches['metric'] == metric]
+            cube.row_sketches[metric] = (
+                Sketches(key_values(entries['bucket'].to_numpy()),
+                         cells.index.get_indexer(pd.MultiIndex.from_frame(entries[CELL_DIMENSIONS])), len(cells),
+                         entries['count'].to_numpy()),
+                Sketches(key_values(tag_entries['bucket'].to_numpy()), tag_cells.index.get_indexer(tag_entries['tag']),
+                         len(tag_cells), tag_entries['count'].to_numpy()))
+    return cube
+
+def stats_cube(df, metrics, engine='welch'):
+    # Built once per loaded frame and set of metrics; frames handed out by the frame cache share it, and a cube of
+    # more metrics serves any subset of them. Cubes seeded from the store's aggregates have no rows to resample,
+    # so the resampling engine rebuilds them from the frame.
+    metrics = [metrics] if isinstance(metrics, str) else list(metrics)
+    memo = frame_memo(df)
+    for key, cube in list(memo.items()):
+        if isinstance(key, tuple) and key[0] == 'cube' and set(metrics) <= set(cube.metrics) and cube.answers(engine, metrics):
+            return cube if cube.metrics == metrics else cube.subset(metrics)
+    memo[('cube', tuple(metrics))] = frame_cube(df, metrics)
+    return memo[('cube', tuple(metrics))]
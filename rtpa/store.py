@@ -0,0 +1,306 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from rtpa.cells import CELL_DIMENSIONS, cell_columns
+from rtpa.sketches import bucket_keys
+from rtpa.tags import query_sql
+
+STORE_PATH = os.path.join("data", "posts.db")
+COLUMNS = {
+    'Title': 'title', 'Tags': 'tags', 'Upvotes': 'upvotes', 'Subreddit': 'subreddit', 'Comments': 'comments',
+    'Post URL': 'url', 'Timestamp': 'timestamp', 'Author': 'author', 'Audio Link': 'audio_link',
+    'Duration': 'duration', 'Fills': 'fills'
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    tags TEXT,
+    upvotes INTEGER,
+    subreddit TEXT,
+    comments INTEGER,
+    timestamp TEXT,
+    author TEXT,
+    audio_link TEXT,
+    duration TEXT,
+    fills REAL
+);
+CREATE TABLE IF NOT EXISTS post_tags (url TEXT, tag TEXT, PRIMARY KEY (url, tag));
+CREATE TABLE IF NOT EXISTS post_sources (url TEXT, source TEXT, PRIMARY KEY (source, url));
+CREATE INDEX IF NOT EXISTS posts_subreddit ON posts (subreddit COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (author);
+CREATE INDEX IF NOT EXISTS posts_timestamp ON posts (timestamp);
+CREATE INDEX IF NOT EXISTS posts_post ON posts (title, subreddit, author);
+CREATE INDEX IF NOT EXISTS post_tags_tag ON post_tags (tag, url);
+CREATE TABLE IF NOT EXISTS cells (
+    source TEXT, metric TEXT, hour INTEGER, day INTEGER, subreddit TEXT, duration INTEGER, tag_count INTEGER,
+    rows INTEGER, n INTEGER, sum INTEGER, squares INTEGER,
+    PRIMARY KEY (source, metric, hour, day, subreddit, duration, tag_count)
+);
+CREATE TABLE IF NOT EXISTS tag_cells (
+    source TEXT, metric TEXT, tag TEXT, subreddit TEXT, rows INTEGER, n INTEGER, sum INTEGER, squares INTEGER,
+    PRIMARY KEY (source, metric, tag, subreddit)
+);
+CREATE TABLE IF NOT EXISTS month_cells (
+    source TEXT, metric TEXT, month TEXT, rows INTEGER, n INTEGER, sum INTEGER, squares INTEGER,
+    PRIMARY KEY (source, metric, month)
+);
+CREATE TABLE IF NOT EXISTS cell_sketches (
+    source TEXT, metric TEXT, hour INTEGER, day INTEGER, subreddit TEXT, duration INTEGER, tag_count INTEGER,
+    bucket INTEGER, count INTEGER,
+    PRIMARY KEY (source, metric, hour, day, subreddit, duration, tag_count, bucket)
+);
+CREATE TABLE IF NOT EXISTS tag_sketches (
+    source TEXT, metric TEXT, tag TEXT, subreddit TEXT, bucket INTEGER, count INTEGER,
+    PRIMARY KEY (source, metric, tag, subreddit, bucket)
+);
+CREATE TABLE IF NOT EXISTS aggregate_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Per-source aggregates of every metric, kept in step with the posts by adding the difference each upsert makes.
+# The source '' holds every stored post. The sketch tables count the posts in each quantile sketch bucket of a cell
+# or tag cell. Stores whose aggregates predate AGGREGATE_VERSION rebuild them on their next upsert.
+METRICS = {'Upvotes': 'upvotes', 'Comments': 'comments'}
+AGGREGATE_KEYS = {
+    'cells': ['source', 'metric'] + CELL_DIMENSIONS,
+    'tag_cells': ['source', 'metric', 'tag', 'subreddit'],
+    'month_cells': ['source', 'metric', 'month'],
+    'cell_sketches': ['source', 'metric'] + CELL_DIMENSIONS + ['bucket'],
+    'tag_sketches': ['source', 'metric', 'tag', 'subreddit', 'bucket'],
+}
+STATS = ['rows', 'n', 'sum', 'squares']
+AGGREGATE_STATS = {name: ['count'] if name.endswith('_sketches') else STATS for name in AGGREGATE_KEYS}
+AGGREGATE_VERSION = 2
+# Upvotes and comments keep their maximum, every other column keeps the first non-empty value
+UPSERT = f"""
+INSERT INTO posts ({', '.join(COLUMNS.values())}) VALUES ({', '.join('?' * len(COLUMNS))})
+ON CONFLICT (url) DO UPDATE SET
+    upvotes = MAX(COALESCE(posts.upvotes, excluded.upvotes), COALESCE(excluded.upvotes, posts.upvotes)),
+    comments = MAX(COALESCE(posts.comments, excluded.comments), COALESCE(excluded.comments, posts.comments)),
+    {', '.join(f'{c} = COALESCE(posts.{c}, excluded.{c})'
+               for c in COLUMNS.values() if c not in ('url', 'upvotes', 'comments'))}
+"""
+
+
+@contextmanager
+def connect(path=STORE_PATH):
+    # Commits or rolls back like the sqlite3 connection itself, then closes it
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def normalize_url(url):
+    if not isinstance(url, str):
+        return None
+    url = re.sub(r'^(https?://)?(www\.|old\.)?', '', url.strip().lower())
+    return url.rstrip('/')
+
+
+def upsert_posts(df, source):
+    df = df.rename(columns=COLUMNS)[list(COLUMNS.values())].copy()
+    df['url'] = df['url'].map(normalize_url)
+    df = df.dropna(subset=['url'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True).dt.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    # Empty scraped fields are missing values, as they are when read back from a CSV
+    df = df.astype(object).where(df.notna() & (df != ''), None)
+    with connect() as connection:
+        connection.execute("CREATE TEMP TABLE batch (url TEXT PRIMARY KEY)")
+        connection.executemany("INSERT OR IGNORE INTO batch VALUES (?)", ((url,) for url in df['url']))
+        current = aggregates_are_current(connection)
+        before = stored_posts(connection) if current else None
+        connection.executemany(UPSERT, df.itertuples(index=False, name=None))
+        connection.executemany("INSERT OR IGNORE INTO post_sources (url, source) VALUES (?, ?)",
+                               ((url, source) for url in df['url']))
+        # Rebuild the tag rows from whatever tags the store kept for these posts
+        connection.execute("DELETE FROM post_tags WHERE url IN (SELECT url FROM batch)")
+        rows = connection.execute("SELECT url, tags FROM posts WHERE url IN (SELECT url FROM batch)").fetchall()
+        connection.executemany("INSERT OR IGNORE INTO post_tags (url, tag) VALUES (?, ?)",
+                               ((url, tag.strip().lower())
+                                for url, tags in rows if tags for tag in tags.split('|') if tag.strip()))
+        if current:
+            add_aggregates(connection, stored_posts(connection), before)
+        else:
+            rebuild_aggregates(connection)
+        connection.execute("DROP TABLE batch")
+    print(f"Upserted {len(df)} posts from {source} into {STORE_PATH}.")
+
+
+def aggregate_timezone():
+    # Local days depend on the time zone the aggregates were computed in, their tables on AGGREGATE_VERSION
+    return f"{time.tzname}/{time.timezone}/{time.altzone}/{AGGREGATE_VERSION}"
+
+
+def aggregates_are_current(connection):
+    row = connection.execute("SELECT value FROM aggregate_meta WHERE key = 'timezone'").fetchone()
+    return row is not None and row[0] == aggregate_timezone()
+
+
+def stored_posts(connection, batch_only=True):
+    # Every stored copy of the posts in the batch, once per source it belongs to and once for the whole store
+    where = " WHERE url IN (SELECT url FROM batch)" if batch_only else ""
+    columns = ['Title', 'Tags', 'Upvotes', 'Subreddit', 'Comments', 'Timestamp', 'Duration']
+    rows = connection.execute(
+        f"SELECT {', '.join(COLUMNS[c] for c in columns)}, source FROM posts JOIN "
+        f"(SELECT url, source FROM post_sources UNION ALL SELECT url, '' FROM posts{where}) USING (url){where}"
+    ).fetchall()
+    return pd.DataFrame(rows, columns=columns + ['source'])
+
+
+def post_aggregates(posts, sign=1):
+    # The rows, n, sum and squares each post adds to its cells, tag cells and month cells, and the sketch bucket it
+    # adds to, per metric
+    cells = cell_columns(posts)
+    cells['subreddit'] = cells['subreddit'].fillna('')
+    tags = (posts['Tags'].fillna('').str.lower().str.split('|').explode().str.strip())
+    tags = tags[tags != ''].reset_index().drop_duplicates()
+    months = pd.to_datetime(posts['Timestamp'], utc=True).dt.strftime('%Y-%m')
+    aggregates = {name: [] for name in AGGREGATE_KEYS}
+    for metric, column in METRICS.items():
+        values = pd.to_numeric(posts[metric], errors='coerce')
+        stats = pd.DataFrame({
+            'source': posts['source'].to_numpy(), 'metric': column, 'rows': sign,
+            'n': sign * values.notna().astype('int64').to_numpy(),
+            'sum': sign * values.fillna(0).astype('int64').to_numpy(),
+            'squares': sign * values.fillna(0).astype('int64').to_numpy() ** 2,
+        })
+        aggregates['cells'].append(pd.concat([stats, cells], axis=1))
+        tag_stats = stats.iloc[tags['index'].to_numpy()].reset_index(drop=True)
+        tag_stats['tag'] = tags['Tags'].to_numpy()
+        tag_stats['subreddit'] = cells['subreddit'].to_numpy()[tags['index'].to_numpy()]
+        aggregates['tag_cells'].append(tag_stats)
+        aggregates['month_cells'].append(stats.assign(month=months.to_numpy()))
+        valid = values.notna().to_numpy()
+        buckets = np.zeros(len(values), dtype=np.int64)
+        buckets[valid] = bucket_keys(values[valid].to_numpy(dtype=float))
+        sketches = pd.concat([stats[['source', 'metric']], cells], axis=1).assign(bucket=buckets, count=sign)
+        aggregates['cell_sketches'].append(sketches[valid])
+        tag_sketches = tag_stats[['source', 'metric', 'tag', 'subreddit']].assign(
+            bucket=buckets[tags['index'].to_numpy()], count=sign)
+        aggregates['tag_sketches'].append(tag_sketches[valid[tags['index'].to_numpy()]])
+    return {name: pd.concat(frames) for name, frames in aggregates.items()}
+
+
+def add_aggregates(connection, added, removed=None):
+    added = post_aggregates(added.reset_index(drop=True))
+    if removed is not None and len(removed) > 0:
+        removed = post_aggregates(removed.reset_index(drop=True), -1)
+        added = {name: pd.concat([added[name], removed[name]]) for name in added}
+    for name, keys in AGGREGATE_KEYS.items():
+        stats = AGGREGATE_STATS[name]
+        deltas = added[name].groupby(keys, as_index=False)[stats].sum()
+        # Unchanged posts cancel out, so only what the upsert changed is written
+        deltas = deltas[(deltas[stats] != 0).any(axis=1)]
+        connection.executemany(
+            f"INSERT INTO {name} ({', '.join(keys + stats)}) VALUES ({', '.join('?' * len(keys + stats))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+            f"{', '.join(f'{stat} = {stat} + excluded.{stat}' for stat in stats)}",
+            deltas.astype(object).itertuples(index=False, name=None))
+        connection.execute(f"DELETE FROM {name} WHERE {stats[0]} = 0")
+
+
+def rebuild_aggregates(connection):
+    print("Rebuilding the store's aggregates...")
+    for name in AGGREGATE_KEYS:
+        connection.execute(f"DELETE FROM {name}")
+    add_aggregates(connection, stored_posts(connection, batch_only=False))
+    connection.execute("INSERT OR REPLACE INTO aggregate_meta VALUES ('timezone', ?)", (aggregate_timezone(),))
+
+
+def read_aggregates(name, source=None, metric='Upvotes'):
+    # None when the aggregates were computed in another time zone
+    with connect() as connection:
+        if not aggregates_are_current(connection):
+            return None
+        return pd.read_sql_query(f"SELECT * FROM {name} WHERE source = ? AND metric = ?", connection,
+                                 params=(source or '', METRICS[metric]))
+
+
+def import_csv(filename):
+    if not filename.endswith(".csv"):
+        filename += ".csv"
+    upsert_posts(pd.read_csv(f"data/{filename}"), filename[:-len(".csv")])
+
+
+def where_clause(sources=None, subreddit=None, tag_query=None, since=None):
+    clauses, params = [], []
+    if sources:
+        clauses.append(f"url IN (SELECT url FROM post_sources WHERE source IN ({', '.join('?' * len(sources))}))")
+        params.extend(sources)
+    if subreddit:
+        clauses.append("subreddit = ? COLLATE NOCASE")
+        params.append(subreddit)
+    matches, match_params = [], []
+    if tag_query:
+        clause, tag_params = query_sql(tag_query)
+        matches.append(clause)
+        match_params.extend(tag_params)
+    if since is not None:
+        matches.append("timestamp > ?")
+        match_params.append(since.strftime('%Y-%m-%dT%H:%M:%S+00:00'))
+    if matches:
+        # Keep every stored copy of a matching post (same title, subreddit and author) so the loader's dedupe
+        # picks the same row it would pick from the full dataset
+        clauses.append(f"(title, subreddit, author) IN (SELECT title, subreddit, author FROM posts "
+                       f"WHERE {' AND '.join(clauses + matches)})")
+        params.extend(params + match_params)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def iter_posts(sources=None, subreddit=None, tag_query=None, since=None, columns=None, chunksize=100_000):
+    columns = [c for c in COLUMNS if columns is None or c in columns]
+    where, params = where_clause(sources, subreddit, tag_query, since)
+    with connect() as connection:
+        cursor = connection.execute(f"SELECT {', '.join(COLUMNS[c] for c in columns)} FROM posts{where} ORDER BY rowid", params)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=columns).fillna(np.nan).infer_objects()
+
+
+def query_posts(sources=None, subreddit=None, tag_query=None, since=None, columns=None):
+    chunks = list(iter_posts(sources, subreddit, tag_query, since, columns, chunksize=1_000_000))
+    if not chunks:
+        return pd.DataFrame(columns=[c for c in COLUMNS if columns is None or c in columns])
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def latest_timestamp(sources=None, subreddit=None, tag_query=None):
+    where, params = where_clause(sources, subreddit, tag_query)
+    with connect() as connection:
+        latest = connection.execute(f"SELECT MAX(timestamp) FROM posts{where}", params).fetchone()[0]
+    return pd.Timestamp(latest) if latest else None
+
+
+def unsettled_posts(since, sources=None, subreddit=None):
+    # Every copy of the posts the loader merges (several copies or a missing title, subreddit or author) or that
+    # has a copy after since
+    where, params = where_clause(sources, subreddit)
+    columns = ['Title', 'Tags', 'Upvotes', 'Subreddit', 'Comments', 'Timestamp', 'Duration', 'Author']
+    with connect() as connection:
+        rows = connection.execute(
+            f"SELECT {', '.join(COLUMNS[c] for c in columns)} FROM posts{where}{' AND' if where else ' WHERE'} "
+            f"(title IS NULL OR subreddit IS NULL OR author IS NULL OR (title, subreddit, author) IN "
+            f"(SELECT title, subreddit, author FROM posts{where} GROUP BY title, subreddit, author "
+            f"HAVING COUNT(*) > 1 OR MAX(timestamp) > ?))",
+            params + params + [since.strftime('%Y-%m-%dT%H:%M:%S+00:00')]).fetchall()
+    return pd.DataFrame(rows, columns=columns)
+
+
+def counts_until(until, sources=None, subreddit=None, tag_query=None):
+    # Posts whose every copy is at or before until, counted once per post
+    where, params = where_clause(sources, subreddit, tag_query)
+    with connect() as connection:
+        rows = connection.execute(f"SELECT subreddit, COUNT(*) FROM (SELECT subreddit FROM posts{where} "
+                                  f"GROUP BY title, subreddit, author HAVING MAX(timestamp) <= ?) GROUP BY subreddit",
+                                  params + [until.strftime('%Y-%m-%dT%H:%M:%S+00:00')])
+        return dict(rows.fetchall())
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+import pandas as pd
+from rtpa.memo import frame_memo
+
+QUERY_TOKENS = re.compile(r'("[^"]*"|\(|\)|\band\b|\bor\b|\bnot\b)', re.IGNORECASE)
+
+
+class TagIndex:
+    # Sorted post positions for every exact tag, built on first use
+    def __init__(self, tags):
+        self.tags = tags
+        self.size = len(tags)
+        self.names = None
+
+    def build(self):
+        if self.names is not None:
+            return
+        # Split each distinct tag string once, then expand the (string, tag) pairs to the posts using that string
+        tags = pd.Series(self.tags)
+        if isinstance(tags.dtype, pd.CategoricalDtype):
+            # Compact frames already hold integer codes; keep the categories the posts use, in the same order
+            codes = tags.cat.codes.to_numpy().astype(np.int64)
+            valid = codes >= 0
+            codes[valid], used = pd.factorize(codes[valid])
+            uniques = tags.cat.categories.to_numpy(dtype=object)[used]
+        else:
+            codes, uniques = pd.factorize(tags.to_numpy(dtype=object), use_na_sentinel=True)
+        split = pd.Series(uniques, dtype=object).str.split('|').explode().str.strip().str.lower()
+        split = split[split.notna() & (split != '')]
+        tag_codes, names = pd.factorize(split)
+        pairs = np.unique(np.stack([split.index.to_numpy(), tag_codes]), axis=1)
+        valid = codes >= 0
+        order = np.flatnonzero(valid)[np.argsort(codes[valid], kind='stable')]
+        per_unique = np.bincount(codes[valid], minlength=len(uniques))
+        starts = np.concatenate([[0], np.cumsum(per_unique)[:-1]])
+        lengths = per_unique[pairs[0]]
+        offsets = np.repeat(starts[pairs[0]] - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        positions = order[offsets]
+        post_tags = np.repeat(pairs[1], lengths)
+        sort = np.lexsort((positions, post_tags))
+        self.positions_by_tag = positions[sort].astype(np.int32)
+        counts = np.bincount(post_tags, minlength=len(names))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.names = pd.Index(names)
+        self.tags = None
+
+    def positions(self, tag):
+        self.build()
+        i = self.names.get_indexer([tag.strip().lower()])[0]
+        if i < 0:
+            return np.empty(0, dtype=np.int32)
+        return self.positions_by_tag[self.offsets[i]:self.offsets[i + 1]]
+
+    def mask(self, tag):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.positions(tag)] = True
+        return mask
+
+    def postings(self):
+        # Every (post position, tag code) pair, grouped by tag
+        self.build()
+        return self.positions_by_tag, np.repeat(np.arange(len(self.names)), np.diff(self.offsets))
+
+    def counts(self):
+        self.build()
+        counts = pd.Series(np.diff(self.offsets), index=self.names, name='count')
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def query(self, expression):
+        return evaluate(parse_query(expression), self.mask, np.logical_and, np.logical_or, np.logical_not)
+
+
+def tag_index(df):
+    memo = frame_memo(df)
+    if 'tags' not in memo:
+        memo['tags'] = TagIndex(df['Tags'])
+    return memo['tags']
+
+
+def parse_query(expression):
+    # "f4m and (comfort or asmr) and not rough"; not binds tightest, then and, then or. A quoted tag such as
+    # "rock and roll" is matched as it is.
+    tokens = [token.strip().lower() for token in QUERY_TOKENS.split(expression) if token.strip()]
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == 'or':
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() == 'and':
+            take()
+            node = ('and', node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == 'not':
+            take()
+            return ('not', parse_not())
+        if peek() == '(':
+            take()
+            node = parse_or()
+            if take() != ')':
+                raise ValueError(f"Missing closing parenthesis in tag filter '{expression}'.")
+            return node
+        if peek() is None or peek() in ('and', 'or', ')'):
+            raise ValueError(f"Expected a tag in tag filter '{expression}'.")
+        tag = take()
+        return ('tag', tag[1:-1].strip() if tag.startswith('"') else tag)
+
+    try:
+        node = parse_or()
+    except IndexError:
+        raise ValueError(f"Missing closing parenthesis in tag filter '{expression}'.")
+    if peek() is not None:
+        raise ValueError(f"Unexpected '{peek()}' in tag filter '{expression}'.")
+    return node
+
+
+def evaluate(node, leaf, and_, or_, not_):
+    if node[0] == 'tag':
+        return leaf(node[1])
+    if node[0] == 'not':
+        return not_(evaluate(node[1], leaf, and_, or_, not_))
+    return (and_ if node[0] == 'and' else or_)(evaluate(node[1], leaf, and_, or_, not_),
+                                               evaluate(node[2], leaf, and_, or_, not_))
+
+
+def literal_filter(filter_tag):
+    # A filter also matches the tag spelled exactly like it, so tags such as "rock and roll" or "(m4f)" match
+    # without quotes
+    filter_tag = filter_tag.strip()
+    if '"' in filter_tag:
+        return f"({filter_tag})"
+    try:
+        node = parse_query(filter_tag)
+    except ValueError:
+        return f'"{filter_tag}"'
+    return f"({filter_tag})" if node == ('tag', filter_tag.lower()) else f'("{filter_tag}" or ({filter_tag}))'
+
+
+def combine_filters(filter_tags):
+    # Comma separated filters must all match
+    return ' and '.join(literal_filter(filter_tag) for filter_tag in filter_tags if filter_tag.strip()) or None
+
+
+def query_tags(tags, filter_tags):
+    expression = combine_filters(filter_tags)
+    if expression is None:
+        return np.ones(len(tags), dtype=bool)
+    return TagIndex(tags).query(expression)
+
+
+def query_sql(expression):
+    def leaf(tag):
+        return "url IN (SELECT url FROM post_tags WHERE tag = ?)", [tag]
+
+    def combine(operator):
+        return lambda a, b: (f"({a[0]} {operator} {b[0]})", a[1] + b[1])
+
+    return evaluate(parse_query(expression), leaf, combine('AND'), combine('OR'),
+                    lambda a: (f"NOT {a[0]}", a[1]))
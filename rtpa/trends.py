@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from rtpa.stats import sufficient_stats, value_shift, welch_one_vs_rest
+from rtpa.tags import tag_index
+
+
+def monthly_tag_stats(df, metrics, tags, shift):
+    # Sufficient statistics of every post and of every given tag's posts, per local calendar month, as
+    # (stat, month, metric) and (stat, month, tag, metric) arrays
+    values = df[list(metrics)].to_numpy(dtype=float)
+    # Months without posts still take up a step of the window
+    timestamps = df['Timestamp_Local'] if 'Timestamp_Local' in df.columns \
+        else pd.to_datetime(df['Timestamp'], utc=True)
+    month_numbers = (timestamps.dt.year * 12 + timestamps.dt.month - 1).to_numpy(dtype=float)
+    first = np.nanmin(month_numbers)
+    month_codes = np.where(np.isnan(month_numbers), -1, month_numbers - first).astype(int)
+    months = pd.period_range(pd.Period(year=int(first) // 12, month=int(first) % 12 + 1, freq='M'),
+                             periods=month_codes.max() + 1, freq='M')
+    index = tag_index(df)
+    positions, tag_codes = index.postings()
+    columns = np.full(len(index.names), -1)
+    columns[index.names.get_indexer(tags)] = np.arange(len(tags))
+    tag_columns = columns[tag_codes]
+    used = (tag_columns >= 0) & (month_codes[positions] >= 0)
+    cell_codes = np.where(used, month_codes[positions] * len(tags) + tag_columns, -1)
+    totals = sufficient_stats(values, month_codes, len(months), shift)
+    cells = sufficient_stats(values[positions], cell_codes, len(months) * len(tags), shift)
+    return months, totals, cells.reshape(4, len(months), len(tags), len(metrics))
+
+
+def tag_trends(df, metrics, confidence_level, tags, window_months=6):
+    # One-vs-rest effect of each tag over a window of window_months months, stepped monthly. The window's
+    # statistics are updated in place: the entering month is added and the leaving month subtracted.
+    values = df[list(metrics)].to_numpy(dtype=float)
+    shift = value_shift(values)
+    months, totals, cells = monthly_tag_stats(df, metrics, tags, shift)
+    window_totals = np.zeros(totals.shape[::2])
+    window_cells = np.zeros(cells.shape[:1] + cells.shape[2:])
+    ends, results = [], []
+    for month in range(len(months)):
+        window_totals += totals[:, month]
+        window_cells += cells[:, month]
+        if month >= window_months:
+            window_totals -= totals[:, month - window_months]
+            window_cells -= cells[:, month - window_months]
+        if month >= window_months - 1:
+            ends.append(months[month])
+            results.append(welch_one_vs_rest(window_cells, window_totals, confidence_level))
+    # (window, tag, metric) arrays of every welch statistic
+    return ends, tuple(np.stack(stat) for stat in zip(*results)) if results else None
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from scipy import stats as scipy_stats
+from rtpa.authors import author_vs_peers, peer_frame
+from rtpa.loader import add_time_columns, dedupe_posts
+from tests.test_store import posts
+
+
+def test_author_is_compared_with_the_peers_in_each_cell():
+    df = add_time_columns(dedupe_posts(posts(600)))
+    author = df['Author'].value_counts().index[0]
+    peers_df, is_author = peer_frame(df, author.upper(), 5)
+    assert is_author.sum() == (df['Author'] == author).sum()
+    assert peers_df['Author'].nunique() == 6
+
+    values = peers_df[['Upvotes', 'Comments']].to_numpy(dtype=float)
+    cells = [(peers_df['Day_Local'] == day).to_numpy() for day in range(7)]
+    diff, low, high, p, t, rows1, rows2 = author_vs_peers(values, is_author, cells, 0.95)
+    for i, cell in enumerate(cells):
+        assert rows1[i, 0] == (cell & is_author).sum() and rows2[i, 0] == (cell & ~is_author).sum()
+        for j in range(values.shape[1]):
+            x = values[:, j]
+            expected = scipy_stats.ttest_ind(x[cell & is_author], x[cell & ~is_author], equal_var=False)
+            assert diff[i, j] == pytest.approx(x[cell & is_author].mean() - x[cell & ~is_author].mean())
+            assert p[i, j] == pytest.approx(expected.pvalue, rel=1e-7)
@@ -0,0 +1,29 @@
+from itertools import combinations_with_replacement
+import numpy as np
+import pandas as pd
+from rtpa.cooccurrence import tag_pair_breakdown
+
+
+def test_pairs_match_the_posts_with_both_tags():
+    rng = np.random.default_rng(0)
+    vocab = np.array(["f4m", "asmr", "comfort", "rough", "m4f", "whispers"])
+    tags = ['|'.join(rng.choice(vocab, rng.integers(0, 4), replace=False)) or None for _ in range(400)]
+    df = pd.DataFrame({'Tags': tags, 'Upvotes': rng.poisson(40, 400).astype(float)})
+    df.loc[::9, 'Upvotes'] = np.nan
+
+    names, first, second, (mean_diff, _, _, _, _, n_with, _) = tag_pair_breakdown(df, ['Upvotes'], 0.95, 20)
+    sets = [set(t.split('|')) if t else set() for t in tags]
+    expected = {}
+    for a, b in combinations_with_replacement(sorted(names), 2):
+        both = np.array([a in s and b in s for s in sets])
+        if both.sum() >= 20:
+            expected[(a, b)] = both
+    found = {tuple(sorted([names[i], names[j]])): k for k, (i, j) in enumerate(zip(first, second))}
+    assert found.keys() == expected.keys()
+    upvotes = df['Upvotes'].to_numpy()
+    for pair, both in expected.items():
+        k = found[pair]
+        assert n_with[k, 0] == both.sum()
+        assert np.isclose(mean_diff[k, 0], np.nanmean(upvotes[both]) - np.nanmean(upvotes[~both]))
+    # The bar graph and the heatmap of a run share one breakdown
+    assert tag_pair_breakdown(df, ['Upvotes'], 0.95, 20) is tag_pair_breakdown(df, ['Upvotes'], 0.95, 20)
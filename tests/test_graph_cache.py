@@ -0,0 +1,29 @@
+import os
+from rtpa.graphing import utils
+from rtpa.graphing.utils import GRAPH_CACHE_DIR, cached_graph
+
+
+def test_unchanged_graphs_are_not_drawn_or_placed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'STYLE_DIGEST', 'style')
+    drawn = []
+
+    def draw(label):
+        def write(path):
+            drawn.append(label)
+            with open(path, 'w') as f:
+                f.write(label)
+        return write
+
+    filename = str(tmp_path / "graph")
+    path = cached_graph(filename, ('bar', [1, 2]), draw('first'))
+    inode = os.stat(path).st_ino
+    assert cached_graph(filename, ('bar', [1, 2]), draw('again')) == path
+    assert os.stat(path).st_ino == inode
+
+    cached_graph(filename, ('bar', [3]), draw('second'))
+    cached_graph(filename, ('bar', [1, 2]), draw('back'))
+    assert drawn == ['first', 'second']
+    assert open(path).read() == 'first'
+    # The output shares the cached render's file instead of holding a second copy
+    assert os.stat(path).st_nlink == 2
+    assert not os.path.exists(os.path.join(tmp_path, GRAPH_CACHE_DIR, 'manifest.lock'))
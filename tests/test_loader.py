@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+from rtpa.loader import (DEDUPE_KEY, add_time_columns, dedupe_posts, filter_df, load_df, partition_manifest,
+                         read_dataset, stream_dataset, tag_filter_mask)
+from rtpa.tags import tag_index
+from tests.test_store import posts
+
+
+def test_streaming_matches_a_full_groupby(tmp_path, monkeypatch):
+    # Later chunks repeat retained posts with more upvotes under tags that miss the filter
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    first = posts(200)
+    repeats = first.iloc[::3].assign(Upvotes=lambda d: d['Upvotes'] + 1000, Comments=lambda d: d['Comments'] + 100,
+                                     Tags="rough")
+    pd.concat([first, repeats]).to_csv("data/posts.csv", index=False)
+
+    streamed, _, _ = stream_dataset(["posts.csv"], filter_tags=["asmr"], chunksize=32)
+    expected = dedupe_posts(add_time_columns(pd.read_csv("data/posts.csv")))
+    expected = expected[tag_filter_mask(expected['Tags'], ["asmr"])]
+
+    columns = DEDUPE_KEY + ['Tags', 'Upvotes', 'Comments', 'Timestamp']
+    assert (streamed['Upvotes'] >= 1000).any()
+    pd.testing.assert_frame_equal(streamed[columns].sort_values(DEDUPE_KEY).reset_index(drop=True),
+                                  expected[columns].sort_values(DEDUPE_KEY).reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_unpartitioned_csv_is_partitioned_on_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    posts(300).to_csv("data/posts.csv", index=False)
+    assert partition_manifest("posts.csv") is None
+
+    df = load_df(["posts"], "gonewildaudio", ["asmr"], 3)
+    assert partition_manifest("posts.csv") is not None
+    expected = filter_df(read_dataset(["posts"]), "gonewildaudio", ["asmr"], 3)
+    pd.testing.assert_frame_equal(df[expected.columns].reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+def test_compact_tags_index_the_same_tags():
+    df = posts(300)
+    df.loc[df.index[::7], 'Tags'] = None
+    compact = tag_index(df.assign(Tags=df['Tags'].astype('category')).iloc[:250])
+    plain = tag_index(df.iloc[:250].copy())
+    compact.build()
+    plain.build()
+    assert list(compact.names) == list(plain.names)
+    for tag in plain.names:
+        assert (compact.positions(tag) == plain.positions(tag)).all()
+
+
+def test_compact_load_reports_peak_memory(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    posts(300).to_csv("data/posts.csv", index=False)
+
+    compact = load_df(["posts"], "gonewildaudio", ["asmr"], 3, compact=True)
+    assert "Peak memory while loading" in capsys.readouterr().out
+    expected = load_df(["posts"], "gonewildaudio", ["asmr"], 3)
+    pd.testing.assert_frame_equal(compact[expected.columns], expected, check_dtype=False, check_categorical=False)
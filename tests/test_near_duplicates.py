@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from rtpa.near_duplicates import lsh_bands, minhash_signatures, near_duplicate_clusters, normalize_titles
+
+BASE = "whispering you to sleep after a long day at work"
+
+
+def test_links_pair_behind_bucket_head():
+    # The first title shares its LSH buckets with the other two but is similar to neither; only the other two are
+    titles = [f"gentle comfort {BASE}", BASE, f"{BASE} rainy"]
+    signatures = minhash_signatures(list(normalize_titles(titles)))
+    agreement = (signatures[:, None] == signatures[None]).mean(axis=2)
+    bands, rows = lsh_bands(0.8)
+    shared = (signatures[:, None] == signatures[None]).reshape(3, 3, bands, rows).all(axis=3)
+    assert agreement[1, 2] >= 0.8 and agreement[0, 1] < 0.8 and agreement[0, 2] < 0.8
+    assert (shared[0, 1] & shared[0, 2])[shared[1, 2]].all()
+    labels = near_duplicate_clusters(titles, ["amy"] * 3, 0.8)
+    assert labels[1] == labels[2] != labels[0]
+
+
+def test_reposts_cluster_per_author():
+    titles = [f"[F4M] {BASE} [ASMR]", f"{BASE.title()}!!", f"{BASE} (repost) [comfort]",
+              "The shy librarian helps you find a book", f"[F4M] {BASE}"]
+    authors = ["amy", "amy", "amy", "amy", "bob"]
+    labels = near_duplicate_clusters(titles, authors, 0.9)
+    assert labels[0] == labels[1] == labels[2]
+    assert len({labels[0], labels[3], labels[4]}) == 3
+
+
+def test_titles_of_only_tags_are_kept_apart():
+    labels = near_duplicate_clusters(["[F4M] [ASMR]", "[M4F] [ASMR]", "[F4M] [ASMR]"], ["amy"] * 3, 0.9)
+    assert labels[0] == labels[2] != labels[1]
+
+
+@pytest.mark.parametrize("threshold, expected", [
+    (0.95, [0, 1, 2, 3, 4, 5, 6]),
+    (0.8, [0, 0, 1, 2, 3, 4, 5]),
+    (0.5, [0, 0, 0, 1, 1, 2, 3]),
+])
+def test_lower_thresholds_merge_more(threshold, expected):
+    titles = [BASE, f"{BASE} again", f"gentle comfort {BASE}", "cuddling with you by the fire on a cold evening",
+              "cuddling with you by the fire on a cold night", "the shy librarian helps you find a book", None]
+    labels = near_duplicate_clusters(titles, ["amy"] * len(titles), threshold)
+    # Same partition as expected, whatever the label numbers
+    assert len(np.unique(labels)) == len(set(expected))
+    assert len(np.unique(np.stack([labels, expected]), axis=1).T) == len(set(expected))
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from rtpa.sketches import MIN_MAGNITUDE, RELATIVE_ACCURACY, Sketches, sketch_quantiles
+
+QUANTILES = [0.0, 0.1, 0.5, 0.9, 0.99, 1.0]
+
+
+def distributions():
+    rng = np.random.default_rng(0)
+    return {
+        'lognormal': rng.lognormal(3, 1.5, 5000),
+        'counts': rng.poisson(2, 5000).astype(float),
+        'signed': rng.normal(0, 50, 5000),
+        'heavy tail': rng.pareto(1.2, 5000) * 100,
+    }
+
+
+@pytest.mark.parametrize("name", list(distributions()))
+@pytest.mark.parametrize("quantile", QUANTILES)
+def test_quantiles_within_relative_accuracy(name, quantile):
+    values = distributions()[name]
+    codes = np.arange(len(values)) % 4
+    sketches = Sketches(values, codes, 4)
+    estimate, _ = sketch_quantiles(sketches.merged(np.arange(4), 4), sketches.values, quantile, 1.96)
+    for code in range(4):
+        # The sketch reports the order statistic at rank quantile * (n - 1), rounded down
+        exact = np.quantile(values[codes == code], quantile, method='lower')
+        tolerance = RELATIVE_ACCURACY * abs(exact) if abs(exact) >= MIN_MAGNITUDE else MIN_MAGNITUDE
+        assert abs(estimate[code] - exact) <= tolerance * (1 + 1e-9)
+
+
+def test_merged_groups_match_their_rows():
+    values = distributions()['lognormal']
+    codes = np.arange(len(values)) % 5
+    sketches = Sketches(values, codes, 5)
+    groups = np.array([0, 0, 1, -1, 1])
+    estimate, _ = sketch_quantiles(sketches.merged(groups, 2), sketches.values, 0.9, 1.96)
+    for group in range(2):
+        exact = np.quantile(values[np.isin(codes, np.flatnonzero(groups == group))], 0.9, method='lower')
+        assert abs(estimate[group] - exact) <= RELATIVE_ACCURACY * exact
+
+
+def test_missing_values_and_empty_groups():
+    values = np.array([1.0, np.nan, 3.0, 5.0])
+    sketches = Sketches(values, np.array([0, 0, 0, 0]), 2)
+    estimate, se = sketch_quantiles(sketches.merged(np.arange(2), 2), sketches.values, 0.5, 1.96)
+    assert abs(estimate[0] - 3.0) <= RELATIVE_ACCURACY * 3.0
+    assert np.isnan(estimate[1]) and np.isnan(se[1])
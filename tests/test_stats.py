@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from scipy import stats as scipy_stats
+from rtpa import stats
+from rtpa.stats import one_vs_rest, resampled_means, sufficient_stats, value_shift, welch_one_vs_rest
+
+
+def sample(n=2000, n_codes=6, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, n_codes, n)
+    values = np.column_stack([rng.lognormal(3 + codes / 4, 1.0), rng.poisson(5 + codes, n).astype(float)])
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return values, codes
+
+
+def scipy_welch(x, inside):
+    return scipy_stats.ttest_ind(x[inside], x[~inside], equal_var=False, nan_policy='omit')
+
+
+@pytest.mark.parametrize("confidence_level", [0.9, 0.95])
+def test_matches_scipy_welch(confidence_level):
+    values, codes = sample()
+    diff, low, high, p, t, rows1, rows2 = one_vs_rest(values, codes, 6, confidence_level)
+    for code in range(6):
+        inside = codes == code
+        for j in range(values.shape[1]):
+            x = values[:, j]
+            expected = scipy_welch(x, inside)
+            assert t[code, j] == pytest.approx(expected.statistic, rel=1e-9)
+            assert p[code, j] == pytest.approx(expected.pvalue, rel=1e-7)
+            assert diff[code, j] == pytest.approx(np.nanmean(x[inside]) - np.nanmean(x[~inside]), rel=1e-9)
+            # The CI uses the degrees of freedom of the smaller group
+            se = diff[code, j] / t[code, j]
+            half = scipy_stats.t.ppf((1 + confidence_level) / 2, min(inside.sum(), (~inside).sum()) - 1) * se
+            assert (low[code, j], high[code, j]) == pytest.approx((diff[code, j] - half, diff[code, j] + half), rel=1e-9)
+            assert (rows1[code, j], rows2[code, j]) == (inside.sum(), (~inside).sum())
+
+
+def test_membership_unions_match_scipy_welch():
+    values, codes = sample(seed=1)
+    membership = np.array([[1, 1, 0, 0, 0, 0], [0, 0, 1, 0, 1, 1]])
+    _, _, _, p, t, _, _ = one_vs_rest(values[:, 0], codes, 6, 0.95, membership=membership)
+    for row, union in enumerate(membership):
+        expected = scipy_welch(values[:, 0], np.isin(codes, np.flatnonzero(union)))
+        assert (t[row], p[row]) == pytest.approx((expected.statistic, expected.pvalue), rel=1e-7)
+
+
+def test_summed_cells_match_the_rows():
+    # Statistics summed from cells give the same test as the rows themselves, even far from zero
+    values, codes = sample(seed=2)
+    x = values[:, 0] + 1e6
+    cells = sufficient_stats(x, codes, 6, value_shift(x))
+    merged = np.stack([cells[:, :3].sum(axis=1), cells[:, 3:].sum(axis=1)], axis=1)
+    _, _, _, p, t, _, _ = welch_one_vs_rest(merged, cells.sum(axis=1), 0.95)
+    expected = scipy_welch(x, codes < 3)
+    assert (t[0], p[0]) == pytest.approx((expected.statistic, expected.pvalue), rel=1e-7)
+    assert t[1] == pytest.approx(-expected.statistic, rel=1e-7)
+
+
+def test_groups_too_small_for_a_test_are_nan():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    _, low, high, p, t, _, _ = one_vs_rest(values, np.array([0, 1, 1, 1, 1]), 2, 0.95)
+    assert np.isnan(p[0]) and np.isnan(t[0]) and np.isnan(low[0]) and np.isnan(high[0])
+
+
+def test_multinomial_bootstrap_matches_index_draws(monkeypatch):
+    # A large side with few distinct values is drawn as multinomial counts, with the same distribution of means
+    sample = np.random.default_rng(3).poisson(4, 5000).astype(float)
+    multinomial = resampled_means(sample, len(sample), np.random.default_rng(1), 4000)
+    monkeypatch.setattr(stats, 'MULTINOMIAL_COST', len(sample))
+    index = resampled_means(sample, len(sample), np.random.default_rng(1), 4000)
+    quantiles = [0.025, 0.5, 0.975]
+    assert np.quantile(multinomial, quantiles) == pytest.approx(np.quantile(index, quantiles), abs=0.006)
+    assert multinomial.std() == pytest.approx(sample.std() / np.sqrt(len(sample)), rel=0.05)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rtpa import store
+from rtpa.loader import load_df
+from rtpa.memo import frame_memo
+from rtpa.stats import frame_cube, stats_cube
+
+TAGS = ["f4m", "asmr", "comfort", "rough", "script fill", "m4f"]
+
+
+def posts(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Title': [f"Title {i}" for i in range(n)],
+        'Tags': ['|'.join(rng.choice(TAGS, rng.integers(1, 4), replace=False)) for _ in range(n)],
+        'Upvotes': rng.integers(0, 500, n),
+        'Subreddit': rng.choice(["gonewildaudio", "GWAScriptGuild", "pillowtalkaudio"], n),
+        'Comments': rng.integers(0, 60, n),
+        'Post URL': [f"www.reddit.com/r/x/{i}" for i in range(n)],
+        'Timestamp': (pd.Timestamp("2023-01-01", tz="UTC") +
+                      pd.to_timedelta(rng.integers(0, 400 * 86400, n), unit='s')).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'Author': [f"user{i}" for i in rng.integers(0, 40, n)],
+        'Audio Link': '',
+        'Duration': [f"{m}:{s:02d}" for m, s in zip(rng.integers(1, 60, n), rng.integers(0, 60, n))],
+        'Fills': rng.integers(0, 5, n),
+    })
+
+
+def aggregates(connection):
+    return {name: pd.read_sql_query(f"SELECT * FROM {name}", connection).sort_values(keys).reset_index(drop=True)
+            for name, keys in store.AGGREGATE_KEYS.items()}
+
+
+@pytest.fixture
+def updated_store(tmp_path, monkeypatch):
+    # A store whose aggregates were kept up to date through an update that changed upvotes and tags
+    monkeypatch.chdir(tmp_path)
+    first = posts()
+    store.upsert_posts(first, "a")
+    update = pd.concat([first.iloc[::2], posts(40, seed=1).assign(**{'Post URL': lambda d: d['Post URL'] + "/new"})])
+    update['Upvotes'] = update['Upvotes'] + 25
+    update.loc[update.index[::5], 'Tags'] = "newtag|asmr"
+    store.upsert_posts(update, "a")
+    return tmp_path
+
+
+def test_upsert_deltas_match_a_rebuild(updated_store):
+    with store.connect() as connection:
+        incremental = aggregates(connection)
+        store.rebuild_aggregates(connection)
+        rebuilt = aggregates(connection)
+    for name in store.AGGREGATE_KEYS:
+        pd.testing.assert_frame_equal(incremental[name], rebuilt[name])
+
+
+def test_seeded_cube_matches_the_loaded_rows(updated_store):
+    df = load_df(["store:a"], None, [], None, columns=['Duration', 'Comments'])
+    seeded = next(cube for key, cube in frame_memo(df).items() if key[0] == 'cube')
+    exact = frame_cube(df, seeded.metrics)
+    for dim, n_codes in [('hour', 24), ('day', 7), ('tag_count', 30), ('subreddit', len(exact.subreddits) + 1)]:
+        for a, b in zip(seeded.breakdown(dim, n_codes, 0.95), exact.breakdown(dim, n_codes, 0.95)):
+            np.testing.assert_allclose(a, b, rtol=1e-7, equal_nan=True)
+    a_order, b_order = np.argsort(seeded.tag_names), np.argsort(exact.tag_names)
+    assert list(seeded.tag_names[a_order]) == list(exact.tag_names[b_order])
+    for a, b in zip(seeded.tag_breakdown(0.95), exact.tag_breakdown(0.95)):
+        np.testing.assert_allclose(a[a_order], b[b_order], rtol=1e-7, equal_nan=True)
+
+
+def test_stale_aggregates_are_not_seeded(updated_store):
+    # Same posts, so the row counts still match, but with upvotes the aggregates never saw
+    with store.connect() as connection:
+        connection.execute(f"UPDATE posts SET {store.COLUMNS['Upvotes']} = {store.COLUMNS['Upvotes']} + 1")
+    df = load_df(["store:a"], None, [], None, columns=['Duration', 'Comments'])
+    assert not any(isinstance(key, tuple) and key[0] == 'cube' for key in frame_memo(df))
+
+
+@pytest.mark.parametrize("engine", ["median", "p90"])
+def test_seeded_cube_answers_quantiles_without_rows(updated_store, engine):
+    df = load_df(["store:a"], None, [], None, columns=['Duration', 'Comments'])
+    seeded = next(cube for key, cube in frame_memo(df).items() if key[0] == 'cube')
+    assert seeded.values is None and stats_cube(df, seeded.metrics, engine) is seeded
+    exact = frame_cube(df, seeded.metrics)
+    for dim, n_codes in [('hour', 24), ('day', 7), ('subreddit', len(exact.subreddits) + 1)]:
+        for a, b in zip(seeded.breakdown(dim, n_codes, 0.95, engine=engine),
+                        exact.breakdown(dim, n_codes, 0.95, engine=engine)):
+            np.testing.assert_allclose(a, b, rtol=1e-7, equal_nan=True)
+    a_order, b_order = np.argsort(seeded.tag_names), np.argsort(exact.tag_names)
+    for a, b in zip(seeded.tag_breakdown(0.95, engine), exact.tag_breakdown(0.95, engine)):
+        np.testing.assert_allclose(a[a_order], b[b_order], rtol=1e-7, equal_nan=True)
@@ -0,0 +1,78 @@
+import sqlite3
+import numpy as np
+import pytest
+from rtpa.tags import TagIndex, combine_filters, parse_query, query_sql, query_tags
+
+TAGS = ["f4m|asmr|comfort", "F4M|rough", "m4f|comfort", "f4m|Comfort|rough", None, "asmr", "f4m | asmr"]
+
+
+def test_not_binds_tighter_than_and_than_or():
+    assert parse_query("a or b and not c") == ('or', ('tag', 'a'), ('and', ('tag', 'b'), ('not', ('tag', 'c'))))
+    assert parse_query("not a and b") == ('and', ('not', ('tag', 'a')), ('tag', 'b'))
+    assert parse_query("a and b or c") == ('or', ('and', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))
+
+
+def test_parentheses_override_precedence():
+    assert parse_query("(a or b) and c") == ('and', ('or', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))
+    assert parse_query("not (a or b)") == ('not', ('or', ('tag', 'a'), ('tag', 'b')))
+    assert parse_query("A AND (B Or c)") == ('and', ('tag', 'a'), ('or', ('tag', 'b'), ('tag', 'c')))
+
+
+@pytest.mark.parametrize("expression", ["f4m and comfort or asmr", "f4m and (comfort or asmr)",
+                                        "not rough and f4m", "not (rough and f4m)", "f4m or m4f and not comfort"])
+def test_index_and_sql_match_the_tags(expression):
+    sets = [{tag.strip().lower() for tag in tags.split('|')} if tags else set() for tags in TAGS]
+
+    def expected(node, tags):
+        if node[0] == 'tag':
+            return node[1] in tags
+        if node[0] == 'not':
+            return not expected(node[1], tags)
+        left, right = expected(node[1], tags), expected(node[2], tags)
+        return left and right if node[0] == 'and' else left or right
+
+    wanted = np.array([expected(parse_query(expression), tags) for tags in sets])
+    assert (TagIndex(TAGS).query(expression) == wanted).all()
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE posts (url TEXT)")
+    connection.execute("CREATE TABLE post_tags (url TEXT, tag TEXT)")
+    connection.executemany("INSERT INTO posts VALUES (?)", [(str(i),) for i in range(len(sets))])
+    connection.executemany("INSERT INTO post_tags VALUES (?, ?)", [(str(i), tag) for i, tags in enumerate(sets)
+                                                                  for tag in tags])
+    clause, params = query_sql(expression)
+    urls = {int(url) for url, in connection.execute(f"SELECT url FROM posts WHERE {clause}", params)}
+    assert urls == set(np.flatnonzero(wanted))
+
+
+@pytest.mark.parametrize("expression", ["(f4m or asmr", "f4m and", "f4m asmr)", "and f4m"])
+def test_malformed_queries_raise(expression):
+    with pytest.raises(ValueError):
+        parse_query(expression)
+
+
+LITERAL_TAGS = ["rock and roll|f4m", "rock|roll", "(m4f)", "m4f", "kiss or kill", "kiss", "not rough"]
+
+
+def test_quoted_tags_are_matched_as_they_are():
+    assert parse_query('"rock and roll" or f4m') == ('or', ('tag', 'rock and roll'), ('tag', 'f4m'))
+    assert parse_query('not "(M4F)"') == ('not', ('tag', '(m4f)'))
+    assert list(TagIndex(LITERAL_TAGS).query('"rock and roll"')) == [True] + [False] * 6
+
+
+@pytest.mark.parametrize("filter_tag, expected", [
+    ("rock and roll", [0, 1]),
+    ("(m4f)", [2, 3]),
+    ("kiss or kill", [4, 5]),
+    ("not rough", [0, 1, 2, 3, 4, 5, 6]),
+    ("(m4f", []),
+])
+def test_filters_also_match_the_tag_spelled_like_them(filter_tag, expected):
+    assert list(np.flatnonzero(query_tags(LITERAL_TAGS, [filter_tag]))) == expected
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE posts (url TEXT)")
+    connection.execute("CREATE TABLE post_tags (url TEXT, tag TEXT)")
+    connection.executemany("INSERT INTO posts VALUES (?)", [(str(i),) for i in range(len(LITERAL_TAGS))])
+    connection.executemany("INSERT INTO post_tags VALUES (?, ?)", [(str(i), tag) for i, tags in enumerate(LITERAL_TAGS)
+                                                                  for tag in tags.split('|')])
+    clause, params = query_sql(combine_filters([filter_tag]))
+    assert sorted(int(url) for url, in connection.execute(f"SELECT url FROM posts WHERE {clause}", params)) == expected
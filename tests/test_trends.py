@@ -0,0 +1,16 @@
+import pandas as pd
+from rtpa.trends import monthly_tag_stats
+from tests.test_store import posts
+
+
+def test_months_follow_local_time():
+    # Late on the last day of a month in New York is already the next month in UTC
+    df = posts(2)
+    df['Timestamp'] = pd.to_datetime(["2024-01-31 22:00", "2024-02-15 12:00"]).tz_localize("America/New_York") \
+        .tz_convert("UTC")
+    df['Timestamp_Local'] = df['Timestamp'].dt.tz_convert("America/New_York")
+    df['Tags'] = "asmr"
+
+    months, totals, _ = monthly_tag_stats(df, ['Upvotes'], ["asmr"], 0)
+    assert list(months.astype(str)) == ["2024-01", "2024-02"]
+    assert list(totals[0, :, 0]) == [1, 1]